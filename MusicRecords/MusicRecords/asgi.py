@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MusicRecords.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once the apps are loaded.
+from music.subscriptions import websocket_application  # noqa: E402
+
+WEBSOCKET_PATHS = ('/graphql/', '/graphql')
+
+
+async def application(scope, receive, send):
+    # GraphQL subscriptions come in as WebSocket connections, everything
+    # else goes to Django.
+    if scope['type'] == 'websocket' and scope['path'] in WEBSOCKET_PATHS:
+        return await websocket_application(scope, receive, send)
+    return await django_application(scope, receive, send)
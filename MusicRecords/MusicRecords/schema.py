@@ -1,17 +1,43 @@
+import threading
+
 import graphene
-import music.schema
 
+_lock = threading.Lock()
+_schema = None
+
+
+def _build():
+    import music.schema
+
+    class Query(music.schema.Query, graphene.ObjectType):
+        # This class will inherit from multiple Queries
+        # as we begin to add more apps to our project
+        pass
+
+    class Mutation(music.schema.Mutation, graphene.ObjectType):
+        # This class will inherit from multiple Queries
+        # as we begin to add more apps to our project
+        pass
+
+    class Subscription(music.schema.Subscription, graphene.ObjectType):
+        pass
 
-class Query(music.schema.Query, graphene.ObjectType):
-    # This class will inherit from multiple Queries
-    # as we begin to add more apps to our project
-    pass
+    return graphene.Schema(query=Query, mutation=Mutation, subscription=Subscription)
 
 
-class Mutation(music.schema.Mutation, graphene.ObjectType):
-    # This class will inherit from multiple Queries
-    # as we begin to add more apps to our project
-    pass
+def get_schema():
+    """Схема проекта; строится один раз, при первом обращении"""
+    global _schema
+    if _schema is None:
+        with _lock:
+            if _schema is None:
+                _schema = _build()
+    return _schema
 
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+def __getattr__(name):
+    # ``MusicRecords.schema.schema`` (GRAPHENE['SCHEMA'], management commands)
+    # is built on first access, so importing the module costs nothing.
+    if name == 'schema':
+        return get_schema()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
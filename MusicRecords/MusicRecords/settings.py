@@ -9,6 +9,8 @@ https://docs.djangoproject.com/en/4.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
+import os
+
 import django
 from django.utils.encoding import force_str
 
@@ -46,7 +48,12 @@ INSTALLED_APPS = [
 ]
 
 GRAPHENE = {
-    'SCHEMA': 'MusicRecords.schema.schema'
+    'SCHEMA': 'MusicRecords.schema.schema',
+    # Hard cap for the page size of the performers/records/songs connections
+    'RELAY_CONNECTION_MAX_LIMIT': 100,
+    'MIDDLEWARE': ['music.tracing.TracingMiddleware'],
+    # WebSocket endpoint of the subscriptions, served by MusicRecords.asgi
+    'SUBSCRIPTION_PATH': '/graphql/',
 }
 
 
@@ -60,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'music.routers.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'MusicRecords.urls'
@@ -100,10 +108,111 @@ DATABASES = {
         'USER': 'postgres',
         'PASSWORD': '12345678',
         'HOST': 'localhost',
-        'PORT': '5432'
+        'PORT': '5432',
+        # Connections persist per worker thread and are checked before
+        # reuse. Django 4.1 has no pool of its own: the number of open
+        # connections is the number of WSGI threads (plus ASGI_THREADS
+        # under ASGI); put PgBouncer in front to cap it further.
+        'CONN_MAX_AGE': int(os.environ.get('MUSIC_DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Read replicas: comma separated hosts of streaming replicas of 'default'.
+# Tests read them through 'default' (TEST MIRROR).
+for number, host in enumerate(filter(None, os.environ.get('MUSIC_DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+
+MUSIC_DB_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica_')]
+# Seconds a client keeps reading from the primary after a write, and the
+# longest results read from a replica stay in the caches
+MUSIC_REPLICA_LAG = 5
+
+DATABASE_ROUTERS = ['music.routers.ReplicaRouter']
+
+# Caches
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Results of read-only GraphQL queries. Local memory is an LRU bounded by
+    # MAX_ENTRIES and TIMEOUT and only invalidates within one process; with
+    # several workers use a shared backend such as
+    # django.core.cache.backends.redis.RedisCache or FileBasedCache.
+    'graphql': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'graphql',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Version stamps of the entity cache, one per cached object or id list;
+    # shared between workers the same way as 'graphql'.
+    'entities': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'entities',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 200000,
+        },
+    },
+}
+
+MUSIC_QUERY_CACHE = 'graphql'
+
+# Automatic persisted queries are stored in this cache alias
+MUSIC_PERSISTED_QUERIES = 'graphql'
+
+# Parsed and validated GraphQL documents kept per worker process
+MUSIC_DOCUMENT_CACHE_SIZE = 1000
+
+# Performers, records, songs and their record/song id lists kept per
+# worker process for the single-object resolvers and DataLoaders
+MUSIC_ENTITY_CACHE_SIZE = 50000
+MUSIC_ENTITY_CACHE_TTL = 300
+MUSIC_ENTITY_STAMPS = 'entities'
+
+# Flat list pages and a performer's song/record lists are built from
+# values_list() tuples instead of model instances
+MUSIC_COMPACT_ROWS = True
+
+# Queries nested deeper or expected to return more objects are rejected
+# at validation, before any SQL runs
+MUSIC_QUERY_MAX_DEPTH = 12
+MUSIC_QUERY_MAX_COST = 50000
+# Table sizes the cost estimate assumes where the planner has no statistics
+# (SQLite, tables PostgreSQL has not analyzed yet)
+MUSIC_QUERY_ROW_ESTIMATES = {
+    'music_performer': 1000,
+    'music_records': 10000,
+    'music_songs': 100000,
+    'music_songs_records': 150000,
+}
+
+# Resolver and SQL timings in the GraphQL response "extensions"; exported
+# to Prometheus at /metrics/ for the listed client addresses either way
+MUSIC_TRACING_EXTENSIONS = False
+MUSIC_METRICS_ALLOWED_ADDRESSES = ('127.0.0.1', '::1')
+# A request repeating one SQL statement more often than this is an N+1
+MUSIC_N_PLUS_ONE_THRESHOLD = 10
+
+# Schema SDL and introspection result written by build_schema_cache
+MUSIC_SCHEMA_CACHE_DIR = BASE_DIR / 'schema_cache'
+# Time to the first response of a fresh worker, checked by profile_startup
+MUSIC_STARTUP_BUDGET_MS = 1500
+
+# Subscription events reach the subscribers of this process; with several
+# nodes use 'music.broker.RedisBackend' with {'url': ..., 'channel': ...}
+MUSIC_SUBSCRIPTION_BACKEND = 'music.broker.LocalBackend'
+MUSIC_SUBSCRIPTION_BACKEND_OPTIONS = {}
+# Objects waiting to be sent to one subscriber; older ones are dropped
+MUSIC_SUBSCRIPTION_QUEUE_SIZE = 100
+MUSIC_SUBSCRIPTION_MAX_OPERATIONS = 100
+MUSIC_SUBSCRIPTION_KEEPALIVE = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
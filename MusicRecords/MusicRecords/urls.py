@@ -13,12 +13,19 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
-from graphene_django.views import GraphQLView
+
+from music.views import AsyncGraphQLView, CachedGraphQLView, export_view, metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('graphql/', csrf_exempt(GraphQLView.as_view(graphiql=True))), ]
+    # GraphiQL is a development tool and stays off in production
+    path('graphql/', csrf_exempt(CachedGraphQLView.as_view(graphiql=settings.DEBUG))),
+    # Served without blocking a worker when the project runs under ASGI
+    path('graphql/async/', csrf_exempt(AsyncGraphQLView.as_view())),
+    path('metrics/', metrics_view),
+    path('export/<str:kind>/', export_view), ]
 
@@ -0,0 +1,42 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from music.tracing import trace_thread
+
+
+def database_sync_to_async(fn):
+    """sync_to_async для кода с ORM, выполняемого параллельно в пуле потоков
+
+    Django 4.1 оборачивает асинхронные методы ORM (``aget``, ``async for``) в
+    ``sync_to_async(thread_sensitive=True)``, то есть выполняет их по очереди в
+    одном потоке; здесь каждый вызов получает свой поток и своё соединение.
+    """
+
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            with trace_thread():
+                return fn(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class AsyncRootFieldMiddleware:
+    """Выполняет корневые поля в пуле потоков, чтобы соседние поля шли параллельно"""
+
+    def resolve(self, next, root, info, **args):
+        if info.parent_type in (info.schema.get_query_type(), info.schema.get_mutation_type()):
+            return database_sync_to_async(next)(root, info, **args)
+        return next(root, info, **args)
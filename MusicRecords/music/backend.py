@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from graphql import parse
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult, execute
+from graphql.validation import validate
+from graphql.validation.rules import specified_rules
+
+from music.complexity import QueryCostRule
+
+
+def _invalid(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """Бэкенд, который разбирает и проверяет каждый текст запроса один раз
+
+    Готовые документы хранятся в LRU на ``max_size`` записей, поэтому
+    повторный запрос сразу переходит к выполнению.
+    """
+
+    def __init__(self, max_size=1000, executor=None, validation_rules=None):
+        super().__init__(executor=executor)
+        self.max_size = max_size
+        self.validation_rules = validation_rules or specified_rules
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):
+            return super().document_from_string(schema, document_string)
+        key = (id(schema), document_string)
+        with self._lock:
+            document = self._documents.get(key)
+            if document is not None:
+                self._documents.move_to_end(key)
+                return document
+
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast, self.validation_rules)
+        if errors:
+            run = partial(_invalid, errors)
+        else:
+            run = partial(execute, schema, document_ast, **self.execute_params)
+        document = GraphQLDocument(schema, document_string, document_ast, run)
+
+        with self._lock:
+            self._documents[key] = document
+            if len(self._documents) > self.max_size:
+                self._documents.popitem(last=False)
+        return document
+
+
+document_backend = CachedDocumentBackend(
+    max_size=getattr(settings, 'MUSIC_DOCUMENT_CACHE_SIZE', 1000),
+    validation_rules=specified_rules + [QueryCostRule],
+)
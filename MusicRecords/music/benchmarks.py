@@ -0,0 +1,175 @@
+import random
+import time
+
+from django.db import connection, reset_queries
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from music.models import Performer, PerformerStats, Records, Songs
+from music.pagination import encode_cursor
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run_operation(schema, query, variables=None):
+    """Выполняет операцию через схему: (время в секундах, число SQL-запросов)"""
+    # The query log keeps only the last 9000 statements, after which the
+    # captured slice comes out empty.
+    reset_queries()
+    with CaptureQueriesContext(connection) as captured:
+        started = time.perf_counter()
+        result = schema.execute(query, variables=variables, context_value=RequestFactory().post('/graphql/'))
+        elapsed = time.perf_counter() - started
+    if result.errors:
+        raise RuntimeError(f'{query}: {result.errors}')
+    # Mutations report validation problems in their payload, not as errors.
+    for payload in (result.data or {}).values():
+        if isinstance(payload, dict) and payload.get('errors'):
+            raise RuntimeError(f'{query}: {payload["errors"]}')
+    return elapsed, len(captured.captured_queries)
+
+
+class Sample:
+    """Объекты каталога, на которых выполняются операции набора"""
+
+    def __init__(self, size=50, seed=0):
+        rng = random.Random(seed)
+        # The busiest performers are where slow resolvers show up first, so
+        # half of the sample is taken from the top of the distribution.
+        busiest = list(PerformerStats.objects.order_by('-song_count', 'performer_id')
+                       .values_list('performer_id', flat=True)[:size // 2])
+        performer_ids = self.pick(rng, Performer, size - len(busiest)) + busiest
+        self.performers = list(Performer.objects.filter(id__in=performer_ids).order_by('id').values_list('id', 'name'))
+        self.records = list(Records.objects.filter(id__in=self.pick(rng, Records, size)).order_by('id')
+                            .values_list('id', 'title', 'year', 'performer_id'))
+        self.songs = list(Songs.objects.filter(id__in=self.pick(rng, Songs, size)).order_by('id')
+                          .values_list('id', 'title', 'year', 'performer_id'))
+        self.genres = sorted({genre for genre in Performer.objects.filter(id__in=performer_ids)
+                             .values_list('genre', flat=True) if genre}) or ['rock']
+        if not (self.performers and self.records and self.songs):
+            raise ValueError('Каталог пуст, заполните его командой seed_catalog')
+
+    @staticmethod
+    def pick(rng, model, size):
+        ids = list(model.objects.values_list('id', flat=True))
+        return rng.sample(ids, min(size, len(ids)))
+
+    def cycle(self, values, i):
+        return values[i % len(values)]
+
+
+PERFORMER = '''
+query($id: Int) {
+  performer(id: $id) {
+    name genre songCount recordCount firstYear lastYear
+    recordsSet { title year trackCount }
+    songsSet { title year }
+  }
+}
+'''
+
+SONGS_PAGE = '''
+query($after: String) {
+  songs(first: 50, after: $after) {
+    edges { node { title year performer { name } records { title year } } }
+    pageInfo { endCursor hasNextPage }
+  }
+}
+'''
+
+RECORDS_BY_YEAR = '''
+query($year: Int) {
+  records(year: $year, first: 50) {
+    edges { node { title trackCount performer { name genre } songsSet { title } } }
+  }
+}
+'''
+
+PERFORMERS_BY_GENRE = '''
+query($genre: String) {
+  performers(genre: $genre, first: 50) {
+    edges { node { name songCount recordCount firstYear lastYear } }
+  }
+}
+'''
+
+SEARCH = '''
+query($query: String!) {
+  search(query: $query, first: 20) {
+    rank
+    item { ... on PerformerType { name } ... on RecordType { title } ... on SongType { title } }
+  }
+}
+'''
+
+CATALOG_STATS = '''
+{
+  genres: catalogStats(groupBy: GENRE) { genre performerCount recordCount songCount }
+  years: catalogStats(groupBy: YEAR) { year recordCount songCount }
+}
+'''
+
+UPDATE_PERFORMER = '''
+mutation($id: Int!, $name: String, $genre: String) {
+  updatePerformer(id: $id, params: {name: $name, genre: $genre}) { ok errors performer { name genre } }
+}
+'''
+
+CREATE_SONG = '''
+mutation($title: String, $performer: Int, $year: Int, $records: [RecordParams]) {
+  createSong(params: {title: $title, performer: $performer, year: $year, records: $records}) {
+    ok errors song { id title }
+  }
+}
+'''
+
+UPDATE_SONG = '''
+mutation($id: Int!, $title: String, $performer: Int, $year: Int) {
+  updateSong(id: $id, params: {title: $title, performer: $performer, year: $year}) { ok errors song { title } }
+}
+'''
+
+BULK_UPDATE_SONGS = '''
+mutation($params: [SongParams!]!) {
+  bulkUpdateSongs(params: $params) { ok errors }
+}
+'''
+
+BULK_SIZE = 20
+
+
+def _song_params(song, i, **changes):
+    id, title, year, performer = song
+    return dict({'id': id, 'title': f'{title} (benchmark {i})', 'year': year, 'performer': performer}, **changes)
+
+
+# name: (GraphQL operation, variables of the i-th run for a Sample)
+OPERATIONS = {
+    'performer': (PERFORMER, lambda sample, i: {'id': sample.cycle(sample.performers, i)[0]}),
+    'songs_page': (SONGS_PAGE, lambda sample, i: {
+        'after': encode_cursor(list(sample.cycle(sample.songs, i)[1::-1]))
+    }),
+    'records_by_year': (RECORDS_BY_YEAR, lambda sample, i: {'year': sample.cycle(sample.records, i)[2]}),
+    'performers_by_genre': (PERFORMERS_BY_GENRE, lambda sample, i: {'genre': sample.cycle(sample.genres, i)}),
+    'search': (SEARCH, lambda sample, i: {'query': sample.cycle(sample.songs, i)[1]}),
+    'catalog_stats': (CATALOG_STATS, lambda sample, i: {}),
+    'update_performer': (UPDATE_PERFORMER, lambda sample, i: {
+        'id': sample.cycle(sample.performers, i)[0], 'name': sample.cycle(sample.performers, i)[1],
+        'genre': sample.cycle(sample.genres, i),
+    }),
+    'create_song': (CREATE_SONG, lambda sample, i: {
+        'title': f'Benchmark song {i}', 'performer': sample.cycle(sample.records, i)[3],
+        'year': sample.cycle(sample.records, i)[2], 'records': [{'id': sample.cycle(sample.records, i)[0]}],
+    }),
+    'update_song': (UPDATE_SONG, lambda sample, i: _song_params(sample.cycle(sample.songs, i), i)),
+    'bulk_update_songs': (BULK_UPDATE_SONGS, lambda sample, i: {
+        'params': [_song_params(sample.cycle(sample.songs, i * BULK_SIZE + n), i)
+                   for n in range(min(BULK_SIZE, len(sample.songs)))],
+    }),
+}
@@ -0,0 +1,247 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from music import routers
+from music.async_execution import database_sync_to_async
+from music.models import Performer, Records, Songs
+
+logger = logging.getLogger(__name__)
+
+BACKEND = getattr(settings, 'MUSIC_SUBSCRIPTION_BACKEND', 'music.broker.LocalBackend')
+BACKEND_OPTIONS = getattr(settings, 'MUSIC_SUBSCRIPTION_BACKEND_OPTIONS', {})
+MAX_PENDING = getattr(settings, 'MUSIC_SUBSCRIPTION_QUEUE_SIZE', 100)
+
+# Event name -> model of the object it carries.
+EVENTS = {
+    'songCreated': Songs,
+    'songUpdated': Songs,
+    'recordUpdated': Records,
+    'performerUpdated': Performer,
+}
+
+# Filters a subscriber can index on, the most selective first.
+INDEXED_FILTERS = ('id', 'performer')
+
+
+def _value(obj, name):
+    return obj.pk if name == 'id' else getattr(obj, f'{name}_id', None)
+
+
+def _index_keys(obj):
+    # Subscribers without an indexed filter, and those on this object's id
+    # or performer.
+    return [None] + [(name, _value(obj, name)) for name in INDEXED_FILTERS]
+
+
+class Subscriber:
+    """Подписка на событие с фильтрами и ограниченным буфером неотправленных объектов
+
+    Новое состояние объекта, который ещё ждёт отправки, заменяет прежнее:
+    медленный клиент получает последнее состояние, а не всю историю. Если
+    разных объектов больше ``max_pending``, самые старые отбрасываются и
+    учитываются в ``dropped``.
+    """
+
+    def __init__(self, event, filters, loop, notify, max_pending=MAX_PENDING):
+        self.event = event
+        self.filters = {name: value for name, value in filters.items() if value is not None}
+        self.loop = loop
+        self.notify = notify
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self.dropped = 0
+
+    @property
+    def index_key(self):
+        for name in INDEXED_FILTERS:
+            if name in self.filters:
+                return name, self.filters[name]
+        return None
+
+    def matches(self, obj):
+        return all(_value(obj, name) == value for name, value in self.filters.items())
+
+    def push(self, obj):
+        self.pending.pop(obj.pk, None)
+        if len(self.pending) >= self.max_pending:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[obj.pk] = obj
+        self.notify()
+
+    def take(self):
+        """Накопленные объекты и число отброшенных; буфер очищается"""
+        objects, dropped = list(self.pending.values()), self.dropped
+        self.pending.clear()
+        self.dropped = 0
+        return objects, dropped
+
+
+class Broker:
+    """Раздаёт события подписчикам этого процесса; между узлами их переносит backend
+
+    Подписчики проиндексированы по событию и фильтру id или performer, так
+    что событие касается только подходящих подписчиков, а объект события
+    загружается один раз на процесс, сколько бы подписчиков его ни ждали.
+    Индекс меняется из любого потока, подписчики получают объекты в своём
+    цикле событий.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._index = {}
+        self._inbox = {}
+        self._routing = set()
+        self._lock = threading.Lock()
+        self._started = False
+
+    def subscribe(self, subscriber):
+        with self._lock:
+            if not self._started:
+                self.backend.start(self.deliver)
+                self._started = True
+            keys = self._index.setdefault(subscriber.loop, {}).setdefault(subscriber.event, {})
+            keys.setdefault(subscriber.index_key, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            events = self._index.get(subscriber.loop, {})
+            keys = events.get(subscriber.event, {})
+            subscribers = keys.get(subscriber.index_key, set())
+            subscribers.discard(subscriber)
+            if not subscribers:
+                keys.pop(subscriber.index_key, None)
+            if not keys:
+                events.pop(subscriber.event, None)
+            if not events:
+                self._index.pop(subscriber.loop, None)
+
+    def publish(self, messages):
+        """Отправляет события ``[(событие, id объекта)]`` всем узлам"""
+        messages = [(event, id) for event, id in messages if event in EVENTS]
+        if messages:
+            self.backend.publish(messages)
+
+    def deliver(self, messages):
+        """Принимает события от backend в любом потоке и передаёт их циклам с подписчиками"""
+        # Each loop has at most one routing task; events arriving while it
+        # loads objects wait in the inbox and repeated ids merge there, so a
+        # burst of writes costs a few loads rather than one per event.
+        start = []
+        with self._lock:
+            for loop, events in self._index.items():
+                wanted = {(event, id) for event, id in messages if event in events}
+                if not wanted:
+                    continue
+                self._inbox.setdefault(loop, set()).update(wanted)
+                if loop not in self._routing:
+                    self._routing.add(loop)
+                    start.append(loop)
+        for loop in start:
+            loop.call_soon_threadsafe(lambda loop=loop: loop.create_task(self._route(loop)))
+
+    async def _route(self, loop):
+        try:
+            while True:
+                with self._lock:
+                    messages = self._inbox.pop(loop, None)
+                    if not messages:
+                        self._routing.discard(loop)
+                        return
+                wanted = {}
+                for event, id in messages:
+                    wanted.setdefault(event, set()).add(id)
+                try:
+                    objects = await database_sync_to_async(self._load)(wanted)
+                except Exception:
+                    # These events are lost for this node; later ones still go out.
+                    logger.exception('Не удалось загрузить объекты событий %s', sorted(wanted))
+                    continue
+                for event, found in objects.items():
+                    for obj in found:
+                        with self._lock:
+                            keys = self._index.get(loop, {}).get(event, {})
+                            candidates = [subscriber for key in _index_keys(obj) for subscriber in keys.get(key, ())]
+                        for subscriber in candidates:
+                            if subscriber.matches(obj):
+                                subscriber.push(obj)
+        except BaseException:
+            with self._lock:
+                self._routing.discard(loop)
+            raise
+
+    def _load(self, wanted):
+        # One query per model however many subscribers wait; subscribers
+        # only read the objects, so they share them. The objects have just
+        # been written, and neither a replica nor the entity cache, whose
+        # stamps may be local to another node, is sure to have them yet.
+        ids = {}
+        for event, event_ids in wanted.items():
+            ids.setdefault(EVENTS[event], set()).update(event_ids)
+        with routers.primary():
+            found = {model: model.objects.in_bulk(sorted(model_ids)) for model, model_ids in ids.items()}
+        return {event: [found[EVENTS[event]][id] for id in sorted(event_ids) if id in found[EVENTS[event]]]
+                for event, event_ids in wanted.items()}
+
+
+class LocalBackend:
+    """События остаются в процессе: один узел, разработка"""
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, messages):
+        deliver = getattr(self, '_deliver', None)
+        if deliver is not None:
+            deliver(messages)
+
+
+class RedisBackend:
+    """События идут через канал Redis Pub/Sub ко всем узлам, включая этот
+
+    Процессы без подписчиков только публикуют; слушающий поток запускается
+    при первой подписке.
+    """
+
+    def __init__(self, url='redis://localhost:6379/0', channel='music:events'):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('Для RedisBackend нужен пакет redis')
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def start(self, deliver):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        threading.Thread(target=self._listen, args=(pubsub, deliver), name='music-events', daemon=True).start()
+
+    def _listen(self, pubsub, deliver):
+        for message in pubsub.listen():
+            try:
+                deliver([tuple(item) for item in json.loads(message['data'])])
+            except Exception:
+                logger.exception('Не удалось разобрать события из %s', self.channel)
+
+    def publish(self, messages):
+        self.client.publish(self.channel, json.dumps(messages))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Брокер процесса с backend из MUSIC_SUBSCRIPTION_BACKEND"""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = Broker(import_string(BACKEND)(**BACKEND_OPTIONS))
+    return _broker
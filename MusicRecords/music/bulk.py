@@ -0,0 +1,347 @@
+from itertools import islice
+
+from django.utils import timezone
+
+from music.errors import empty_name, exist
+from music.models import Performer, Records, Songs
+from music.signals import bulk_changed
+
+CHUNK_SIZE = 1000
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def to_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def record_ids(params):
+    """id альбомов из параметров песни: RecordParams, словари или сами id"""
+    ids = []
+    for record in params.get('records') or []:
+        ids.append(record.get('id') if hasattr(record, 'get') else record)
+    return ids
+
+
+def existing_ids(model, ids):
+    found = set()
+    for chunk in chunked({id for id in ids if id is not None}):
+        found.update(model.objects.filter(id__in=chunk).values_list('id', flat=True))
+    return found
+
+
+def _existing_titles(model, rows):
+    # Owners of the (performer_id, title) pairs that are already taken;
+    # filtering on both columns keeps the lookup on the (performer, title)
+    # index.
+    owners = {}
+    for chunk in chunked(rows):
+        performers = {performer for performer, _ in chunk}
+        titles = {title for _, title in chunk}
+        rows = model.objects.filter(performer_id__in=performers, title__in=titles)
+        owners.update(((performer, title), id) for performer, title, id in rows.values_list('performer_id', 'title', 'id'))
+    return owners
+
+
+def _taken(owners, key, id):
+    # Taken by another row; a row keeping its own name or title is fine.
+    return key in owners and (id is None or owners[key] != id)
+
+
+def validate_performers(params_list, ids=None):
+    """Ошибки создания исполнителей или, если переданы ``ids``, их изменения"""
+    ids = ids or [None] * len(params_list)
+    errors = []
+    names = [params.get('name') for params in params_list]
+    owners = {}
+    for chunk in chunked(name for name in names if name):
+        owners.update(Performer.objects.filter(name__in=chunk).values_list('name', 'id'))
+    for id, name in zip(ids, names):
+        if not name:
+            errors.append(f'Название {empty_name}')
+        elif _taken(owners, name, id):
+            errors.append(f'Исполнитель с таким названием {name} {exist}')
+        owners[name] = id
+    return errors
+
+
+def _validate_titled(model, params_list, duplicate, ids=None):
+    ids = ids or [None] * len(params_list)
+    errors = []
+    performer_ids = [to_id(params.get('performer')) for params in params_list]
+    performers = existing_ids(Performer, performer_ids)
+    owners = _existing_titles(
+        model, [(performer, params.get('title')) for performer, params in zip(performer_ids, params_list)
+                if performer in performers]
+    )
+    for id, performer, params in zip(ids, performer_ids, params_list):
+        if params.get('performer') is None:
+            errors.append('Исполнитель должен быть указан')
+        elif performer not in performers:
+            errors.append(f'Исполнитель с id {params.get("performer")} не существует')
+        elif _taken(owners, (performer, params.get('title')), id):
+            errors.append(duplicate(params))
+        owners[(performer, params.get('title'))] = id
+    return errors
+
+
+def validate_records(params_list, ids=None):
+    return _validate_titled(
+        Records, params_list,
+        lambda params: f'Альбом {params.get("title")} уже есть у исполнителя с id {params.get("performer")}',
+        ids,
+    )
+
+
+def validate_songs(params_list, ids=None):
+    errors = _validate_titled(
+        Songs, params_list,
+        lambda params: f'Песня {params.get("title")} уже есть у исполнителя с id {params.get("performer")}',
+        ids,
+    )
+    ids = [id for params in params_list for id in record_ids(params)]
+    found = existing_ids(Records, map(to_id, ids))
+    for id in ids:
+        if to_id(id) not in found:
+            errors.append(f'Альбом с id {id} не существует')
+    return errors
+
+
+def create_performers(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и создаёт исполнителей; при ошибках ничего не создаёт"""
+    errors = validate_performers(params_list)
+    if errors:
+        return [], errors
+    performers = Performer.objects.bulk_create(
+        [Performer(name=params.get('name'), genre=params.get('genre')) for params in params_list],
+        batch_size=batch_size,
+    )
+    bulk_changed.send(sender=Performer, objects=performers, created=True)
+    return performers, errors
+
+
+def create_records(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и создаёт альбомы; при ошибках ничего не создаёт"""
+    errors = validate_records(params_list)
+    if errors:
+        return [], errors
+    records = Records.objects.bulk_create(
+        [Records(title=params.get('title'), year=params.get('year'), performer_id=to_id(params.get('performer')))
+         for params in params_list],
+        batch_size=batch_size,
+    )
+    bulk_changed.send(sender=Records, objects=records, created=True)
+    return records, errors
+
+
+def create_songs(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и создаёт песни вместе со связями с альбомами; при ошибках ничего не создаёт"""
+    errors = validate_songs(params_list)
+    if errors:
+        return [], errors
+    songs = Songs.objects.bulk_create(
+        [Songs(title=params.get('title'), year=params.get('year'), performer_id=to_id(params.get('performer')))
+         for params in params_list],
+        batch_size=batch_size,
+    )
+    links = [
+        Songs.records.through(songs_id=song.id, records_id=records_id)
+        for song, params in zip(songs, params_list)
+        for records_id in {to_id(id) for id in record_ids(params)}
+    ]
+    Songs.records.through.objects.bulk_create(links, batch_size=batch_size)
+    bulk_changed.send(sender=Songs, objects=songs, created=True)
+    bulk_changed.send(sender=Songs.records.through, objects=links, created=True)
+    return songs, errors
+
+
+def _lock(model, params_list, missing):
+    # Rows are locked in id order, so two batches touching the same rows
+    # wait for each other instead of deadlocking.
+    ids = [to_id(params.get('id')) for params in params_list]
+    found = {}
+    for chunk in chunked(sorted({id for id in ids if id is not None})):
+        found.update(model.objects.select_for_update().order_by('id').in_bulk(chunk))
+    errors = []
+    seen = set()
+    for id, params in zip(ids, params_list):
+        if id not in found:
+            errors.append(missing(params.get('id')))
+        elif id in seen:
+            errors.append(f'id {id} указан несколько раз')
+        seen.add(id)
+    return ids, found, errors
+
+
+def _save(model, objects, fields, batch_size, previous):
+    # changes imports this module.
+    from music import changes
+
+    # bulk_update bypasses save(), so the version and auto_now are set here.
+    now = timezone.now()
+    versions = changes.bump(model, [(obj.pk, obj.version) for obj in objects])
+    for obj in objects:
+        obj.version = versions[obj.pk]
+        obj.updated_at = now
+    model.objects.bulk_update(objects, fields + ['version', 'updated_at'], batch_size=batch_size)
+    bulk_changed.send(sender=model, objects=objects, created=False, previous=previous)
+
+
+def update_performers(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и изменяет исполнителей по id; при ошибках ничего не меняет"""
+    ids, performers, errors = _lock(Performer, params_list, lambda id: f'Исполнителя с id {id} не существует')
+    errors.extend(f'Жанр {empty_name}' for params in params_list if not params.get('genre'))
+    errors.extend(validate_performers(params_list, ids))
+    if errors:
+        return [], errors
+    previous = {id: {'genre': performer.genre} for id, performer in performers.items()}
+    changed = []
+    for id, params in zip(ids, params_list):
+        performer = performers[id]
+        performer.name = params.get('name')
+        performer.genre = params.get('genre')
+        changed.append(performer)
+    _save(Performer, changed, ['name', 'genre'], batch_size, previous)
+    return changed, errors
+
+
+def update_records(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и изменяет альбомы по id; при ошибках ничего не меняет"""
+    ids, records, errors = _lock(Records, params_list, lambda id: f'Альбома с id {id} не существует')
+    errors.extend(validate_records(params_list, ids))
+    if errors:
+        return [], errors
+    previous = {id: {'performer_id': record.performer_id, 'year': record.year} for id, record in records.items()}
+    changed = []
+    for id, params in zip(ids, params_list):
+        record = records[id]
+        record.title = params.get('title')
+        record.year = params.get('year')
+        record.performer_id = to_id(params.get('performer'))
+        changed.append(record)
+    _save(Records, changed, ['title', 'year', 'performer'], batch_size, previous)
+    return changed, errors
+
+
+def update_songs(params_list, batch_size=CHUNK_SIZE):
+    """Проверяет и изменяет песни по id, заменяя их альбомы; при ошибках ничего не меняет"""
+    ids, songs, errors = _lock(Songs, params_list, lambda id: f'Песни с id {id} не существует')
+    errors.extend(validate_songs(params_list, ids))
+    if errors:
+        return [], errors
+    previous = {id: {'performer_id': song.performer_id, 'year': song.year} for id, song in songs.items()}
+    changed = []
+    for id, params in zip(ids, params_list):
+        song = songs[id]
+        song.title = params.get('title')
+        song.year = params.get('year')
+        song.performer_id = to_id(params.get('performer'))
+        changed.append(song)
+
+    through = Songs.records.through
+    wanted = {(id, to_id(record_id)) for id, params in zip(ids, params_list) for record_id in record_ids(params)}
+    removed = []
+    for chunk in chunked(ids):
+        for link in through.objects.filter(songs_id__in=chunk):
+            if (link.songs_id, link.records_id) in wanted:
+                wanted.discard((link.songs_id, link.records_id))
+            else:
+                removed.append(link)
+    for chunk in chunked(removed):
+        through.objects.filter(id__in=[link.id for link in chunk]).delete()
+    added = through.objects.bulk_create(
+        [through(songs_id=song_id, records_id=records_id) for song_id, records_id in sorted(wanted)],
+        batch_size=batch_size,
+    )
+
+    _save(Songs, changed, ['title', 'year', 'performer'], batch_size, previous)
+    bulk_changed.send(sender=through, objects=removed, created=False, deleted=True)
+    bulk_changed.send(sender=through, objects=added, created=True)
+    return changed, errors
+
+
+def _merge(model, field, other, groups, batch_size):
+    # ``field`` is the through column pointing at ``model``, ``other`` the
+    # one pointing at the other side of the link.
+    through = Songs.records.through
+    target = {}
+    for keep, duplicates in groups:
+        for duplicate in duplicates:
+            if duplicate != keep:
+                target[duplicate] = keep
+    ids = set(target) | set(target.values())
+    found = {}
+    for chunk in chunked(sorted(ids)):
+        found.update(model.objects.select_for_update().order_by('id').in_bulk(chunk))
+    # A plan written earlier may name rows deleted since; those are skipped.
+    target = {duplicate: keep for duplicate, keep in target.items() if duplicate in found and keep in found}
+    if not target:
+        return 0
+
+    links = []
+    for chunk in chunked(sorted(ids)):
+        links.extend(through.objects.filter(**{f'{field}__in': chunk}))
+    existing = {(getattr(link, field), getattr(link, other)) for link in links}
+    removed = [link for link in links if getattr(link, field) in target]
+    wanted = {(target[getattr(link, field)], getattr(link, other)) for link in removed} - existing
+    for chunk in chunked(removed):
+        through.objects.filter(id__in=[link.id for link in chunk]).delete()
+    added = through.objects.bulk_create(
+        [through(**{field: id, other: other_id}) for id, other_id in sorted(wanted)], batch_size=batch_size,
+    )
+    bulk_changed.send(sender=through, objects=removed, created=False, deleted=True)
+    bulk_changed.send(sender=through, objects=added, created=True)
+
+    # A kept row without a year takes it from a duplicate.
+    previous = {}
+    for duplicate, keep in sorted(target.items()):
+        obj = found[keep]
+        if obj.year is None and found[duplicate].year is not None:
+            previous.setdefault(keep, {'performer_id': obj.performer_id, 'year': obj.year})
+            obj.year = found[duplicate].year
+    if model is Songs:
+        # The kept songs' own record lists changed.
+        changed = {id: found[id] for id in set(target.values())}
+        _save(Songs, list(changed.values()), ['year'], batch_size,
+              {id: previous.get(id, {'performer_id': song.performer_id, 'year': song.year})
+               for id, song in changed.items()})
+    else:
+        if previous:
+            _save(Records, [found[id] for id in previous], ['year'], batch_size, previous)
+        # Songs of the duplicates now list the kept record instead.
+        for chunk in chunked(sorted({link.songs_id for link in removed})):
+            _save(Songs, list(Songs.objects.select_for_update().order_by('id').filter(id__in=chunk)), [],
+                  batch_size, None)
+
+    # Row by row, so stats, the change log and the caches see every delete.
+    for chunk in chunked(sorted(target)):
+        model.objects.filter(id__in=chunk).delete()
+    return len(target)
+
+
+def merge_records(groups, batch_size=CHUNK_SIZE):
+    """Сливает альбомы-дубликаты ``[(id оставляемого, [id дубликатов])]``
+
+    Песни дубликатов переходят к оставляемому альбому, дубликаты удаляются.
+    Возвращает число удалённых альбомов.
+    """
+    return _merge(Records, 'records_id', 'songs_id', groups, batch_size)
+
+
+def merge_songs(groups, batch_size=CHUNK_SIZE):
+    """Сливает песни-дубликаты ``[(id оставляемой, [id дубликатов])]``
+
+    Альбомы дубликатов добавляются оставляемой песне, дубликаты удаляются.
+    Возвращает число удалённых песен.
+    """
+    return _merge(Songs, 'songs_id', 'records_id', groups, batch_size)
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from graphql.language.printer import print_ast
+from graphql.language.visitor import TypeInfoVisitor, Visitor, visit
+from graphql.type.definition import GraphQLInterfaceType, GraphQLUnionType, get_named_type
+from graphql.utils.type_info import TypeInfo
+
+CACHE_ALIAS = getattr(settings, 'MUSIC_QUERY_CACHE', 'graphql')
+
+_lock = threading.Lock()
+stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def get_cache(alias=CACHE_ALIAS):
+    return caches[alias]
+
+
+def _count(name):
+    with _lock:
+        stats[name] += 1
+
+
+def _generation_key(label):
+    return f'music:generation:{label}'
+
+
+def get_generations(labels, alias=CACHE_ALIAS):
+    """Текущие поколения моделей; у модели без поколения начинается новая эпоха"""
+    cache = get_cache(alias)
+    keys = {label: _generation_key(label) for label in sorted(labels)}
+    found = cache.get_many(keys.values())
+    generations = {}
+    for label, key in keys.items():
+        if key not in found:
+            # Starting from a fresh value rather than 0 means an evicted
+            # generation can never revive entries cached under an old one.
+            cache.add(key, time.time_ns(), timeout=None)
+            found[key] = cache.get(key)
+        generations[label] = found[key]
+    return generations
+
+
+def bump_generation(label, alias=CACHE_ALIAS):
+    cache = get_cache(alias)
+    key = _generation_key(label)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+    if alias == CACHE_ALIAS:
+        _count('invalidations')
+
+
+# Fields served from other models than their type's own, such as summary
+# tables: {(type name, field name): model labels}.
+field_models = {}
+
+
+# Fields whose result changes without any model write, such as ones
+# depending on the current time: {(type name, field name)}.
+uncacheable_fields = set()
+
+
+def register_field_models(type_name, field_names, *models):
+    for field_name in field_names:
+        field_models.setdefault((type_name, field_name), set()).update(model._meta.label for model in models)
+
+
+class _ModelCollector(Visitor):
+    def __init__(self, schema, type_info):
+        self.schema = schema
+        self.type_info = type_info
+        self.labels = set()
+        self.cacheable = True
+
+    def enter_Field(self, node, *args):
+        named_type = get_named_type(self.type_info.get_type())
+        # A union field may return any of its members, whatever fragments
+        # the document selects on them.
+        if isinstance(named_type, (GraphQLUnionType, GraphQLInterfaceType)):
+            possible_types = self.schema.get_possible_types(named_type)
+        else:
+            possible_types = [named_type]
+        for possible_type in possible_types:
+            meta = getattr(getattr(possible_type, 'graphene_type', None), '_meta', None)
+            model = getattr(meta, 'model', None)
+            if model is not None:
+                self.labels.add(model._meta.label)
+        parent_type = self.type_info.get_parent_type()
+        if parent_type is not None:
+            self.labels.update(field_models.get((parent_type.name, node.name.value), ()))
+            if (parent_type.name, node.name.value) in uncacheable_fields:
+                self.cacheable = False
+
+
+def document_models(schema, document_ast):
+    """Метки моделей, объекты которых может вернуть документ, или None, если кешировать нельзя"""
+    type_info = TypeInfo(schema)
+    collector = _ModelCollector(schema, type_info)
+    visit(document_ast, TypeInfoVisitor(type_info, collector))
+    return collector.labels if collector.cacheable else None
+
+
+def make_key(schema, document, variables, operation_name):
+    """Ключ кеша для query-операции или None, если операцию кешировать нельзя"""
+    if document.get_operation_type(operation_name) != 'query':
+        return None
+    # Documents come from a cached backend and are reused across requests, so
+    # the normalized text and the model set are computed once per document.
+    signature = getattr(document, 'cache_signature', None)
+    if signature is None:
+        signature = (print_ast(document.document_ast), document_models(schema, document.document_ast))
+        document.cache_signature = signature
+    text, labels = signature
+    if labels is None:
+        return None
+    payload = json.dumps([text, variables or {}, operation_name, get_generations(labels)], sort_keys=True, default=str)
+    return 'music:query:' + hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_result(key):
+    value = get_cache().get(key)
+    _count('misses' if value is None else 'hits')
+    return value
+
+
+def set_result(key, value, timeout=DEFAULT_TIMEOUT):
+    get_cache().set(key, value, timeout)
@@ -0,0 +1,202 @@
+import threading
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from music.bulk import CHUNK_SIZE
+from music.models import ChangeLog, Performer, Records, Songs
+from music.signals import bulk_changed, invalidate
+
+ENTITIES = {Performer: 'performer', Records: 'record', Songs: 'song'}
+
+# Sent once the entries of a transaction have committed, with ``entries``
+# set to the ChangeLog rows; subscriptions turn them into events.
+committed = Signal()
+
+
+def _transaction_id(connection):
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_current()')
+        return cursor.fetchone()[0]
+
+
+def _horizon(connection):
+    if connection.vendor != 'postgresql':
+        # SQLite lets one writer in at a time, from its first write to the
+        # commit, so ids already follow commit order.
+        return None
+    # Every transaction below the snapshot's xmin has finished, so no entry
+    # can still appear behind a cursor that has only passed those.
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT txid_snapshot_xmin(txid_current_snapshot())')
+        return cursor.fetchone()[0]
+
+
+def visible(using=None):
+    """Записи журнала, за которые уже не встанет запись незавершённой транзакции"""
+    using = using or router.db_for_read(ChangeLog)
+    horizon = _horizon(connections[using])
+    entries = ChangeLog.objects.using(using)
+    return entries if horizon is None else entries.filter(transaction_id__lt=horizon)
+
+
+class _PendingChanges:
+    """Изменения одной транзакции: по одной записи на объект"""
+
+    def __init__(self):
+        self.entries = {}
+        # Versions given out in the transaction, {(model, id): version}
+        self.versions = {}
+        self.transaction_id = None
+
+    def add(self, entity, rows, action):
+        # Written inside the transaction, so the entries commit or roll back
+        # together with the data they describe.
+        if self.transaction_id is None:
+            self.transaction_id = _transaction_id(transaction.get_connection())
+        created, changed = [], []
+        for id, version in rows:
+            entry = self.entries.get((entity, id))
+            if entry is None:
+                entry = ChangeLog(entity=entity, object_id=id, action=action, version=version,
+                                  transaction_id=self.transaction_id)
+                self.entries[(entity, id)] = entry
+                created.append(entry)
+                continue
+            # A row created and then updated in one transaction is still new.
+            if entry.action == ChangeLog.CREATE and action == ChangeLog.UPDATE:
+                action = ChangeLog.CREATE
+            if (entry.action, entry.version) != (action, version):
+                entry.action, entry.version = action, version
+                changed.append(entry)
+        # Bulk writes and imports touch tens of thousands of rows; one
+        # statement for all of them would exceed the parameter limit.
+        ChangeLog.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+        ChangeLog.objects.bulk_update(changed, ['action', 'version'], batch_size=CHUNK_SIZE)
+        if created or changed:
+            invalidate(ChangeLog)
+
+    def __call__(self):
+        _local.pending = None
+        committed.send(sender=ChangeLog, entries=list(self.entries.values()))
+
+
+_local = threading.local()
+
+
+def _pending_changes():
+    connection = transaction.get_connection()
+    pending = getattr(_local, 'pending', None)
+    # A rollback drops the callback, and the entries with it.
+    if pending is None or not any(item[1] is pending for item in connection.run_on_commit):
+        pending = _PendingChanges()
+        _local.pending = pending
+        transaction.on_commit(pending)
+    return pending
+
+
+def log(model, rows, action):
+    """Записывает изменения строк ``[(id, version)]`` в транзакции, которая их изменила"""
+    rows = list(rows)
+    if not rows:
+        return
+    if not transaction.get_connection().in_atomic_block:
+        pending = _PendingChanges()
+        pending.add(ENTITIES[model], rows, action)
+        pending()
+        return
+    _pending_changes().add(ENTITIES[model], rows, action)
+
+
+def _versions():
+    # Outside a transaction every statement commits on its own and gets a
+    # fresh dict.
+    if not transaction.get_connection().in_atomic_block:
+        return {}
+    return _pending_changes().versions
+
+
+def bump(model, rows):
+    """Новые версии строк ``[(id, version)]``: не больше одного повышения на объект за транзакцию"""
+    versions = _versions()
+    return {id: versions.setdefault((model, id), version + 1) for id, version in rows}
+
+
+def touch_songs(song_ids):
+    """Поднимает версию песен, у которых изменился список альбомов"""
+    versions = _versions()
+    song_ids = [id for id in song_ids if (Songs, id) not in versions]
+    if not song_ids:
+        return
+    songs = Songs.objects.filter(pk__in=song_ids)
+    songs.update(version=F('version') + 1, updated_at=timezone.now())
+    rows = list(songs.values_list('id', 'version'))
+    versions.update(((Songs, id), version) for id, version in rows)
+    log(Songs, rows, ChangeLog.UPDATE)
+    invalidate(Songs)
+
+
+def touch_song(song):
+    versions = _versions()
+    if (Songs, song.pk) in versions:
+        song.version = versions[(Songs, song.pk)]
+        return
+    song.version += 1
+    versions[(Songs, song.pk)] = song.version
+    Songs.objects.filter(pk=song.pk).update(version=F('version') + 1, updated_at=timezone.now())
+    log(Songs, [(song.pk, song.version)], ChangeLog.UPDATE)
+
+
+@receiver(pre_save, sender=Performer)
+@receiver(pre_save, sender=Records)
+@receiver(pre_save, sender=Songs)
+def bump_saved(sender, instance, raw=False, **kwargs):
+    if not raw and not instance._state.adding:
+        instance.version = bump(sender, [(instance.pk, instance.version)])[instance.pk]
+
+
+@receiver(post_save, sender=Performer)
+@receiver(post_save, sender=Records)
+@receiver(post_save, sender=Songs)
+def log_saved(sender, instance, created, **kwargs):
+    log(sender, [(instance.pk, instance.version)], ChangeLog.CREATE if created else ChangeLog.UPDATE)
+
+
+@receiver(post_delete, sender=Performer)
+@receiver(post_delete, sender=Records)
+@receiver(post_delete, sender=Songs)
+def log_deleted(sender, instance, **kwargs):
+    log(sender, [(instance.pk, instance.version)], ChangeLog.DELETE)
+
+
+@receiver(pre_delete, sender=Records)
+def touch_record_songs(sender, instance, **kwargs):
+    # The record disappears from its songs without an m2m_changed signal.
+    touch_songs(list(Songs.records.through.objects.filter(records_id=instance.pk)
+                     .values_list('songs_id', flat=True)))
+
+
+@receiver(m2m_changed, sender=Songs.records.through)
+def log_song_records(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        touch_songs(list(instance.songs_set.values_list('id', flat=True)))
+    elif action == 'post_clear' and not reverse:
+        touch_song(instance)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        if reverse:
+            touch_songs(list(pk_set))
+        else:
+            touch_song(instance)
+
+
+@receiver(bulk_changed)
+def log_bulk(sender, objects=(), created=True, **kwargs):
+    # Bulk operations that change links send bulk_changed for the songs
+    # themselves as well, so the through rows need no entries of their own.
+    if sender in ENTITIES:
+        log(sender, [(obj.pk, obj.version) for obj in objects], ChangeLog.CREATE if created else ChangeLog.UPDATE)
@@ -0,0 +1,141 @@
+from operator import itemgetter
+
+from django.conf import settings
+from graphene.utils.str_converters import to_snake_case
+
+from music.models import Performer, Records, Songs
+from music.optimizer import collect_fields, model_fields
+
+ENABLED = getattr(settings, 'MUSIC_COMPACT_ROWS', True)
+
+SongRecords = Songs.records.through
+
+
+def _columns(model):
+    return tuple(field.attname for field in model._meta.concrete_fields)
+
+
+class Row(tuple):
+    """Строка таблицы каталога без модели Django: колонки и, если загружены, связи
+
+    Типы GraphQL принимают такие строки наравне с объектами моделей. Связь,
+    которая не была загружена вместе со строкой, равна None, и резолвер
+    берёт её через DataLoader.
+    """
+    __slots__ = ()
+    columns = ()
+    relations = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for index, name in enumerate(cls.columns + cls.relations):
+            setattr(cls, name, property(itemgetter(index)))
+
+    @classmethod
+    def build(cls, values, *related):
+        """Строка из кортежа колонок и значений связей по порядку ``relations``"""
+        return cls(values + related + (None,) * (len(cls.relations) - len(related)))
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class PerformerRow(Row):
+    __slots__ = ()
+    columns = _columns(Performer)
+
+
+class RecordRow(Row):
+    __slots__ = ()
+    columns = _columns(Records)
+    relations = ('performer',)
+
+
+class SongRow(Row):
+    __slots__ = ()
+    columns = _columns(Songs)
+    relations = ('performer', 'records')
+
+
+ROWS = {Performer: PerformerRow, Records: RecordRow, Songs: SongRow}
+
+
+def rows(queryset):
+    """Строки queryset без связей"""
+    row = ROWS[queryset.model]
+    return [row.build(values) for values in queryset.values_list(*row.columns)]
+
+
+def _columns_only(model, fields):
+    # Columns, and fields computed from the row id such as songCount.
+    by_name = model_fields(model)
+    return all(name == '__typename' or not getattr(by_name.get(to_snake_case(name)), 'is_relation', False)
+               for name in fields)
+
+
+def flat_fields(model, info, path=()):
+    """Поля выборки, если страницу можно собрать из строк одним-двумя запросами, иначе None
+
+    Подходят колонки модели, исполнитель и альбомы песни с одними
+    колонками; обратные связи (songsSet, recordsSet) идут обычным путём,
+    через prefetch_related.
+    """
+    if not ENABLED or model not in ROWS:
+        return None
+    selection_sets = [field.selection_set for field in info.field_asts]
+    for name in path:
+        selection_sets = collect_fields(selection_sets, info.fragments).get(name, [])
+    fields = collect_fields(selection_sets, info.fragments)
+    by_name = model_fields(model)
+    for name, nested in fields.items():
+        field = by_name.get(to_snake_case(name))
+        if field is None or not field.is_relation:
+            continue
+        if not (field.many_to_one or field.many_to_many and field.concrete):
+            return None
+        if not _columns_only(field.related_model, collect_fields(nested, info.fragments)):
+            return None
+    return {to_snake_case(name) for name in fields}
+
+
+def page(queryset, fields, limit):
+    """Первые ``limit`` строк queryset; исполнитель и альбомы из ``fields`` загружаются сразу"""
+    row = ROWS[queryset.model]
+    size = len(row.columns)
+    columns = list(row.columns)
+    with_performer = 'performer' in fields and 'performer' in row.relations
+    if with_performer:
+        columns += ['performer__' + name for name in PerformerRow.columns]
+    values = list(queryset.values_list(*columns)[:limit])
+
+    # Rows of one performer share a single object.
+    performers = {}
+    if with_performer:
+        for item in values:
+            if item[size] not in performers:
+                performers[item[size]] = PerformerRow.build(item[size:])
+    with_records = 'records' in fields and 'records' in row.relations
+    records = song_records([item[0] for item in values]) if with_records else {}
+
+    result = []
+    for item in values:
+        related = {
+            'performer': performers[item[size]] if with_performer else None,
+            'records': records.get(item[0], []) if with_records else None,
+        }
+        result.append(row.build(item[:size], *(related[name] for name in row.relations)))
+    return result
+
+
+def song_records(song_ids):
+    """Альбомы песен одним запросом: {id песни: [RecordRow, ...]} в порядке названий"""
+    links = (SongRecords.objects.filter(songs_id__in=song_ids).order_by('records__title', 'records_id')
+             .values_list('songs_id', *('records__' + name for name in RecordRow.columns)))
+    records, found = {}, {}
+    for song_id, *values in links:
+        record = found.get(values[0])
+        if record is None:
+            record = found[values[0]] = RecordRow.build(tuple(values))
+        records.setdefault(song_id, []).append(record)
+    return records
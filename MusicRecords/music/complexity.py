@@ -0,0 +1,162 @@
+import math
+import time
+
+from django.conf import settings
+from django.db import connections, router
+from graphene import relay
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+from graphql.language.ast import FragmentSpread, InlineFragment, IntValue, Variable
+from graphql.type.definition import GraphQLList, GraphQLNonNull, GraphQLObjectType, get_named_type
+from graphql.validation.rules.base import ValidationRule
+
+from music.models import Performer, Records, Songs
+from music.optimizer import model_fields
+
+ROW_ESTIMATES_TTL = 300
+# Rows assumed for a table the planner has no statistics on: never analyzed
+# (reltuples -1 on PostgreSQL 14+) or a backend without them.
+DEFAULT_ROW_ESTIMATES = getattr(settings, 'MUSIC_QUERY_ROW_ESTIMATES', {})
+
+_row_estimates = {'expires': 0, 'rows': {}}
+
+
+def _table_rows(tables):
+    # Never COUNT(*): that scans whole tables inside the very check meant to
+    # keep expensive work out of the request.
+    rows = {table: DEFAULT_ROW_ESTIMATES.get(table, 0) for table in tables}
+    connection = connections[router.db_for_read(Performer)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # Planner statistics: free to read, refreshed by (auto)ANALYZE.
+            cursor.execute('SELECT relname, reltuples FROM pg_class WHERE relname = ANY(%s)', [list(tables)])
+            rows.update((name, int(count)) for name, count in cursor.fetchall() if count >= 0)
+    return rows
+
+
+def row_estimates():
+    """Оценка числа строк в таблицах каталога, обновляется раз в ROW_ESTIMATES_TTL секунд"""
+    if _row_estimates['expires'] < time.monotonic():
+        tables = [model._meta.db_table for model in (Performer, Records, Songs, Songs.records.through)]
+        _row_estimates['rows'] = _table_rows(tables)
+        _row_estimates['expires'] = time.monotonic() + ROW_ESTIMATES_TTL
+    return _row_estimates['rows']
+
+
+def fan_out(field):
+    """Среднее число связанных объектов на один объект для списочной связи"""
+    rows = row_estimates()
+    if field.many_to_many:
+        through = field.through if hasattr(field, 'through') else field.remote_field.through
+        related = rows.get(through._meta.db_table, 0)
+    else:
+        related = rows.get(field.related_model._meta.db_table, 0)
+    owners = rows.get(field.model._meta.db_table, 0)
+    return max(1, math.ceil(related / owners)) if owners else 1
+
+
+def _unwrap(graphql_type):
+    while isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return graphql_type
+
+
+class QueryCostRule(ValidationRule):
+    """Отклоняет запросы глубже MUSIC_QUERY_MAX_DEPTH или дороже MUSIC_QUERY_MAX_COST
+
+    Стоимость - ожидаемое число объектов в ответе: размер страницы
+    connection-полей и списков с ``first`` и средний размер связей по
+    статистике таблиц перемножаются по уровням вложенности. Для ``first`` из переменной без
+    значения по умолчанию берётся максимальный размер страницы.
+    """
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.max_depth = getattr(settings, 'MUSIC_QUERY_MAX_DEPTH', 12)
+        self.max_cost = getattr(settings, 'MUSIC_QUERY_MAX_COST', 50000)
+        self.max_page = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+
+    def enter_OperationDefinition(self, node, key, parent, path, ancestors):
+        schema = self.context.get_schema()
+        root = {
+            'query': schema.get_query_type(),
+            'mutation': schema.get_mutation_type(),
+            'subscription': schema.get_subscription_type(),
+        }.get(node.operation)
+        if root is None:
+            return
+        self.defaults = {
+            definition.variable.name.value: definition.default_value
+            for definition in node.variable_definitions or []
+        }
+        self.depth = 0
+        cost = self.selection_cost(root, node.selection_set, 1, 1, frozenset())
+        name = node.name.value if node.name else 'анонимной операции'
+        if self.depth > self.max_depth:
+            self.context.report_error(GraphQLError(
+                f'Глубина {name} {self.depth} превышает допустимую {self.max_depth}', [node]
+            ))
+        if cost > self.max_cost:
+            self.context.report_error(GraphQLError(
+                f'Оценка стоимости {name} {cost} превышает допустимую {self.max_cost}', [node]
+            ))
+
+    def selection_cost(self, parent_type, selection_set, multiplier, depth, fragments):
+        cost = 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpread):
+                name = selection.name.value
+                fragment = self.context.get_fragment(name)
+                # Cycles are reported by NoFragmentCycles; just stop here.
+                if fragment is None or name in fragments:
+                    continue
+                fragment_type = self.context.get_schema().get_type(fragment.type_condition.name.value)
+                cost += self.selection_cost(
+                    fragment_type or parent_type, fragment.selection_set, multiplier, depth, fragments | {name}
+                )
+            elif isinstance(selection, InlineFragment):
+                fragment_type = parent_type
+                if selection.type_condition is not None:
+                    fragment_type = self.context.get_schema().get_type(selection.type_condition.name.value)
+                cost += self.selection_cost(fragment_type, selection.selection_set, multiplier, depth, fragments)
+            else:
+                cost += self.field_cost(parent_type, selection, multiplier, depth, fragments)
+        return cost
+
+    def field_cost(self, parent_type, node, multiplier, depth, fragments):
+        name = node.name.value
+        fields = getattr(parent_type, 'fields', None) or {}
+        if name.startswith('__') or name not in fields or node.selection_set is None:
+            return 0
+        self.depth = max(self.depth, depth)
+        field_type = _unwrap(fields[name].type)
+        named_type = get_named_type(field_type)
+        graphene_type = getattr(named_type, 'graphene_type', None)
+        parent_graphene_type = getattr(parent_type, 'graphene_type', None)
+
+        if isinstance(graphene_type, type) and issubclass(graphene_type, relay.Connection):
+            multiplier *= self.page_size(node)
+        elif isinstance(field_type, GraphQLList) and 'first' in fields[name].args:
+            # Plain lists limited by ``first`` (search results).
+            multiplier *= self.page_size(node)
+        elif isinstance(field_type, GraphQLList) and not (
+                isinstance(parent_graphene_type, type) and issubclass(parent_graphene_type, relay.Connection)):
+            model = getattr(getattr(parent_graphene_type, '_meta', None), 'model', None)
+            field = model_fields(model).get(to_snake_case(name)) if model is not None else None
+            if field is not None and field.is_relation:
+                multiplier *= fan_out(field)
+
+        cost = multiplier if isinstance(named_type, GraphQLObjectType) else 0
+        return cost + self.selection_cost(named_type, node.selection_set, multiplier, depth + 1, fragments)
+
+    def page_size(self, node):
+        for argument in node.arguments or []:
+            if argument.name.value != 'first':
+                continue
+            value = argument.value
+            if isinstance(value, Variable):
+                value = self.defaults.get(value.name.value)
+            if isinstance(value, IntValue):
+                return max(0, min(int(value.value), self.max_page))
+        return self.max_page
@@ -0,0 +1,88 @@
+import re
+import unicodedata
+
+from music.search import trigrams
+
+# Edition marks that do not make a different song or record:
+# "Title (Remastered 2011)", "Title - Deluxe Edition", "Title [Mono]".
+# Live versions, remixes and covers are different recordings and stay.
+_EDITION = (r'(?:\d{4}\s+)?(?:digital(?:ly)?\s+)?(?:remaster(?:ed)?|deluxe|expanded|anniversary|bonus\s+tracks?'
+            r'|special|collector\'?s|mono|stereo|explicit|clean|single|album)'
+            r'(?:\s+(?:version|edition|mix|track))?(?:\s+\d{4})?')
+_EDITION_SUFFIX = re.compile(rf'\s*(?:[(\[]\s*{_EDITION}\s*[)\]]|\s-\s+{_EDITION})\s*$', re.IGNORECASE)
+_WORD = re.compile(r'\w+')
+_NUMBER = re.compile(r'\d+')
+
+
+def normalize(title):
+    """Ключ названия: без пометок издания, регистра, диакритики, знаков препинания и лишних пробелов"""
+    text = unicodedata.normalize('NFKD', title or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    previous = None
+    while previous != text:
+        previous, text = text, _EDITION_SUFFIX.sub('', text)
+    return ' '.join(_WORD.findall(text.casefold()))
+
+
+def key_trigrams(key):
+    return set().union(*map(trigrams, key.split()))
+
+
+def similarity(a, b):
+    """Доля общих триграмм двух наборов, как similarity() в pg_trgm"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _keeper(rows):
+    # The shortest title is usually the one without edition marks; ties go
+    # to the oldest row.
+    return min(rows, key=lambda row: (len(row[1].strip()), row[0]))
+
+
+def find_groups(block, threshold=None):
+    """Группы дубликатов одного исполнителя: [(id оставляемой строки, [id дубликатов])]
+
+    ``block`` - ``(id исполнителя, [(id, название), ...])``. Строки с одним
+    ключом normalize() - дубликаты; с ``threshold`` дубликатами считаются и
+    ключи с похожестью не ниже него, если числа в них совпадают, чтобы
+    "Symphony No. 5" не слилась с "Symphony No. 6".
+    """
+    _, rows = block
+    by_key = {}
+    for row in rows:
+        by_key.setdefault(normalize(row[1]), []).append(row)
+    by_key.pop('', None)
+
+    # Union-find over keys; fuzzy pairs are compared only inside a sub-block
+    # with the same first letter and numbers, which keeps the quadratic part
+    # small even for the owner of the compilations.
+    parent = {key: key for key in by_key}
+
+    def root(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    if threshold:
+        grams = {key: key_trigrams(key) for key in by_key}
+        sub_blocks = {}
+        for key in by_key:
+            sub_blocks.setdefault((key[0], tuple(_NUMBER.findall(key))), []).append(key)
+        for keys in sub_blocks.values():
+            for i, a in enumerate(keys):
+                for b in keys[i + 1:]:
+                    if root(a) != root(b) and similarity(grams[a], grams[b]) >= threshold:
+                        parent[root(a)] = root(b)
+
+    merged = {}
+    for key, key_rows in by_key.items():
+        merged.setdefault(root(key), []).extend(key_rows)
+    groups = []
+    for group_rows in merged.values():
+        if len(group_rows) > 1:
+            keep = _keeper(group_rows)
+            groups.append((keep[0], sorted(row[0] for row in group_rows if row is not keep)))
+    return groups
@@ -0,0 +1,247 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from music import cache, routers
+from music.models import Performer, Records, Songs
+from music.signals import bulk_changed
+
+MAX_SIZE = getattr(settings, 'MUSIC_ENTITY_CACHE_SIZE', 50000)
+TTL = getattr(settings, 'MUSIC_ENTITY_CACHE_TTL', 300)
+STAMPS_ALIAS = getattr(settings, 'MUSIC_ENTITY_STAMPS', cache.CACHE_ALIAS)
+
+SongRecords = Songs.records.through
+
+
+def _links(owner_field, related_field):
+    def load(ids):
+        related = {id: [] for id in ids}
+        links = (SongRecords.objects.filter(**{f'{owner_field}__in': ids}).order_by(related_field)
+                 .values_list(owner_field, related_field))
+        for owner, id in links:
+            related[owner].append(id)
+        return related
+    return load
+
+
+# (model, relation): function returning {id: [related ids]} for a list of ids.
+# A performer's songs and records are not here: those lists run into the
+# thousands, and one indexed query beats checking a stamp per item.
+RELATIONS = {
+    (Songs, 'records'): _links('songs_id', 'records_id'),
+    (Records, 'songs'): _links('records_id', 'songs_id'),
+}
+
+
+class EntityCache:
+    """LRU объектов и списков id связей с TTL и сверкой версий
+
+    Ключ ``(метка модели, id)`` или ``(метка модели, id, связь)``. Версия
+    ключа хранится в общем кеше и поднимается при каждом изменении, так что
+    запись с устаревшей версией не отдаётся ни в одном процессе. Ключ,
+    который уже загружает другой поток, не загружается второй раз: поток
+    ждёт чужой результат.
+    """
+
+    def __init__(self, max_size=MAX_SIZE, ttl=TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'invalidations': 0}
+
+    def get_many(self, keys, load):
+        """Значения по ключам; ``load(keys)`` возвращает словарь значений для отсутствующих ключей"""
+        keys = list(dict.fromkeys(keys))
+        # Reads inside a transaction may see its uncommitted writes, which
+        # must not reach other requests, and the cache cannot see them yet.
+        if transaction.get_connection().in_atomic_block:
+            return load(keys)
+        # Stamps are read before the rows: a write committing in between
+        # leaves the stored entry under a stamp that is already old.
+        stamps = cache.get_generations(map(_stamp_label, keys), STAMPS_ALIAS)
+        # A replica may not have the write behind the current stamp yet, so
+        # its rows are kept for a short while only, and a caller reading
+        # from the primary takes none of them.
+        primary = routers.reads_from_primary()
+        found, waiting, claimed, unstored = {}, {}, {}, []
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                loading = self._loading.get(key)
+                if (entry is not None and entry[0] == stamps[_stamp_label(key)] and entry[1] > now
+                        and (entry[3] or not primary)):
+                    self._entries.move_to_end(key)
+                    found[key] = entry[2]
+                elif loading is not None and (loading[1] or not primary):
+                    waiting[key] = loading[0]
+                elif loading is not None:
+                    unstored.append(key)
+                else:
+                    claimed[key] = Future()
+                    self._loading[key] = (claimed[key], primary)
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(claimed) + len(unstored)
+            self.stats['coalesced'] += len(waiting)
+
+        if claimed:
+            try:
+                loaded = load(list(claimed))
+            except BaseException as error:
+                with self._lock:
+                    for key in claimed:
+                        del self._loading[key]
+                for future in claimed.values():
+                    future.set_exception(error)
+                raise
+            expires = time.monotonic() + routers.cache_timeout(self.ttl)
+            with self._lock:
+                for key in claimed:
+                    self._entries[key] = (stamps[_stamp_label(key)], expires, loaded.get(key), primary)
+                    self._entries.move_to_end(key)
+                    del self._loading[key]
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            for key, future in claimed.items():
+                found[key] = loaded.get(key)
+                future.set_result(found[key])
+
+        if unstored:
+            # Only while a replica read of the key is in flight.
+            loaded = load(unstored)
+            for key in unstored:
+                found[key] = loaded.get(key)
+
+        for key, future in waiting.items():
+            found[key] = future.result()
+        return found
+
+    def discard(self, keys):
+        with self._lock:
+            self.stats['invalidations'] += len(keys)
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+entity_cache = EntityCache()
+
+
+def _stamp_label(key):
+    return 'entity:' + ':'.join(map(str, key))
+
+
+def get_many(model, ids):
+    """Объекты модели по id: ``{id: объект или None}``"""
+    label = model._meta.label
+
+    def load(keys):
+        objects = model.objects.in_bulk([key[1] for key in keys])
+        return {key: objects.get(key[1]) for key in keys}
+
+    values = entity_cache.get_many([(label, id) for id in ids], load)
+    # Every caller gets its own copy, so nothing it sets on the instance
+    # leaks into other requests.
+    return {key[1]: copy.copy(value) for key, value in values.items()}
+
+
+def get(model, id):
+    """Объект модели по id; если его нет - model.DoesNotExist, как у objects.get()"""
+    obj = get_many(model, [id])[id]
+    if obj is None:
+        raise model.DoesNotExist(f'{model._meta.object_name} matching query does not exist.')
+    return obj
+
+
+def related_ids(model, relation, ids):
+    """Списки id связанных объектов: ``{id: (id, ...)}``, например альбомы песен"""
+    label = model._meta.label
+    load_related = RELATIONS[(model, relation)]
+
+    def load(keys):
+        related = load_related([key[1] for key in keys])
+        return {key: tuple(related[key[1]]) for key in keys}
+
+    values = entity_cache.get_many([(label, id, relation) for id in ids], load)
+    return {key[1]: value for key, value in values.items()}
+
+
+def invalidate(keys):
+    keys = list(keys)
+    if not keys:
+        return
+
+    def bump():
+        for key in keys:
+            cache.bump_generation(_stamp_label(key), STAMPS_ALIAS)
+        entity_cache.discard(keys)
+
+    transaction.on_commit(bump)
+
+
+def _object_keys(model, ids):
+    return [(model._meta.label, id) for id in ids]
+
+
+def _relation_keys(model, relation, ids):
+    return [(model._meta.label, id, relation) for id in ids]
+
+
+def _link_keys(links):
+    return (_relation_keys(Songs, 'records', {song_id for song_id, _ in links})
+            + _relation_keys(Records, 'songs', {record_id for _, record_id in links}))
+
+
+@receiver(post_save, sender=Performer)
+@receiver(post_save, sender=Records)
+@receiver(post_save, sender=Songs)
+def invalidate_saved(sender, instance, **kwargs):
+    invalidate(_object_keys(sender, [instance.pk]))
+
+
+@receiver(pre_delete, sender=Records)
+@receiver(pre_delete, sender=Songs)
+def remember_links(sender, instance, **kwargs):
+    # The through rows go away without signals of their own.
+    field = 'records_id' if sender is Records else 'songs_id'
+    instance._entity_links = list(SongRecords.objects.filter(**{field: instance.pk})
+                                  .values_list('songs_id', 'records_id'))
+
+
+@receiver(post_delete, sender=Performer)
+@receiver(post_delete, sender=Records)
+@receiver(post_delete, sender=Songs)
+def invalidate_deleted(sender, instance, **kwargs):
+    invalidate(_object_keys(sender, [instance.pk]) + _link_keys(getattr(instance, '_entity_links', ())))
+
+
+@receiver(m2m_changed, sender=SongRecords)
+def invalidate_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        field = 'records_id' if reverse else 'songs_id'
+        instance._entity_links = list(SongRecords.objects.filter(**{field: instance.pk})
+                                      .values_list('songs_id', 'records_id'))
+    elif action == 'post_clear':
+        invalidate(_link_keys(getattr(instance, '_entity_links', ())))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        invalidate(_link_keys([(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]))
+
+
+@receiver(bulk_changed)
+def invalidate_bulk(sender, objects=(), **kwargs):
+    if sender is SongRecords:
+        invalidate(_link_keys([(link.songs_id, link.records_id) for link in objects]))
+    elif sender in (Performer, Records, Songs):
+        invalidate(_object_keys(sender, [obj.pk for obj in objects]))
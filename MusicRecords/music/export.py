@@ -0,0 +1,128 @@
+import csv
+import json
+from collections import defaultdict
+
+from django.db import router
+from graphql import GraphQLError
+
+from music import changes
+from music.bulk import chunked
+from music.models import ChangeLog, Performer, Records, Songs
+from music.pagination import decode_cursor, encode_cursor, keyset_filter, ordering_keys
+
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+# CSV columns follow import_catalog: the performer id and ';'-separated
+# record ids, so an export can be loaded back as it is.
+CSV_COLUMNS = {
+    'performers': ('id', 'name', 'genre'),
+    'records': ('id', 'title', 'year', 'performer', 'performer_name'),
+    'songs': ('id', 'title', 'year', 'performer', 'performer_name', 'records'),
+}
+
+
+def parse_cursor(value):
+    """Позиция в журнале изменений по курсору выгрузки или ленты changes; None, если курсор некорректен"""
+    try:
+        position = decode_cursor(value, len(ordering_keys(ChangeLog)))
+    except GraphQLError:
+        return None
+    if not all(isinstance(key, int) for key in position):
+        return None
+    return position
+
+
+def cursor():
+    """Курсор журнала изменений, с которого продолжит следующая выгрузка"""
+    # Taken before the rows are read: a row changed during the export is
+    # sent now and once more next time, never lost between the two.
+    last = changes.visible().order_by('-transaction_id', '-id').values_list('transaction_id', 'id').first()
+    return encode_cursor(list(last or (0, 0)))
+
+
+def _performers(ids):
+    return {id: {'id': id, 'name': name, 'genre': genre}
+            for id, name, genre in Performer.objects.filter(id__in=ids).values_list('id', 'name', 'genre')}
+
+
+def _song_records(song_ids):
+    records = defaultdict(list)
+    links = (Songs.records.through.objects.filter(songs_id__in=song_ids)
+             .order_by('songs_id', 'records_id')
+             .values_list('songs_id', 'records_id', 'records__title', 'records__year'))
+    for song_id, id, title, year in links:
+        records[song_id].append({'id': id, 'title': title, 'year': year})
+    return records
+
+
+def _rows(queryset, fields, since, chunk_size):
+    # A server-side cursor walks the table in id order. With ``since``, the
+    # cursor of the previous export, only rows the change log has seen
+    # change after it are read; deleted ones are in the changes feed.
+    if since is not None:
+        entity = changes.ENTITIES[queryset.model]
+        using = router.db_for_read(ChangeLog)
+        changed = (changes.visible(using)
+                   .filter(keyset_filter(ordering_keys(ChangeLog), parse_cursor(since)), entity=entity)
+                   .values('object_id'))
+        queryset = queryset.using(using).filter(id__in=changed)
+    rows = queryset.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+    for chunk in chunked(rows, chunk_size):
+        yield [dict(zip(fields, row)) for row in chunk]
+
+
+def performers(since=None, chunk_size=CHUNK_SIZE):
+    for chunk in _rows(Performer.objects, ('id', 'name', 'genre'), since, chunk_size):
+        yield from chunk
+
+
+def records(since=None, chunk_size=CHUNK_SIZE):
+    for chunk in _rows(Records.objects, ('id', 'title', 'year', 'performer_id'), since, chunk_size):
+        found = _performers({row['performer_id'] for row in chunk})
+        for row in chunk:
+            row['performer'] = found.get(row.pop('performer_id'))
+            yield row
+
+
+def songs(since=None, chunk_size=CHUNK_SIZE):
+    for chunk in _rows(Songs.objects, ('id', 'title', 'year', 'performer_id'), since, chunk_size):
+        found = _performers({row['performer_id'] for row in chunk})
+        records = _song_records([row['id'] for row in chunk])
+        for row in chunk:
+            row['performer'] = found.get(row.pop('performer_id'))
+            row['records'] = records.get(row['id'], [])
+            yield row
+
+
+EXPORTS = {'performers': performers, 'records': records, 'songs': songs}
+
+
+def _csv_values(kind, row):
+    performer = row.get('performer') or {}
+    values = dict(row, performer=performer.get('id'), performer_name=performer.get('name'))
+    if kind == 'songs':
+        values['records'] = ';'.join(str(record['id']) for record in row['records'])
+    return [values.get(column) for column in CSV_COLUMNS[kind]]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def lines(kind, format='ndjson', since=None, chunk_size=CHUNK_SIZE):
+    """Строки выгрузки одного вида объектов в формате ndjson или csv"""
+    rows = EXPORTS[kind](since=since, chunk_size=chunk_size)
+    if format == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(CSV_COLUMNS[kind])
+        for row in rows:
+            yield writer.writerow(_csv_values(kind, row))
+    else:
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
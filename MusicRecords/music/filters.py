@@ -0,0 +1,48 @@
+from music.models import Songs
+
+SongRecords = Songs.records.through
+
+# Filter input field -> ORM lookup. Every lookup is on a column of the listed
+# table itself, so the filters AND together into one WHERE clause.
+LOOKUPS = {
+    'id_in': 'id__in',
+    'name': 'name',
+    'name_prefix': 'name__startswith',
+    'genre': 'genre',
+    'genre_in': 'genre__in',
+    'title': 'title',
+    'title_prefix': 'title__startswith',
+    'year': 'year',
+    'performer': 'performer_id',
+    'performer_in': 'performer_id__in',
+}
+
+RANGES = {'year_range': 'year'}
+
+
+def apply(queryset, *filters):
+    """queryset, отобранный по всем условиям фильтров; условия со значением null не применяются
+
+    Пустой список ``..._in`` не подходит ни одной строке.
+    """
+    conditions = {}
+    for filter in filters:
+        for name, value in filter.items():
+            if value is None:
+                continue
+            if name in RANGES:
+                for bound in ('gte', 'lte'):
+                    if value.get(bound) is not None:
+                        conditions[f'{RANGES[name]}__{bound}'] = value[bound]
+            elif name in ('record', 'record_in'):
+                # A subquery on the link table rather than a join, so a song
+                # on two of the records still comes back once.
+                records = [value] if name == 'record' else value
+                queryset = queryset.filter(id__in=SongRecords.objects.filter(records_id__in=records)
+                                           .values('songs_id'))
+            elif LOOKUPS[name] in conditions and conditions[LOOKUPS[name]] != value:
+                # The old arguments and the filter asking for different values.
+                return queryset.none()
+            else:
+                conditions[LOOKUPS[name]] = value
+    return queryset.filter(**conditions)
@@ -0,0 +1,78 @@
+import hashlib
+import json
+from functools import lru_cache
+from importlib.metadata import version
+from importlib.util import find_spec
+from pathlib import Path
+
+from django.conf import settings
+from graphql import parse, print_ast
+from graphql.utils.introspection_query import introspection_query
+
+CACHE_DIR = Path(getattr(settings, 'MUSIC_SCHEMA_CACHE_DIR', 'schema_cache'))
+SDL_FILE = 'schema.graphql'
+INTROSPECTION_FILE = 'introspection.json'
+
+# Modules whose source defines the schema, and packages whose version
+# changes how it is built; together they tell whether a cached copy is
+# still the schema of this code.
+SCHEMA_MODULES = ('MusicRecords.schema', 'music.schema', 'music.models')
+SCHEMA_PACKAGES = ('graphene', 'graphene-django', 'graphql-core')
+
+
+@lru_cache(maxsize=None)
+def fingerprint():
+    """Отпечаток исходников и версий библиотек, из которых строится схема"""
+    digest = hashlib.sha256()
+    for name in SCHEMA_MODULES:
+        digest.update(Path(find_spec(name).origin).read_bytes())
+    for name in SCHEMA_PACKAGES:
+        digest.update(f'{name}=={version(name)}'.encode())
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _standard_query():
+    return print_ast(parse(introspection_query))
+
+
+@lru_cache(maxsize=128)
+def _is_standard(query):
+    try:
+        return print_ast(parse(query)) == _standard_query()
+    except Exception:
+        # Reported by the execution itself.
+        return False
+
+
+def write(schema, directory=CACHE_DIR):
+    """Записывает SDL и результат стандартного запроса интроспекции схемы"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / SDL_FILE).write_text(f'# fingerprint: {fingerprint()}\n{schema}\n', encoding='utf-8')
+    with open(directory / INTROSPECTION_FILE, 'w', encoding='utf-8') as file:
+        json.dump({'fingerprint': fingerprint(), 'data': schema.introspect()}, file, ensure_ascii=False)
+    _load.cache_clear()
+
+
+@lru_cache(maxsize=1)
+def _load(directory=CACHE_DIR):
+    try:
+        with open(Path(directory) / INTROSPECTION_FILE, encoding='utf-8') as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
+    # A copy left over from other code is ignored, never served.
+    if not isinstance(cached, dict) or cached.get('fingerprint') != fingerprint():
+        return None
+    return cached.get('data')
+
+
+def lookup(query, operation_name=None):
+    """Сохранённый результат, если ``query`` - стандартный запрос интроспекции, иначе None"""
+    if not query or '__schema' not in query or operation_name not in (None, 'IntrospectionQuery'):
+        return None
+    data = _load()
+    if data is None or not _is_standard(query):
+        return None
+    return data
@@ -0,0 +1,157 @@
+from abc import ABCMeta, abstractmethod
+from collections import defaultdict
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from music import compact, entities
+from music.async_execution import database_sync_to_async, in_event_loop
+from music.models import Performer, PerformerStats, Records, RecordStats, Songs
+
+
+class ModelLoader(DataLoader, metaclass=ABCMeta):
+    """DataLoader, который под ASGI ходит в базу вне цикла событий"""
+
+    def __new__(cls, *args, **kwargs):
+        # DataLoader derives from threading.local, whose __new__ skips the
+        # abstract method check object.__new__ would make.
+        if cls.__abstractmethods__:
+            missing = ', '.join(sorted(cls.__abstractmethods__))
+            raise TypeError(f"Can't instantiate abstract class {cls.__name__} with abstract methods {missing}")
+        return super().__new__(cls, *args, **kwargs)
+
+    def batch_load_fn(self, keys):
+        if in_event_loop():
+            return Promise.resolve(database_sync_to_async(self.load_batch)(keys))
+        return Promise.resolve(self.load_batch(keys))
+
+    @abstractmethod
+    def load_batch(self, keys):
+        """Значения по ключам, в порядке ключей"""
+
+
+class PerformerLoader(ModelLoader):
+    """Исполнители по id"""
+
+    def load_batch(self, keys):
+        performers = entities.get_many(Performer, keys)
+        return [performers[key] for key in keys]
+
+
+class RecordLoader(ModelLoader):
+    """Альбомы по id"""
+
+    def load_batch(self, keys):
+        records = entities.get_many(Records, keys)
+        return [records[key] for key in keys]
+
+
+class SongLoader(ModelLoader):
+    """Песни по id"""
+
+    def load_batch(self, keys):
+        songs = entities.get_many(Songs, keys)
+        return [songs[key] for key in keys]
+
+
+def _related(model, relation, related_model, keys):
+    # Id lists and the objects themselves are cached apart, so renaming a
+    # song does not touch the lists it is on; order comes from the objects.
+    related_ids = entities.related_ids(model, relation, keys)
+    objects = entities.get_many(related_model, {id for key in keys for id in related_ids[key]})
+    return [
+        sorted((objects[id] for id in related_ids[key] if objects[id] is not None), key=lambda obj: obj.title)
+        for key in keys
+    ]
+
+
+class RecordsBySongLoader(ModelLoader):
+    """Альбомы песни по id песни"""
+
+    def load_batch(self, keys):
+        return _related(Songs, 'records', Records, keys)
+
+
+class SongsByRecordLoader(ModelLoader):
+    """Песни альбома по id альбома"""
+
+    def load_batch(self, keys):
+        return _related(Records, 'songs', Songs, keys)
+
+
+def _list(queryset):
+    # A performer's lists run into the thousands, where building model
+    # instances costs more than the query itself.
+    return compact.rows(queryset) if compact.ENABLED else queryset
+
+
+class RecordsByPerformerLoader(ModelLoader):
+    """Альбомы исполнителя по id исполнителя"""
+
+    def load_batch(self, keys):
+        records = defaultdict(list)
+        for record in _list(Records.objects.filter(performer_id__in=keys)):
+            records[record.performer_id].append(record)
+        return [records[key] for key in keys]
+
+
+class SongsByPerformerLoader(ModelLoader):
+    """Песни исполнителя по id исполнителя"""
+
+    def load_batch(self, keys):
+        songs = defaultdict(list)
+        for song in _list(Songs.objects.filter(performer_id__in=keys)):
+            songs[song.performer_id].append(song)
+        return [songs[key] for key in keys]
+
+
+class PerformerStatsLoader(ModelLoader):
+    """Сводка исполнителя по id исполнителя"""
+
+    def load_batch(self, keys):
+        stats = PerformerStats.objects.in_bulk(keys)
+        return [stats.get(key) or PerformerStats(performer_id=key) for key in keys]
+
+
+class RecordStatsLoader(ModelLoader):
+    """Сводка альбома по id альбома"""
+
+    def load_batch(self, keys):
+        stats = RecordStats.objects.in_bulk(keys)
+        return [stats.get(key) or RecordStats(record_id=key) for key in keys]
+
+
+class Loaders:
+    """Набор DataLoader'ов одного запроса"""
+
+    def __init__(self):
+        self.performer = PerformerLoader()
+        self.record = RecordLoader()
+        self.song = SongLoader()
+        self.records_by_song = RecordsBySongLoader()
+        self.songs_by_record = SongsByRecordLoader()
+        self.records_by_performer = RecordsByPerformerLoader()
+        self.songs_by_performer = SongsByPerformerLoader()
+        self.performer_stats = PerformerStatsLoader()
+        self.record_stats = RecordStatsLoader()
+
+
+def prefetched(instance, name):
+    """Связанные объекты, уже загруженные prefetch_related, или None"""
+    # ``name`` is Django's prefetch cache name: the accessor for forward and
+    # reverse foreign keys, but the related query name (``songs``) for a
+    # reverse many-to-many.
+    return getattr(instance, '_prefetched_objects_cache', {}).get(name)
+
+
+def get_loaders(info):
+    # Loaders live on the request so every resolver of one query shares
+    # the same batches and cache, and nothing leaks between requests.
+    context = info.context
+    if context is None:
+        return Loaders()
+    loaders = getattr(context, 'music_loaders', None)
+    if loaders is None:
+        loaders = Loaders()
+        context.music_loaders = loaders
+    return loaders
@@ -0,0 +1,68 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+
+from music.benchmarks import percentile
+from music.pagination import encode_cursor
+
+QUERY = '''
+query($songsAfter: String, $performersAfter: String) {
+  songs(first: 20, after: $songsAfter) { edges { node { title performer { name } records { title } } } }
+  performers(first: 20, after: $performersAfter) { edges { node { name songsSet { title } } } }
+}
+'''
+
+
+def body(i):
+    # A distinct cursor per request keeps the response cache out of the way.
+    variables = {'songsAfter': encode_cursor([f'{i:08d}', 0]), 'performersAfter': encode_cursor([f'{i:08d}'])}
+    return json.dumps({'query': QUERY, 'variables': variables})
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность и p99 синхронного (WSGI) и асинхронного (ASGI) эндпоинтов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    def handle(self, requests, concurrency, **options):
+        self.report('WSGI /graphql/', *self.run_wsgi(requests, concurrency))
+        self.report('ASGI /graphql/async/', *asyncio.run(self.run_asgi(requests, concurrency)))
+
+    def report(self, name, elapsed, latencies):
+        self.stdout.write(
+            f'{name}: {len(latencies) / elapsed:.1f} запросов/с, '
+            f'p50 {percentile(latencies, 50) * 1000:.1f} мс, p99 {percentile(latencies, 99) * 1000:.1f} мс'
+        )
+
+    def run_wsgi(self, requests, concurrency):
+        def call(i):
+            started = time.perf_counter()
+            response = Client().post('/graphql/', body(i), content_type='application/json')
+            assert response.status_code == 200, response.content
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(call, range(requests)))
+        return time.perf_counter() - started, latencies
+
+    async def run_asgi(self, requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        client = AsyncClient()
+
+        async def call(i):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post('/graphql/async/', body(requests + i), content_type='application/json')
+                assert response.status_code == 200, response.content
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(call(i) for i in range(requests)))
+        return time.perf_counter() - started, latencies
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music.benchmarks import percentile, run_operation
+from music.models import Performer, Records
+
+UPDATE_PERFORMER = '''
+mutation($id: Int!, $name: String) {
+  updatePerformer(id: $id, params: {name: $name, genre: "rock"}) { ok errors }
+}
+'''
+
+UPDATE_RECORD = '''
+mutation($id: Int!, $title: String, $performer: Int) {
+  updateRecord(id: $id, params: {title: $title, performer: $performer, year: 2000}) { ok errors }
+}
+'''
+
+
+class Command(BaseCommand):
+    help = 'Проверяет, что время updatePerformer/updateRecord не растёт с размером таблиц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--max-ratio', type=float, default=2.0,
+                            help='допустимое отношение p50 на самой большой и самой маленькой таблице')
+
+    def handle(self, sizes, repeat, max_ratio, **options):
+        from MusicRecords.schema import schema
+
+        results = {}
+        with transaction.atomic():
+            created = 0
+            for size in sorted(sizes):
+                self.grow(created, size)
+                created = size
+                results[size] = self.measure(schema, repeat)
+                timings, queries = results[size]
+                self.stdout.write(
+                    f'{size:>9} строк: p50 {percentile(timings, 50) * 1000:.2f} мс, '
+                    f'p99 {percentile(timings, 99) * 1000:.2f} мс, SQL-запросов {queries}'
+                )
+            transaction.set_rollback(True)
+
+        smallest, largest = results[min(sizes)], results[max(sizes)]
+        if largest[1] != smallest[1]:
+            raise CommandError(f'Число SQL-запросов растёт с размером таблицы: {smallest[1]} -> {largest[1]}')
+        ratio = percentile(largest[0], 50) / percentile(smallest[0], 50)
+        if ratio > max_ratio:
+            raise CommandError(f'Время обновления выросло в {ratio:.2f} раза')
+        self.stdout.write(self.style.SUCCESS(f'Рост времени обновления: {ratio:.2f}x'))
+
+    def grow(self, start, size):
+        performers = Performer.objects.bulk_create(
+            (Performer(name=f'Bench performer {i}', genre='rock') for i in range(start, size)), batch_size=5000
+        )
+        Records.objects.bulk_create(
+            (Records(title=f'Bench record {i}', year=2000, performer=performer)
+             for i, performer in enumerate(performers, start)), batch_size=5000
+        )
+
+    def measure(self, schema, repeat):
+        performer = Performer.objects.filter(name__startswith='Bench performer').first()
+        record = Records.objects.filter(performer=performer).first()
+        timings, queries = [], set()
+        for i in range(repeat):
+            elapsed, count = run_operation(schema, UPDATE_PERFORMER, {'id': performer.id, 'name': performer.name})
+            timings.append(elapsed)
+            queries.add(count)
+            elapsed, count = run_operation(
+                schema, UPDATE_RECORD, {'id': record.id, 'title': f'Bench record edit {i}', 'performer': performer.id}
+            )
+            timings.append(elapsed)
+            queries.add(count)
+        return timings, max(queries)
@@ -0,0 +1,99 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music.benchmarks import OPERATIONS, Sample, percentile, run_operation
+from music.models import Performer, Records, Songs
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет типовые запросы и мутации через схему и печатает пропускную способность, '
+            'перцентили задержки и число SQL-запросов; сравнивает результат с сохранённым эталоном')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--operations', nargs='+', choices=sorted(OPERATIONS), help='по умолчанию - все')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', help='JSON-файл эталона для сравнения')
+        parser.add_argument('--save-baseline', help='сохранить результат как эталон в этот файл')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='допустимый рост p50 относительно эталона, доля')
+
+    def handle(self, operations, repeat, warmup, seed, baseline, save_baseline, threshold, **options):
+        from MusicRecords.schema import schema
+
+        try:
+            sample = Sample(seed=seed)
+        except ValueError as error:
+            raise CommandError(error)
+        results = {}
+        for name in operations or OPERATIONS:
+            # Mutations are rolled back, so the catalogue stays as seeded.
+            # Queries run outside a transaction, as they do in production,
+            # so they go through the entity cache.
+            if OPERATIONS[name][0].lstrip().startswith('mutation'):
+                with transaction.atomic():
+                    results[name] = self.measure(schema, sample, name, repeat, warmup)
+                    transaction.set_rollback(True)
+            else:
+                results[name] = self.measure(schema, sample, name, repeat, warmup)
+            self.report(name, results[name])
+
+        report = {'catalog': self.catalog(), 'operations': results}
+        if save_baseline:
+            Path(save_baseline).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+            self.stdout.write(f'Эталон сохранён в {save_baseline}')
+        if baseline:
+            self.compare(report, json.loads(Path(baseline).read_text(encoding='utf-8')), threshold)
+
+    def measure(self, schema, sample, name, repeat, warmup):
+        query, variables = OPERATIONS[name]
+        for i in range(warmup):
+            run_operation(schema, query, variables(sample, repeat + i))
+        timings, queries = [], 0
+        started = time.perf_counter()
+        for i in range(repeat):
+            elapsed, count = run_operation(schema, query, variables(sample, i))
+            timings.append(elapsed)
+            queries = max(queries, count)
+        total = time.perf_counter() - started
+        return {
+            'ops_per_second': round(repeat / total, 1),
+            'p50_ms': round(percentile(timings, 50) * 1000, 2),
+            'p95_ms': round(percentile(timings, 95) * 1000, 2),
+            'p99_ms': round(percentile(timings, 99) * 1000, 2),
+            'queries': queries,
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<20} {result["ops_per_second"]:>8.1f} оп/с  p50 {result["p50_ms"]:>8.2f} мс  '
+            f'p95 {result["p95_ms"]:>8.2f} мс  p99 {result["p99_ms"]:>8.2f} мс  SQL {result["queries"]}'
+        )
+
+    def catalog(self):
+        return {'performers': Performer.objects.count(), 'records': Records.objects.count(),
+                'songs': Songs.objects.count()}
+
+    def compare(self, report, baseline, threshold):
+        if report['catalog'] != baseline.get('catalog'):
+            self.stderr.write(f'Каталог отличается от эталонного {baseline.get("catalog")}: '
+                              f'{report["catalog"]}, сравнение приблизительное')
+        regressions = []
+        for name, result in report['operations'].items():
+            expected = baseline.get('operations', {}).get(name)
+            if expected is None:
+                continue
+            # SQL counts do not depend on the machine, so any growth counts.
+            if result['queries'] > expected['queries']:
+                regressions.append(f'{name}: SQL-запросов {expected["queries"]} -> {result["queries"]}')
+            ratio = result['p50_ms'] / expected['p50_ms'] if expected['p50_ms'] else 1
+            if ratio > 1 + threshold:
+                regressions.append(f'{name}: p50 {expected["p50_ms"]} -> {result["p50_ms"]} мс ({ratio:.2f}x)')
+        if regressions:
+            raise CommandError('Регрессии относительно эталона:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий относительно эталона нет'))
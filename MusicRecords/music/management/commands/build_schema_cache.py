@@ -0,0 +1,29 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music import introspection
+
+
+class Command(BaseCommand):
+    help = ('Записывает SDL схемы и результат запроса интроспекции на диск: интроспекцию эндпоинт '
+            'отдаёт из файла. Запускать при сборке, после изменения схемы.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(introspection.CACHE_DIR),
+                            help='каталог; по умолчанию - MUSIC_SCHEMA_CACHE_DIR')
+        parser.add_argument('--check', action='store_true',
+                            help='только проверить, что сохранённая схема совпадает с текущей')
+
+    def handle(self, output, check, **options):
+        from MusicRecords.schema import schema
+
+        path = Path(output) / introspection.SDL_FILE
+        if check:
+            expected = f'# fingerprint: {introspection.fingerprint()}\n{schema}\n'
+            if not path.exists() or path.read_text(encoding='utf-8') != expected:
+                raise CommandError(f'{path} устарел, выполните build_schema_cache')
+            self.stdout.write(self.style.SUCCESS(f'{path} совпадает с текущей схемой'))
+            return
+        introspection.write(schema, output)
+        self.stdout.write(self.style.SUCCESS(f'Схема записана в {output}'))
@@ -0,0 +1,115 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from music.models import Performer, Records, Songs
+from music.pagination import encode_cursor
+
+# Representative operations for every list and single-object resolver.
+QUERIES = [
+    '{ performers(first: 20) { edges { node { name genre } } } }',
+    '{ performers(genre: "rock", first: 20) { edges { node { name recordsSet { title } songsSet { title } } } } }',
+    '{ performers(name: "Performer 1") { edges { node { name genre } } } }',
+    '{ records(first: 20) { edges { node { title year performer { name } } } } }',
+    '{ records(year: 1971, first: 20) { edges { node { title songsSet { title } } } } }',
+    '{ records(title: "Record 1", year: 1971) { edges { node { title } } } }',
+    '{ songs(first: 20) { edges { node { title performer { name } records { title } } } } }',
+    '{ songs(year: 1972, first: 20) { edges { node { title year } } } }',
+    '{ songs(title: "Song 1") { edges { node { title } } } }',
+    '{ songs(first: 20, after: "%s") { edges { node { title } } } }' % encode_cursor(['Song 1', 1]),
+    '{ records(filter: {performer: 1, yearRange: {gte: 1970, lte: 1972}}, first: 20) { edges { node { title } } } }',
+    '{ songs(filter: {performer: 1}, first: 20) { edges { node { title year } } } }',
+    '{ songs(filter: {yearRange: {gte: 1971}}, first: 20) { edges { node { title } } } }',
+]
+
+SINGLE_QUERY = '{ performer(id: %d) { name } record(id: %d) { title } song(id: %d) { title records { title } } }'
+
+PLAN_PROBLEMS = {
+    'postgresql': (re.compile(r'Seq Scan on \w+'), re.compile(r'\b(?:Incremental )?Sort\b')),
+    'sqlite': (re.compile(r'^SCAN \w+$'), re.compile(r'USE TEMP B-TREE FOR ORDER BY')),
+}
+
+
+class Command(BaseCommand):
+    help = 'Проверяет планы SQL-запросов резолверов: ни полного сканирования, ни сортировки без индекса'
+
+    def handle(self, *args, **options):
+        if connection.vendor not in PLAN_PROBLEMS:
+            raise CommandError(f'EXPLAIN для {connection.vendor} не поддерживается')
+        from MusicRecords.schema import schema
+
+        problems = []
+        with transaction.atomic():
+            queries = QUERIES + [SINGLE_QUERY % self.seed()]
+            if connection.vendor == 'postgresql':
+                # Make the planner pick an index whenever one exists, so a plan
+                # that still scans or sorts means the index is missing.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+                    cursor.execute('SET LOCAL enable_sort = off')
+
+            statements = []
+            for query in queries:
+                with CaptureQueriesContext(connection) as captured:
+                    result = schema.execute(query, context_value=RequestFactory().get('/graphql/'))
+                if result.errors:
+                    raise CommandError(f'{query}: {result.errors}')
+                statements.extend(item['sql'] for item in captured.captured_queries)
+            with CaptureQueriesContext(connection) as captured:
+                for queryset in self.mutation_checks():
+                    queryset.exists()
+            statements.extend(item['sql'] for item in captured.captured_queries)
+
+            for sql in statements:
+                if not sql.startswith('SELECT'):
+                    continue
+                plan = self.explain(sql)
+                self.stdout.write(f'{sql}\n    ' + '\n    '.join(plan))
+                problems.extend(self.check_plan(sql, plan))
+            transaction.set_rollback(True)
+
+        if problems:
+            raise CommandError('Найдены проблемы в планах запросов:\n' + '\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS(f'Проверено запросов: {len(statements)}'))
+
+    def seed(self):
+        performers = Performer.objects.bulk_create(
+            Performer(name=f'Performer {i}', genre='rock' if i % 2 else 'jazz') for i in range(10)
+        )
+        records = Records.objects.bulk_create(
+            Records(title=f'Record {i}', year=1970 + i % 5, performer=performers[i % 10]) for i in range(30)
+        )
+        songs = Songs.objects.bulk_create(
+            Songs(title=f'Song {i}', year=1970 + i % 5, performer=performers[i % 10]) for i in range(100)
+        )
+        Songs.records.through.objects.bulk_create(
+            Songs.records.through(songs_id=song.id, records_id=records[i % 30].id) for i, song in enumerate(songs)
+        )
+        return performers[0].id, records[0].id, songs[0].id
+
+    def mutation_checks(self):
+        # The duplicate checks run by CreatePerformer/CreateRecord/CreateSong.
+        return [
+            Performer.objects.filter(name='Performer 1'),
+            Records.objects.filter(title='Record 1', performer=1),
+            Songs.objects.filter(title='Song 1', performer=1),
+        ]
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                return [row[-1] for row in cursor.fetchall()]
+            cursor.execute(f'EXPLAIN {sql}')
+            return [row[0] for row in cursor.fetchall()]
+
+    def check_plan(self, sql, plan):
+        scan, sort = PLAN_PROBLEMS[connection.vendor]
+        problems = [f'{line.strip()}: {sql}' for line in plan if scan.search(line.strip())]
+        # Sorting matters for paginated queries; prefetches of a page are small.
+        if ' LIMIT ' in sql:
+            problems.extend(f'{line.strip()}: {sql}' for line in plan if sort.search(line))
+        return problems
@@ -0,0 +1,78 @@
+from contextlib import ExitStack, contextmanager
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+
+from music import routers
+from music.models import Performer
+
+# The page size differs per request so that none is served from the result cache.
+QUERY = '{ performers(first: %d) { edges { node { name recordsSet { title } } } } }'
+MUTATION = 'mutation($id: Int!, $name: String, $genre: String) ' \
+           '{ updatePerformer(id: $id, params: {name: $name, genre: $genre}) { ok performer { name songCount } } }'
+
+
+@contextmanager
+def used_aliases():
+    used = set()
+    with ExitStack() as stack:
+        for alias in connections:
+            def record(execute, sql, params, many, context, alias=alias):
+                used.add(alias)
+                return execute(sql, params, many, context)
+            stack.enter_context(connections[alias].execute_wrapper(record))
+        yield used
+
+
+class Command(BaseCommand):
+    help = ('Проверяет маршрутизацию запросов: чтение с реплик, мутации и чтение после записи - '
+            'из основной базы. Реплики можно подменить локальными копиями базы (SQLite или Postgres), '
+            'описав их в DATABASES как replica_N.')
+
+    def handle(self, *args, **options):
+        if not routers.REPLICAS:
+            raise CommandError('Реплики не настроены: задайте MUSIC_DB_REPLICA_HOSTS или DATABASES replica_N')
+        client = Client(HTTP_HOST='localhost')
+        problems = []
+
+        with used_aliases() as used:
+            self.post(client, QUERY % 5)
+        self.report('Запрос', used)
+        if DEFAULT_DB_ALIAS in used:
+            problems.append('запрос без недавней записи читал из основной базы')
+
+        performer = Performer.objects.first()
+        if performer is None:
+            raise CommandError('Нужен хотя бы один исполнитель')
+        with transaction.atomic():
+            # The write is rolled back: only the routing is of interest.
+            with used_aliases() as used:
+                response = self.post(client, MUTATION, {'id': performer.id, 'name': performer.name,
+                                                        'genre': performer.genre or 'rock'})
+            transaction.set_rollback(True)
+        self.report('Мутация', used)
+        if used != {DEFAULT_DB_ALIAS}:
+            problems.append('мутация обращалась к репликам')
+        if routers.PRIMARY_COOKIE not in response.cookies:
+            problems.append('после записи не выставлена кука чтения из основной базы')
+
+        with used_aliases() as used:
+            self.post(client, QUERY % 4)
+        self.report('Запрос сразу после записи', used)
+        if used != {DEFAULT_DB_ALIAS}:
+            problems.append('чтение сразу после записи ушло на реплику')
+
+        if problems:
+            raise CommandError('Маршрутизация нарушена: ' + '; '.join(problems))
+        self.stdout.write(self.style.SUCCESS('Маршрутизация запросов в порядке'))
+
+    def post(self, client, query, variables=None):
+        response = client.post('/graphql/', {'query': query, 'variables': variables or {}},
+                               content_type='application/json')
+        if response.status_code != 200 or 'errors' in response.json():
+            raise CommandError(f'{query}: {response.content.decode()}')
+        return response
+
+    def report(self, name, used):
+        self.stdout.write(f'{name}: {", ".join(sorted(used))}')
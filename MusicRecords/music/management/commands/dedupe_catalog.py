@@ -0,0 +1,119 @@
+import json
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from music import bulk, dedupe
+from music.models import Records, Songs
+
+MODELS = {'records': Records, 'songs': Songs}
+MERGE = {'records': bulk.merge_records, 'songs': bulk.merge_songs}
+
+
+def blocks(model, chunk_size):
+    """Строки модели по исполнителям: ``(id исполнителя, [(id, название), ...])``"""
+    # The (performer, title, id) index serves this order, so the rows stream
+    # without a sort.
+    rows = model.objects.order_by('performer_id', 'title', 'id').values_list('performer_id', 'id', 'title')
+    performer, block = None, []
+    for performer_id, id, title in rows.iterator(chunk_size=chunk_size):
+        if performer_id != performer and block:
+            yield performer, block
+            block = []
+        performer = performer_id
+        block.append((id, title))
+    if block:
+        yield performer, block
+
+
+class Command(BaseCommand):
+    help = ('Ищет альбомы и песни-дубликаты одного исполнителя ("Title (Remastered)", регистр, пробелы) '
+            'в пуле процессов, записывает план слияния и, с --apply, сливает их пачками транзакций')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=sorted(MODELS), action='append', dest='kinds',
+                            help='по умолчанию - альбомы и песни')
+        parser.add_argument('--similarity', type=float, default=0,
+                            help='порог похожести названий от 0 до 1; 0 - только одинаковые ключи')
+        parser.add_argument('--processes', type=int, default=os.cpu_count())
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=500, help='групп дубликатов на транзакцию')
+        parser.add_argument('--plan', help='записать план в файл JSONL')
+        parser.add_argument('--from-plan', help='слить по ранее записанному плану, не сканируя каталог')
+        parser.add_argument('--apply', action='store_true', help='слить дубликаты; без него - только план')
+
+    def handle(self, kinds, similarity, processes, chunk_size, batch_size, plan, from_plan, apply, **options):
+        if not 0 <= similarity <= 1:
+            raise CommandError('--similarity должен быть от 0 до 1')
+        # Records go first: their merge moves songs onto the kept records
+        # before duplicate songs are merged.
+        kinds = [kind for kind in MODELS if not kinds or kind in kinds]
+        if from_plan:
+            plans = self.read_plan(from_plan, kinds)
+        else:
+            plans = {kind: self.find(kind, similarity, processes, chunk_size) for kind in kinds}
+        if plan:
+            self.write_plan(plan, plans)
+
+        for kind, groups in plans.items():
+            duplicates = sum(len(group[1]) for group in groups)
+            self.stdout.write(f'{kind}: групп {len(groups)}, дубликатов {duplicates}')
+            if apply or from_plan:
+                self.merge(kind, groups, batch_size, chunk_size)
+
+    def find(self, kind, similarity, processes, chunk_size):
+        # Workers only compute keys; the parent's connection must not be
+        # inherited by forked processes, and is reopened on the next query.
+        connections.close_all()
+        find_groups = partial(dedupe.find_groups, threshold=similarity or None)
+        groups = []
+        with Pool(processes, initializer=django.setup) as pool:
+            for block_groups in pool.imap_unordered(find_groups, blocks(MODELS[kind], chunk_size), chunksize=16):
+                groups.extend(block_groups)
+        groups.sort()
+        return groups
+
+    def merge(self, kind, groups, batch_size, chunk_size):
+        # Merges go in batches of their own transaction: a failure keeps the
+        # batches already merged, and the plan can simply be run again.
+        merged = 0
+        for batch in bulk.chunked(groups, batch_size):
+            with transaction.atomic():
+                merged += MERGE[kind](batch, batch_size=chunk_size)
+            self.stdout.write(f'{kind}: слито {merged}')
+        self.stdout.write(self.style.SUCCESS(f'{kind}: удалено дубликатов {merged}'))
+
+    def write_plan(self, path, plans):
+        titles = {}
+        for kind, groups in plans.items():
+            ids = [id for keep, duplicates in groups for id in [keep, *duplicates]]
+            for chunk in bulk.chunked(ids):
+                titles.update(((kind, id), title) for id, title in
+                              MODELS[kind].objects.filter(id__in=chunk).values_list('id', 'title'))
+        with open(path, 'w', encoding='utf-8') as file:
+            for kind, groups in plans.items():
+                for keep, duplicates in groups:
+                    file.write(json.dumps({
+                        'kind': kind, 'keep': keep, 'merge': duplicates,
+                        'titles': [titles.get((kind, id)) for id in [keep, *duplicates]],
+                    }, ensure_ascii=False) + '\n')
+        self.stderr.write(self.style.SUCCESS(f'План записан в {path}'))
+
+    def read_plan(self, path, kinds):
+        plans = {kind: [] for kind in kinds}
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    kind, group = item['kind'], (int(item['keep']), [int(id) for id in item['merge']])
+                except (ValueError, KeyError, TypeError):
+                    raise CommandError(f'{path}:{number}: некорректная строка плана')
+                if kind in plans:
+                    plans[kind].append(group)
+        return plans
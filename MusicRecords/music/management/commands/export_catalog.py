@@ -0,0 +1,30 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from music import export
+
+
+class Command(BaseCommand):
+    help = ('Выгружает каталог в NDJSON или CSV потоком, не держа его в памяти. '
+            '--since - курсор из предыдущей выгрузки: будут выгружены только изменённые с тех пор объекты.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(export.EXPORTS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--since')
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+        parser.add_argument('--output', help='файл; по умолчанию - stdout')
+
+    def handle(self, kind, format='ndjson', since=None, chunk_size=export.CHUNK_SIZE, output=None, **options):
+        if since is not None and export.parse_cursor(since) is None:
+            raise CommandError(f'Некорректный --since {since}')
+        cursor = export.cursor()
+        lines = export.lines(kind, format, since=since, chunk_size=chunk_size)
+        if output is None:
+            sys.stdout.writelines(lines)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as file:
+                file.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f'Выгрузка {kind} записана в {output}'))
+        self.stderr.write(f'Курсор для следующей выгрузки (--since): {cursor}')
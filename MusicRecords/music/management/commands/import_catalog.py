@@ -0,0 +1,71 @@
+import csv
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music import bulk
+from music.models import Performer
+
+CREATE = {
+    'performers': bulk.create_performers,
+    'records': bulk.create_records,
+    'songs': bulk.create_songs,
+}
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(file):
+    for row in csv.DictReader(file):
+        row = {key: value or None for key, value in row.items()}
+        # Song rows list their record ids separated by ';'.
+        if row.get('records'):
+            row['records'] = row['records'].split(';')
+        yield row
+
+
+class Command(BaseCommand):
+    help = ('Импортирует каталог из CSV или JSONL одной транзакцией. '
+            'Исполнитель записи задаётся id или названием, альбомы песни - списком id.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=sorted(CREATE), required=True)
+        parser.add_argument('--format', choices=('csv', 'jsonl'), help='по умолчанию - по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, path, kind, format=None, chunk_size=5000, **options):
+        path = Path(path)
+        format = format or ('csv' if path.suffix == '.csv' else 'jsonl')
+        read = read_csv if format == 'csv' else read_jsonl
+        create = CREATE[kind]
+
+        total = 0
+        with path.open(newline='', encoding='utf-8') as file, transaction.atomic():
+            for chunk in bulk.chunked(read(file), chunk_size):
+                if kind != 'performers':
+                    self.resolve_performers(chunk)
+                objects, errors = create(chunk, batch_size=chunk_size)
+                if errors:
+                    shown = '\n'.join(errors[:20])
+                    raise CommandError(f'Строки {total + 1}-{total + len(chunk)}: ошибок {len(errors)}\n{shown}')
+                total += len(objects)
+                self.stdout.write(f'{kind}: {total}')
+        self.stdout.write(self.style.SUCCESS(f'Импортировано {kind}: {total}'))
+
+    def resolve_performers(self, chunk):
+        names = {row['performer'] for row in chunk
+                 if isinstance(row.get('performer'), str) and not row['performer'].isdigit()}
+        if not names:
+            return
+        ids = dict(Performer.objects.filter(name__in=names).values_list('name', 'id'))
+        for row in chunk:
+            if row.get('performer') in names:
+                # An unknown name is reported by the regular performer check.
+                row['performer'] = ids.get(row['performer'], row['performer'])
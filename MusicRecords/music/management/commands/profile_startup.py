@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter, like a new worker: set Django up, load the WSGI
+# application and answer the first and the second request. Times are
+# time.time() values, comparable with the parent's.
+WORKER = r'''
+import io, json, sys, time
+path, query = sys.argv[1:3]
+marks = {}
+import django
+django.setup()
+marks['setup'] = time.time()
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+marks['application'] = time.time()
+hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+host = hosts[0] if hosts else 'localhost'
+statuses = []
+def request(name):
+    body = json.dumps({'query': query}).encode()
+    environ = {
+        'REQUEST_METHOD': 'POST', 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+        'SERVER_NAME': host, 'SERVER_PORT': '80', 'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body), 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    result = application(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    b''.join(result)
+    marks[name] = time.time()
+request('first_request')
+request('second_request')
+print(json.dumps({'marks': marks, 'statuses': statuses}))
+'''
+
+PHASES = [
+    ('setup', 'запуск интерпретатора и django.setup()'),
+    ('application', 'WSGI-приложение'),
+    ('first_request', 'первый запрос (URLconf, представление, схема)'),
+    ('second_request', 'второй запрос'),
+]
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$')
+
+
+class Command(BaseCommand):
+    help = ('Запускает новый процесс, как свежий воркер, и измеряет время до ответа на первый запрос '
+            'по этапам и самые медленные импорты. Превышение бюджета - ошибка.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='запусков; показывается медиана')
+        parser.add_argument('--budget', type=float, default=getattr(settings, 'MUSIC_STARTUP_BUDGET_MS', None),
+                            help='бюджет времени до первого ответа, мс; по умолчанию - MUSIC_STARTUP_BUDGET_MS')
+        parser.add_argument('--top', type=int, default=15, help='сколько самых медленных импортов показать')
+        parser.add_argument('--path', default='/graphql/')
+        parser.add_argument('--query', default='{ __typename }')
+
+    def handle(self, repeat, budget, top, path, query, **options):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, sys.path)))
+        env.setdefault('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)
+
+        runs, imports = [], None
+        for _ in range(max(repeat, 1)):
+            started = time.time()
+            process = subprocess.run([sys.executable, '-X', 'importtime', '-c', WORKER, path, query],
+                                     env=env, capture_output=True, text=True)
+            if process.returncode:
+                raise CommandError(f'Процесс завершился с кодом {process.returncode}:\n{process.stderr[-3000:]}')
+            report = json.loads(process.stdout.strip().splitlines()[-1])
+            bad = [status for status in report['statuses'] if not status.startswith('200')]
+            if bad:
+                raise CommandError(f'{path} ответил {bad[0]}')
+            runs.append({name: (mark - started) * 1000 for name, mark in report['marks'].items()})
+            imports = process.stderr
+
+        previous = 0.0
+        self.stdout.write(f'Медиана {len(runs)} запусков, мс от старта процесса:')
+        for name, title in PHASES:
+            elapsed = statistics.median(run[name] for run in runs)
+            self.stdout.write(f'  {title:<50} {elapsed:8.1f}  (+{elapsed - previous:.1f})')
+            previous = elapsed
+        first_response = statistics.median(run['first_request'] for run in runs)
+
+        self.stdout.write(f'\nСамые медленные импорты последнего запуска, мс (собственное / вместе с вложенными):')
+        for self_us, cumulative_us, name in self.slowest_imports(imports, top):
+            self.stdout.write(f'  {self_us / 1000:8.1f} {cumulative_us / 1000:8.1f}  {name}')
+
+        if budget is not None and first_response > budget:
+            raise CommandError(f'Время до первого ответа {first_response:.0f} мс больше бюджета {budget:.0f} мс')
+        self.stdout.write(self.style.SUCCESS(f'Время до первого ответа {first_response:.0f} мс'))
+
+    def slowest_imports(self, stderr, top):
+        found = []
+        for line in stderr.splitlines():
+            match = IMPORT_TIME.match(line)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2)), match.group(4)))
+        return sorted(found, reverse=True)[:top]
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from music import stats
+from music.models import GenreStats, PerformerStats, RecordStats, YearStats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает сводные таблицы (число песен и альбомов, итоги по жанрам и годам) с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, batch_size=1000, **options):
+        stats.rebuild(batch_size=batch_size)
+        for model in (PerformerStats, RecordStats, GenreStats, YearStats):
+            self.stdout.write(f'{model._meta.object_name}: {model.objects.count()}')
+        self.stdout.write(self.style.SUCCESS('Сводные таблицы пересчитаны'))
@@ -0,0 +1,109 @@
+import random
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from music import bulk
+
+GENRES = ['rock', 'pop', 'jazz', 'hip-hop', 'electronic', 'classical', 'metal', 'folk', 'blues', 'reggae']
+FIRST_YEAR = 1955
+LAST_YEAR = 2024
+
+
+def zipf_weights(size, skew):
+    """Накопленные веса рангов 1..size по закону Ципфа"""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = ('Заполняет каталог синтетическими данными: число песен и альбомов на исполнителя '
+            'распределено по Ципфу, часть альбомов - сборники с песнями разных исполнителей')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--performers', type=int, default=300)
+        parser.add_argument('--records', type=int, default=1000)
+        parser.add_argument('--songs', type=int, default=20000)
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='показатель распределения Ципфа: чем больше, тем сильнее перекос')
+        parser.add_argument('--compilations', type=float, default=0.1, help='доля сборников среди альбомов')
+        parser.add_argument('--seed', type=int, default=0, help='одно и то же зерно даёт один и тот же каталог')
+        parser.add_argument('--prefix', default='Seed', help='префикс названий, чтобы не пересекаться с данными')
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, performers, records, songs, skew, compilations, seed, prefix, chunk_size, **options):
+        if performers < 2 or records < 1:
+            raise CommandError('Нужны хотя бы 2 исполнителя и 1 альбом')
+        rng = random.Random(seed)
+        self.prefix = prefix
+        self.chunk_size = chunk_size
+
+        # The first performer owns the compilations; the others are ranked by
+        # popularity, so rank 1 gets the most records and songs.
+        starts = [rng.randint(FIRST_YEAR, LAST_YEAR - 10) for _ in range(performers)]
+        compilation_count = round(records * compilations)
+        weights = zipf_weights(performers - 1, skew)
+
+        record_owners = [0] * compilation_count + [
+            rank + 1 for rank in rng.choices(range(performers - 1), cum_weights=weights, k=records - compilation_count)
+        ]
+        song_owners = [rank + 1 for rank in rng.choices(range(performers - 1), cum_weights=weights, k=songs)]
+        record_years = [min(LAST_YEAR, starts[owner] + rng.randint(0, 20)) for owner in record_owners]
+        genres = [None] + [None if rng.random() < 0.05 else genre
+                           for genre in rng.choices(GENRES, cum_weights=zipf_weights(len(GENRES), 1), k=performers - 1)]
+
+        with transaction.atomic():
+            performer_ids = self.create('performers', bulk.create_performers, (
+                {'name': f'{prefix} Various Artists' if i == 0 else f'{prefix} performer {i}',
+                 'genre': genres[i]}
+                for i in range(performers)
+            ))
+            record_ids = self.create('records', bulk.create_records, (
+                {'title': f'{prefix} record {i}', 'year': record_years[i], 'performer': performer_ids[owner]}
+                for i, owner in enumerate(record_owners)
+            ))
+
+            own_records = [[] for _ in range(performers)]
+            for i, owner in enumerate(record_owners):
+                own_records[owner].append(i)
+            tracks = self.compilation_tracks(rng, compilation_count, songs)
+            self.create('songs', bulk.create_songs, (
+                self.song(rng, i, owner, starts, own_records, tracks, record_years, record_ids, performer_ids)
+                for i, owner in enumerate(song_owners)
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано исполнителей {performers}, альбомов {records} (сборников {compilation_count}), песен {songs}'
+        ))
+
+    def compilation_tracks(self, rng, compilation_count, songs):
+        # Each compilation picks its tracks across the whole catalogue, so a
+        # song can appear on several of them.
+        tracks = {}
+        for record in range(compilation_count):
+            for song in rng.sample(range(songs), min(songs, rng.randint(12, 20))):
+                tracks.setdefault(song, []).append(record)
+        return tracks
+
+    def song(self, rng, i, owner, starts, own_records, tracks, record_years, record_ids, performer_ids):
+        records = list(tracks.get(i, ()))
+        # Most songs come out on one of the performer's albums, the rest as
+        # singles.
+        if own_records[owner] and rng.random() < 0.9:
+            album = rng.choice(own_records[owner])
+            records.append(album)
+            year = record_years[album]
+        else:
+            year = min(LAST_YEAR, starts[owner] + rng.randint(0, 20))
+        return {'title': f'{self.prefix} song {i}', 'year': year, 'performer': performer_ids[owner],
+                'records': [record_ids[record] for record in records]}
+
+    def create(self, kind, create, rows):
+        ids = []
+        for chunk in bulk.chunked(rows, self.chunk_size):
+            objects, errors = create(chunk, batch_size=self.chunk_size)
+            if errors:
+                shown = '\n'.join(errors[:20])
+                raise CommandError(f'{kind}: ошибок {len(errors)}, возможно, нужен другой --prefix\n{shown}')
+            ids.extend(obj.id for obj in objects)
+            self.stdout.write(f'{kind}: {len(ids)}')
+        return ids
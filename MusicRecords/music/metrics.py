@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_left
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(key, str(value).replace('\\', r'\\').replace('"', r'\"'))
+                     for key, value in labels)
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labels(key)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(key + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(key)} {total}')
+            lines.append(f'{self.name}_count{_labels(key)} {cumulative}')
+        return lines
+
+
+requests = Counter('music_graphql_requests_total', 'GraphQL requests by operation type')
+request_seconds = Histogram('music_graphql_request_seconds', 'GraphQL request execution time')
+resolve_seconds = Histogram('music_graphql_resolve_seconds', 'Resolver time by Type.field')
+sql_queries = Histogram('music_graphql_sql_queries', 'SQL statements per GraphQL request',
+                        buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+sql_seconds = Histogram('music_graphql_sql_seconds', 'Total SQL time per GraphQL request')
+n_plus_one = Counter('music_graphql_n_plus_one_total', 'Requests repeating one SQL shape too often')
+
+REGISTRY = [requests, request_seconds, resolve_seconds, sql_queries, sql_seconds, n_plus_one]
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    from music import cache, entities
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for name, value in sorted(cache.stats.items()):
+        lines.append(f'# TYPE music_query_cache_{name}_total counter')
+        lines.append(f'music_query_cache_{name}_total {value}')
+    for name, value in sorted(entities.entity_cache.stats.items()):
+        lines.append(f'# TYPE music_entity_cache_{name}_total counter')
+        lines.append(f'music_entity_cache_{name}_total {value}')
+    return '\n'.join(lines) + '\n'
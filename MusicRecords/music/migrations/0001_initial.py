@@ -0,0 +1,51 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Performer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('genre', models.CharField(max_length=100, null=True)),
+            ],
+            options={
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Records',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('year', models.IntegerField(null=True)),
+                ('performer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.performer')),
+            ],
+            options={
+                'ordering': ('title',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Songs',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=100)),
+                ('year', models.IntegerField(null=True)),
+                ('performer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='music.performer')),
+                ('records', models.ManyToManyField(blank=True, to='music.records')),
+            ],
+            options={
+                'ordering': ('title',),
+            },
+        ),
+    ]
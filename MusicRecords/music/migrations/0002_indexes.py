@@ -0,0 +1,41 @@
+# Generated by Django 4.1.13 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='performer',
+            index=models.Index(fields=['genre', 'name'], name='performer_genre_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='records',
+            index=models.Index(fields=['title', 'id'], name='records_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='records',
+            index=models.Index(fields=['year', 'title', 'id'], name='records_year_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='records',
+            index=models.Index(fields=['performer', 'title'], name='records_performer_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songs',
+            index=models.Index(fields=['title', 'id'], name='songs_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songs',
+            index=models.Index(fields=['year', 'title', 'id'], name='songs_year_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songs',
+            index=models.Index(fields=['performer', 'title'], name='songs_performer_title_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Expression indexes must match music.search._postgres_search exactly.
+INDEXED = [
+    ('music_performer', 'name'),
+    ('music_records', 'title'),
+    ('music_songs', 'title'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in INDEXED:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {table}_{column}_tsv_idx ON {table} "
+            f"USING GIN (to_tsvector('simple', {column}))"
+        )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx ON {table} USING GIN ({column} gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in INDEXED:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_tsv_idx')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0002_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
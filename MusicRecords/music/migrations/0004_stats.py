@@ -0,0 +1,63 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    from music.stats import rebuild
+
+    rebuild(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0003_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenreStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('genre', models.CharField(max_length=100, unique=True)),
+                ('performer_count', models.IntegerField(default=0)),
+                ('record_count', models.IntegerField(default=0)),
+                ('song_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('genre',),
+            },
+        ),
+        migrations.CreateModel(
+            name='PerformerStats',
+            fields=[
+                ('performer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='music.performer')),
+                ('song_count', models.IntegerField(default=0)),
+                ('record_count', models.IntegerField(default=0)),
+                ('first_year', models.IntegerField(null=True)),
+                ('last_year', models.IntegerField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecordStats',
+            fields=[
+                ('record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='music.records')),
+                ('track_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='YearStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField(unique=True)),
+                ('record_count', models.IntegerField(default=0)),
+                ('song_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('year',),
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.1.13 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+# Title prefix filters use LIKE 'prefix%', which a plain b-tree index only
+# serves under the "C" collation. Performer.name needs none: Django creates
+# a varchar_pattern_ops "_like" index for every unique CharField.
+PATTERN_INDEXED = [
+    ('music_records', 'title'),
+    ('music_songs', 'title'),
+]
+
+
+def create_pattern_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PATTERN_INDEXED:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_{column}_pattern_idx ON {table} ({column} varchar_pattern_ops)'
+        )
+
+
+def drop_pattern_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in PATTERN_INDEXED:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_pattern_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0005_change_log'),
+    ]
+
+    operations = [
+        # The id makes filtered pages walk the index in (title, id) order.
+        migrations.AddIndex(
+            model_name='records',
+            index=models.Index(fields=['performer', 'title', 'id'], name='records_performer_title_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='songs',
+            index=models.Index(fields=['performer', 'title', 'id'], name='songs_performer_title_id_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='records',
+            name='records_performer_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='songs',
+            name='songs_performer_title_idx',
+        ),
+        migrations.RunPython(create_pattern_indexes, drop_pattern_indexes),
+    ]
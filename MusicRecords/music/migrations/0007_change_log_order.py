@@ -0,0 +1,26 @@
+# Generated by Django 4.1.13 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0006_filters'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='changelog',
+            options={'ordering': ('transaction_id', 'id')},
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='transaction_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['transaction_id', 'id'], name='music_changelog_order_idx'),
+        ),
+    ]
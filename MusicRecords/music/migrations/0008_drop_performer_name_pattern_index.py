@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def drop_index(apps, schema_editor):
+    # 0006 used to create it; it duplicates Django's own _like index on
+    # the unique name.
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS music_performer_name_pattern_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('music', '0007_change_log_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_index, migrations.RunPython.noop),
+    ]
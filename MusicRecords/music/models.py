@@ -4,7 +4,17 @@ from django.db import models
 from django.db import models
 
 
-class Performer(models.Model):
+class Versioned(models.Model):
+    """Время и номер последнего изменения строки для инкрементальной синхронизации"""
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Raised once per transaction that changes the row, see music.changes
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        abstract = True
+
+
+class Performer(Versioned):
     """Исполнитель"""
     name = models.CharField(max_length=100, unique=True)
     genre = models.CharField(max_length=100, null=True)
@@ -14,9 +24,12 @@ class Performer(models.Model):
 
     class Meta:
         ordering = ('name',)
+        indexes = [
+            models.Index(fields=['genre', 'name'], name='performer_genre_name_idx'),
+        ]
 
 
-class Records(models.Model):
+class Records(Versioned):
     """Пластинки/АЛьбомы"""
     title = models.CharField(max_length=100)
     year = models.IntegerField(null=True)
@@ -27,9 +40,14 @@ class Records(models.Model):
 
     class Meta:
         ordering = ('title',)
+        indexes = [
+            models.Index(fields=['title', 'id'], name='records_title_id_idx'),
+            models.Index(fields=['year', 'title', 'id'], name='records_year_title_id_idx'),
+            models.Index(fields=['performer', 'title', 'id'], name='records_performer_title_id_idx'),
+        ]
 
 
-class Songs(models.Model):
+class Songs(Versioned):
     """Песни"""
     title = models.CharField(max_length=100)
     records = models.ManyToManyField(Records, blank=True)
@@ -41,3 +59,64 @@ class Songs(models.Model):
 
     class Meta:
         ordering = ('title',)
+        indexes = [
+            models.Index(fields=['title', 'id'], name='songs_title_id_idx'),
+            models.Index(fields=['year', 'title', 'id'], name='songs_year_title_id_idx'),
+            models.Index(fields=['performer', 'title', 'id'], name='songs_performer_title_id_idx'),
+        ]
+
+
+class PerformerStats(models.Model):
+    """Сводка по исполнителю: число песен и альбомов, годы"""
+    performer = models.OneToOneField(Performer, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    song_count = models.IntegerField(default=0)
+    record_count = models.IntegerField(default=0)
+    first_year = models.IntegerField(null=True)
+    last_year = models.IntegerField(null=True)
+
+
+class RecordStats(models.Model):
+    """Сводка по альбому: число песен"""
+    record = models.OneToOneField(Records, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    track_count = models.IntegerField(default=0)
+
+
+class GenreStats(models.Model):
+    """Сводка по жанру; исполнители без жанра учитываются с genre=''"""
+    genre = models.CharField(max_length=100, unique=True)
+    performer_count = models.IntegerField(default=0)
+    record_count = models.IntegerField(default=0)
+    song_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ('genre',)
+
+
+class YearStats(models.Model):
+    """Сводка по году выпуска"""
+    year = models.IntegerField(unique=True)
+    record_count = models.IntegerField(default=0)
+    song_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ('year',)
+
+
+class ChangeLog(models.Model):
+    """Журнал изменений каталога, только добавление"""
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTIONS = [(CREATE, CREATE), (UPDATE, UPDATE), (DELETE, DELETE)]
+
+    entity = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=6, choices=ACTIONS)
+    version = models.PositiveIntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    # 64-bit id of the writing transaction on PostgreSQL, 0 elsewhere
+    transaction_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ('transaction_id', 'id')
+        indexes = [models.Index(fields=['transaction_id', 'id'], name='music_changelog_order_idx')]
@@ -0,0 +1,85 @@
+from django.db.models import Prefetch
+from graphene.utils.str_converters import to_snake_case
+from graphql.language.ast import FragmentSpread, InlineFragment
+
+
+def collect_fields(selection_sets, fragments):
+    """Поля выборки с раскрытыми фрагментами: имя -> список вложенных выборок"""
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, FragmentSpread):
+                fragment = fragments[selection.name.value]
+                nested = collect_fields([fragment.selection_set], fragments)
+            elif isinstance(selection, InlineFragment):
+                nested = collect_fields([selection.selection_set], fragments)
+            else:
+                fields.setdefault(selection.name.value, []).append(selection.selection_set)
+                continue
+            for name, sets in nested.items():
+                fields.setdefault(name, []).extend(sets)
+    return fields
+
+
+def model_fields(model):
+    """Поля и связи модели по имени, под которым их показывает GraphQL"""
+    # GraphQL exposes forward fields by name and reverse relations by their
+    # accessor (``songs_set``), which is also what prefetch_related expects.
+    fields = {}
+    for field in model._meta.get_fields():
+        if field.auto_created and not field.concrete:
+            fields[field.get_accessor_name()] = field
+        else:
+            fields[field.name] = field
+    return fields
+
+
+def _plan(model, fields, fragments, prefix=''):
+    only, select, prefetch = [], [], []
+    fields_by_name = model_fields(model)
+    for name, selection_sets in fields.items():
+        field = fields_by_name.get(to_snake_case(name))
+        if field is None:
+            continue
+        if not field.is_relation:
+            only.append(prefix + field.name)
+            continue
+        nested = collect_fields(selection_sets, fragments)
+        if field.many_to_one:
+            path = prefix + field.name
+            only.append(path)
+            select.append(path)
+            sub_only, sub_select, sub_prefetch = _plan(field.related_model, nested, fragments, path + '__')
+            only.extend(sub_only)
+            select.extend(sub_select)
+            prefetch.extend(sub_prefetch)
+        else:
+            # The reverse foreign key is needed to attach rows to their owner.
+            required = (field.field.name,) if field.one_to_many else ()
+            queryset = _apply(field.related_model._default_manager.all(), nested, fragments, required)
+            prefetch.append(Prefetch(prefix + to_snake_case(name), queryset=queryset))
+    return only, select, prefetch
+
+
+def _apply(queryset, fields, fragments, required=()):
+    only, select, prefetch = _plan(queryset.model, fields, fragments)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset.only(*only, *required)
+
+
+def optimize(queryset, info, path=(), required=()):
+    """Добавляет select_related/prefetch_related/only по выборке запроса
+
+    ``path`` ведёт от поля резолвера к узлам модели, например
+    ``('edges', 'node')`` для connection-полей; ``required`` - поля,
+    которые нужно загрузить независимо от выборки.
+    """
+    selection_sets = [field.selection_set for field in info.field_asts]
+    for name in path:
+        selection_sets = collect_fields(selection_sets, info.fragments).get(name, [])
+    return _apply(queryset, collect_fields(selection_sets, info.fragments), info.fragments, required)
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+
+from django.db.models import Q
+from graphene import relay
+from graphene_django.settings import graphene_settings
+from graphql import GraphQLError
+
+from music import compact
+from music.optimizer import optimize
+
+
+def ordering_keys(model):
+    """Ключи keyset-пагинации: Meta.ordering модели и id для однозначности"""
+    keys = [key for key in model._meta.ordering if key.lstrip('-') not in ('id', 'pk')]
+    # A unique last key already orders rows totally, and keeping the cursor
+    # to that column lets the unique index serve the scan on its own.
+    if keys and model._meta.get_field(keys[-1].lstrip('-')).unique:
+        return keys
+    return keys + ['id']
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeError, ValueError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise GraphQLError(f'Некорректный курсор {cursor}')
+    return values
+
+
+def keyset_filter(keys, values):
+    # (k1, k2, ...) > (v1, v2, ...) spelled out so it works on every backend:
+    # k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...
+    condition = Q()
+    equal = Q()
+    for key, value in zip(keys, values):
+        name = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def paginate(connection_type, queryset, info, first=None, after=None):
+    """Страница connection-поля по курсору ``after`` длиной не больше RELAY_CONNECTION_MAX_LIMIT"""
+    max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+    if first is not None and first < 0:
+        raise GraphQLError('Аргумент first не может быть отрицательным')
+    limit = max_limit if first is None else min(first, max_limit)
+
+    keys = ordering_keys(queryset.model)
+    names = [key.lstrip('-') for key in keys]
+    queryset = queryset.order_by(*keys)
+    if after is not None:
+        queryset = queryset.filter(keyset_filter(keys, decode_cursor(after, len(keys))))
+
+    fields = compact.flat_fields(queryset.model, info, ('edges', 'node'))
+    if fields is not None:
+        rows = compact.page(queryset, fields, limit + 1)
+    else:
+        rows = list(optimize(queryset, info, ('edges', 'node'), required=names)[:limit + 1])
+    edges = [
+        connection_type.Edge(node=row, cursor=encode_cursor([getattr(row, name) for name in names]))
+        for row in rows[:limit]
+    ]
+    page_info = relay.PageInfo(
+        has_next_page=len(rows) > limit,
+        has_previous_page=after is not None,
+        start_cursor=edges[0].cursor if edges else None,
+        end_cursor=edges[-1].cursor if edges else None,
+    )
+    return connection_type(edges=edges, page_info=page_info)
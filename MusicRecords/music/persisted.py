@@ -0,0 +1,23 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = getattr(settings, 'MUSIC_PERSISTED_QUERIES', 'graphql')
+
+
+def query_hash(query):
+    return hashlib.sha256(query.encode()).hexdigest()
+
+
+def _key(sha256_hash):
+    return f'music:persisted:{sha256_hash}'
+
+
+def lookup(sha256_hash):
+    """Зарегистрированный текст запроса по sha256 или None"""
+    return caches[CACHE_ALIAS].get(_key(sha256_hash))
+
+
+def register(query):
+    caches[CACHE_ALIAS].set(_key(query_hash(query)), query, timeout=None)
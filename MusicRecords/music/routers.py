@@ -0,0 +1,107 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICAS = list(getattr(settings, 'MUSIC_DB_REPLICAS', []))
+# How long a client that has just written keeps reading from the primary,
+# covering the replication lag.
+REPLICA_LAG = getattr(settings, 'MUSIC_REPLICA_LAG', 5)
+PRIMARY_COOKIE = 'music_primary_until'
+
+_use_primary = ContextVar('music_use_primary', default=False)
+_request_state = ContextVar('music_request_state', default=None)
+
+
+class _RequestState:
+    wrote = False
+    replica = None
+
+
+@contextmanager
+def primary():
+    """Все чтения внутри блока идут в основную базу"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def is_pinned():
+    """Запрос закреплён за основной базой: клиент только что писал"""
+    return bool(REPLICAS) and _use_primary.get()
+
+
+def reads_from_primary():
+    """Чтения в текущем контексте идут в основную базу, а не в отстающую реплику"""
+    return not REPLICAS or _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+def cache_timeout(timeout):
+    """Сколько хранить в кеше прочитанное в текущем контексте"""
+    if reads_from_primary():
+        return timeout
+    # A replica may not have the write behind the current generation yet.
+    # Its rows are kept no longer than it may lag, so a cached copy is
+    # about as fresh as the replica itself; clients that have just written
+    # read from the primary and skip such entries.
+    return REPLICA_LAG if timeout is None else min(timeout, REPLICA_LAG)
+
+
+class ReplicaRouter:
+    """Чтение - с реплик, запись и чтение после записи - из основной базы"""
+
+    def db_for_read(self, model, **hints):
+        # Reads inside a transaction on the primary belong to it: they are
+        # checks that the transaction's writes depend on.
+        if reads_from_primary():
+            return DEFAULT_DB_ALIAS
+        # One replica per request, so it never mixes replicas that lag
+        # behind by different amounts.
+        state = _request_state.get()
+        if state is None:
+            return random.choice(REPLICAS)
+        if state.replica is None:
+            state.replica = random.choice(REPLICAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """Клиент, который только что писал, ещё REPLICA_LAG секунд читает из основной базы"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned = float(request.COOKIES.get(PRIMARY_COOKIE, 0)) > time.time()
+        except ValueError:
+            pinned = False
+        state = _RequestState()
+        state_token = _request_state.set(state)
+        primary_token = _use_primary.set(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(primary_token)
+            _request_state.reset(state_token)
+        if state.wrote and REPLICAS:
+            response.set_cookie(PRIMARY_COOKIE, str(time.time() + REPLICA_LAG), max_age=REPLICA_LAG,
+                                httponly=True, samesite='Lax')
+        return response
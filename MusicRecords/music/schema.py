@@ -1,41 +1,232 @@
 import graphene
+from django.db import transaction
+from graphene import relay
+from graphene_django.settings import graphene_settings
 from graphene_django.types import DjangoObjectType, ObjectType
 
 # Create a GraphQL type for the actor model
+from music import bulk, cache, changes, compact, entities, filters, search, subscriptions
 from music.errors import empty_name, exist
-from music.models import Performer, Records, Songs
+from music.loaders import get_loaders, prefetched
+from music.models import ChangeLog, GenreStats, Performer, PerformerStats, Records, RecordStats, Songs, YearStats
+from music.pagination import paginate
 
 
-class PerformerType(DjangoObjectType):
+class CompactRowType(DjangoObjectType):
+    """Тип модели, который принимает и строки music.compact"""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        return isinstance(root, compact.ROWS[cls._meta.model]) or super().is_type_of(root, info)
+
+
+class PerformerType(CompactRowType):
+    song_count = graphene.Int(required=True)
+    record_count = graphene.Int(required=True)
+    first_year = graphene.Int()
+    last_year = graphene.Int()
+
     class Meta:
         model = Performer
         # Create a GraphQL type for the movie model
 
+    def resolve_song_count(self, info):
+        return get_loaders(info).performer_stats.load(self.id).then(lambda stats: stats.song_count)
+
+    def resolve_record_count(self, info):
+        return get_loaders(info).performer_stats.load(self.id).then(lambda stats: stats.record_count)
+
+    def resolve_first_year(self, info):
+        return get_loaders(info).performer_stats.load(self.id).then(lambda stats: stats.first_year)
+
+    def resolve_last_year(self, info):
+        return get_loaders(info).performer_stats.load(self.id).then(lambda stats: stats.last_year)
+
+    def resolve_records_set(self, info):
+        records = prefetched(self, 'records_set')
+        if records is not None:
+            return records
+        return get_loaders(info).records_by_performer.load(self.id)
+
+    def resolve_songs_set(self, info):
+        songs = prefetched(self, 'songs_set')
+        if songs is not None:
+            return songs
+        return get_loaders(info).songs_by_performer.load(self.id)
+
+
+class RecordType(CompactRowType):
+    track_count = graphene.Int(required=True)
 
-class RecordType(DjangoObjectType):
     class Meta:
         model = Records
 
+    def resolve_track_count(self, info):
+        return get_loaders(info).record_stats.load(self.id).then(lambda stats: stats.track_count)
+
+    def resolve_performer(self, info):
+        if isinstance(self, compact.Row):
+            return self.performer or get_loaders(info).performer.load(self.performer_id)
+        if Records.performer.is_cached(self):
+            return self.performer
+        return get_loaders(info).performer.load(self.performer_id)
+
+    def resolve_songs_set(self, info):
+        songs = prefetched(self, 'songs')
+        if songs is not None:
+            return songs
+        return get_loaders(info).songs_by_record.load(self.id)
+
 
-class SongType(DjangoObjectType):
+class SongType(CompactRowType):
     class Meta:
         model = Songs
 
+    def resolve_performer(self, info):
+        if isinstance(self, compact.Row):
+            return self.performer or get_loaders(info).performer.load(self.performer_id)
+        if Songs.performer.is_cached(self):
+            return self.performer
+        return get_loaders(info).performer.load(self.performer_id)
+
+    def resolve_records(self, info):
+        records = self.records if isinstance(self, compact.Row) else prefetched(self, 'records')
+        if records is not None:
+            return records
+        return get_loaders(info).records_by_song.load(self.id)
+
+
+# Summary table fields are cached against the summary tables, which change
+# with every song and record, rather than against their owners.
+cache.register_field_models('PerformerType', ('songCount', 'recordCount', 'firstYear', 'lastYear'), PerformerStats)
+cache.register_field_models('RecordType', ('trackCount',), RecordStats)
+cache.register_field_models('Query', ('catalogStats',), GenreStats, YearStats)
+# New entries become visible as time passes, with no write to signal it.
+cache.uncacheable_fields.add(('Query', 'changes'))
+
+
+class PerformerConnection(relay.Connection):
+    class Meta:
+        node = PerformerType
+
+
+class RecordConnection(relay.Connection):
+    class Meta:
+        node = RecordType
+
+
+class SongConnection(relay.Connection):
+    class Meta:
+        node = SongType
+
+
+class StatsGroup(graphene.Enum):
+    GENRE = 'genre'
+    YEAR = 'year'
+
+
+class CatalogStatsType(ObjectType):
+    """Итоги по жанру или году"""
+    genre = graphene.String()
+    year = graphene.Int()
+    performer_count = graphene.Int()
+    record_count = graphene.Int(required=True)
+    song_count = graphene.Int(required=True)
+
+
+class CatalogItem(graphene.Union):
+    class Meta:
+        types = (PerformerType, RecordType, SongType)
+
+
+class SearchResult(ObjectType):
+    rank = graphene.Float(required=True)
+    item = graphene.Field(CatalogItem, required=True)
+
+
+class SearchKind(graphene.Enum):
+    PERFORMER = 'performer'
+    RECORD = 'record'
+    SONG = 'song'
+
+
+SEARCH_MODELS = {'performer': Performer, 'record': Records, 'song': Songs}
+
+
+class ChangeType(DjangoObjectType):
+    """Запись журнала изменений"""
+    item = graphene.Field(CatalogItem, description='Текущее состояние объекта; null, если он удалён')
+
+    class Meta:
+        model = ChangeLog
+        fields = ('entity', 'object_id', 'action', 'version', 'changed_at')
+
+    def resolve_item(self, info):
+        loaders = get_loaders(info)
+        loader = {'performer': loaders.performer, 'record': loaders.record, 'song': loaders.song}[self.entity]
+        return loader.load(self.object_id)
+
+
+class ChangeConnection(relay.Connection):
+    class Meta:
+        node = ChangeType
+
+
+class IntRange(graphene.InputObjectType):
+    """Диапазон чисел, обе границы включительно"""
+    gte = graphene.Int()
+    lte = graphene.Int()
+
+
+class PerformerFilter(graphene.InputObjectType):
+    """Условия отбора исполнителей, все условия должны выполняться одновременно"""
+    id_in = graphene.List(graphene.NonNull(graphene.Int))
+    name = graphene.String()
+    name_prefix = graphene.String(description='Имя начинается с этой строки')
+    genre = graphene.String()
+    genre_in = graphene.List(graphene.NonNull(graphene.String))
+
+
+class RecordFilter(graphene.InputObjectType):
+    """Условия отбора альбомов, все условия должны выполняться одновременно"""
+    id_in = graphene.List(graphene.NonNull(graphene.Int))
+    title = graphene.String()
+    title_prefix = graphene.String(description='Название начинается с этой строки')
+    year = graphene.Int()
+    year_range = IntRange()
+    performer = graphene.Int(description='id исполнителя')
+    performer_in = graphene.List(graphene.NonNull(graphene.Int))
+
+
+class SongFilter(RecordFilter):
+    """Условия отбора песен, все условия должны выполняться одновременно"""
+    record = graphene.Int(description='id альбома, на котором есть песня')
+    record_in = graphene.List(graphene.NonNull(graphene.Int))
+
 
 class Query(ObjectType):
     performer = graphene.Field(PerformerType, id=graphene.Int())
     record = graphene.Field(RecordType, id=graphene.Int())
     song = graphene.Field(SongType, id=graphene.Int())
-    performers = graphene.List(PerformerType, name=graphene.String(), genre=graphene.String())
-    records = graphene.List(RecordType, title=graphene.String(), year=graphene.Int())
-    songs = graphene.List(SongType, title=graphene.String(), year=graphene.Int())
+    performers = graphene.Field(PerformerConnection, name=graphene.String(), genre=graphene.String(),
+                                filter=PerformerFilter(), first=graphene.Int(), after=graphene.String())
+    records = graphene.Field(RecordConnection, title=graphene.String(), year=graphene.Int(),
+                             filter=RecordFilter(), first=graphene.Int(), after=graphene.String())
+    songs = graphene.Field(SongConnection, title=graphene.String(), year=graphene.Int(),
+                           filter=SongFilter(), first=graphene.Int(), after=graphene.String())
+    search = graphene.List(graphene.NonNull(SearchResult), query=graphene.String(required=True),
+                           types=graphene.List(graphene.NonNull(SearchKind)), first=graphene.Int())
+    changes = graphene.Field(ChangeConnection, since=graphene.String(), first=graphene.Int())
+    catalog_stats = graphene.List(graphene.NonNull(CatalogStatsType), group_by=StatsGroup(required=True))
 
     def resolve_performer(self, info, **kwargs):
-        info = 'Исполнитель'
         id = kwargs.get('id')
 
         if id is not None:
-            return Performer.objects.get(pk=id)
+            return entities.get(Performer, id)
 
         return None
 
@@ -43,49 +234,50 @@ class Query(ObjectType):
         id = kwargs.get('id')
 
         if id is not None:
-            return Records.objects.get(pk=id)
+            return entities.get(Records, id)
         return None
 
     def resolve_song(self, info, **kwargs):
         id = kwargs.get('id')
 
         if id is not None:
-            return Songs.objects.get(pk=id)
+            return entities.get(Songs, id)
 
         return None
 
-    def resolve_performers(self, info, **kwargs):
-        name = kwargs.get('name')
-        genre = kwargs.get('genre')
-        if name is not None and genre is None:
-            return Performer.objects.filter(name=name)
-        elif genre is not None and name is None:
-            return Performer.objects.filter(genre=genre)
-        elif name is not None and genre is not None:
-            return Performer.objects.filter(name=name, genre=genre)
-        return Performer.objects.all()
-
-    def resolve_records(self, info, **kwargs):
-        title = kwargs.get('title')
-        year = kwargs.get('year')
-        if title is not None and year is None:
-            return Records.objects.filter(title=title)
-        elif year is not None and title is None:
-            return Records.objects.filter(year=year)
-        elif title is not None and year is not None:
-            return Records.objects.filter(title=title, year=year)
-        return Records.objects.all()
-
-    def resolve_songs(self, info, **kwargs):
-        title = kwargs.get('title')
-        year = kwargs.get('year')
-        if title is not None and year is None:
-            return Songs.objects.filter(title=title)
-        elif year is not None and title is None:
-            return Songs.objects.filter(year=year)
-        elif title is not None and year is not None:
-            return Songs.objects.filter(title=title, year=year)
-        return Songs.objects.all()
+    def resolve_performers(self, info, first=None, after=None, filter=None, **kwargs):
+        performers = filters.apply(Performer.objects.all(), kwargs, filter or {})
+        return paginate(PerformerConnection, performers, info, first, after)
+
+    def resolve_records(self, info, first=None, after=None, filter=None, **kwargs):
+        records = filters.apply(Records.objects.all(), kwargs, filter or {})
+        return paginate(RecordConnection, records, info, first, after)
+
+    def resolve_songs(self, info, first=None, after=None, filter=None, **kwargs):
+        songs = filters.apply(Songs.objects.all(), kwargs, filter or {})
+        return paginate(SongConnection, songs, info, first, after)
+
+    def resolve_search(self, info, query, types=None, first=None):
+        max_limit = graphene_settings.RELAY_CONNECTION_MAX_LIMIT
+        limit = max_limit if first is None else min(max(first, 0), max_limit)
+        models = [SEARCH_MODELS[kind] for kind in types or SEARCH_MODELS]
+        return [SearchResult(rank=rank, item=item) for rank, item in search.search(query, models, limit)]
+
+    def resolve_changes(self, info, since=None, first=None):
+        # ``since`` is the end cursor of the previous pull.
+        return paginate(ChangeConnection, changes.visible(), info, first, since)
+
+    def resolve_catalog_stats(self, info, group_by):
+        if group_by == StatsGroup.GENRE.value:
+            return [
+                CatalogStatsType(genre=row.genre or None, performer_count=row.performer_count,
+                                 record_count=row.record_count, song_count=row.song_count)
+                for row in GenreStats.objects.exclude(performer_count=0, record_count=0, song_count=0)
+            ]
+        return [
+            CatalogStatsType(year=row.year, record_count=row.record_count, song_count=row.song_count)
+            for row in YearStats.objects.exclude(record_count=0, song_count=0)
+        ]
 
 
 
@@ -147,33 +339,24 @@ class UpdatePerformer(graphene.Mutation):
     def mutate(root, info, id, params=None):
         errors = []
         ok = False
-        performer_exist = False
-        performers = Performer.objects.all()
-        if performers is None:
-            errors.append(f'Исполнителя с id {id} не существует')
-        else:
-            for performer in performers:
-                if performer.id == id:
-                    performer_true = True
-
-        if Performer.objects.filter(name=params.id).exclude(id=id).exists():
-            errors.append(f'Исполнителя с id {id} не существует')
-            return UpdateSong(errors=errors, ok=ok, song=None)
         if not params.name:
             errors.append(f'Название {empty_name}')
         if not params.genre:
             errors.append(f'Жанр {empty_name}')
-        if Performer.objects.filter(name=params.name).exclude(id=id).exists():
-            errors.append(f'Исполнитель с таким названием {params.name} {exist}')
-        performer_instance = Performer.objects.get(pk=id)
-        if not errors:
-            ok = True
-            performer_instance.name = params.name
-            performer_instance.genre = params.genre
-            performer_instance.save()
-            return UpdatePerformer(ok=ok, errors=errors, performer=performer_instance)
-        else:
-            return UpdatePerformer(errors=errors, performer=None)
+        with transaction.atomic():
+            performer_instance = Performer.objects.select_for_update().filter(pk=id).first()
+            if performer_instance is None:
+                errors.append(f'Исполнителя с id {id} не существует')
+                return UpdatePerformer(errors=errors, ok=ok, performer=None)
+            if params.name and Performer.objects.filter(name=params.name).exclude(id=id).exists():
+                errors.append(f'Исполнитель с таким названием {params.name} {exist}')
+            if not errors:
+                ok = True
+                performer_instance.name = params.name
+                performer_instance.genre = params.genre
+                performer_instance.save()
+                return UpdatePerformer(ok=ok, errors=errors, performer=performer_instance)
+        return UpdatePerformer(errors=errors, ok=ok, performer=None)
 
 
 class CreateRecord(graphene.Mutation):
@@ -224,39 +407,29 @@ class UpdateRecord(graphene.Mutation):
     def mutate(root, info, id, params=None):
         ok = False
         errors = []
-        record_exist = False
-        records = Records.objects.all()
-        if records is None:
-            errors.append(f'Альбома с id {id} не существует')
-        else:
-            for record in records:
-                if record.id == id:
-                    record_true = True
-        #
-        # if record_exist is False:
-        #     errors.append(f'Песни с id {id} не существует')
-        #     return UpdateSong(errors=errors, ok=ok, song=None)
-        if Records.objects.filter(title=params.title, performer=params.performer).exclude(id=id).exists():
-            errors.append(f'Альбом {params.title} уже есть у исполнителя с id {params.performer}')
-
-        elif params.performer is None:
-            errors.append(f'Исполнитель должен быть указан')
+        with transaction.atomic():
+            record_instance = Records.objects.select_for_update().filter(pk=id).first()
+            if record_instance is None:
+                errors.append(f'Альбома с id {id} не существует')
+                return UpdateRecord(errors=errors, ok=ok, record=None)
+            if Records.objects.filter(title=params.title, performer=params.performer).exclude(id=id).exists():
+                errors.append(f'Альбом {params.title} уже есть у исполнителя с id {params.performer}')
+
+            elif params.performer is None:
+                errors.append(f'Исполнитель должен быть указан')
 
-        elif not Performer.objects.filter(id=params.performer).exists():
-            errors.append(f'Исполнитель с id {params.performer} не существует')
+            elif not Performer.objects.filter(id=params.performer).exists():
+                errors.append(f'Исполнитель с id {params.performer} не существует')
 
-        if not errors:
-            record_instance = Records.objects.get(pk=id)
-            performer_obj = Performer.objects.filter(pk=params.performer).get()
-            ok = True
-            record_instance.title = params.title
-            record_instance.year = params.year
-            record_instance.performer_id = performer_obj.id
+            if not errors:
+                ok = True
+                record_instance.title = params.title
+                record_instance.year = params.year
+                record_instance.performer_id = params.performer
 
-            record_instance.save()
-            return UpdateRecord(ok=ok, errors=errors, record=record_instance)
-        else:
-            return UpdateRecord(errors=errors, ok=ok, record=None)
+                record_instance.save()
+                return UpdateRecord(ok=ok, errors=errors, record=record_instance)
+        return UpdateRecord(errors=errors, ok=ok, record=None)
 
 
 class CreateSong(graphene.Mutation):
@@ -271,33 +444,26 @@ class CreateSong(graphene.Mutation):
     def mutate(root, info, params=None):
         ok = False
         errors = []
-        records = []
         if params.performer is None:
             errors.append(f'Исполнитель должен быть указан')
         elif not Performer.objects.filter(id=params.performer).exists():
             errors.append(f'Исполнитель с id {params.performer} не существует')
-        if params.records is not None:
-            for record_params in params.records:
-                if not Records.objects.filter(id=record_params.id).exists():
-                    errors.append(f'Альбом с id {record_params} не существует')
+        records = bulk.existing_ids(Records, map(bulk.to_id, bulk.record_ids(params)))
+        for record_params in params.records or []:
+            if bulk.to_id(record_params.id) not in records:
+                errors.append(f'Альбом с id {record_params} не существует')
         if Songs.objects.filter(title=params.title, performer=params.performer).exists():
             errors.append(f'Песня {params.title} уже есть у исполнителя с id {params.performer}')
         if not errors:
-            performer_obj = Performer.objects.filter(pk=params.performer).get()
-            if params.records is not None:
-
-                for record_params in params.records:
-                    record = Records.objects.get(pk=record_params.id)
-                    records.append(record)
             ok = True
-            song_instance = Songs(
-                title=params.title,
-                year=params.year,
-                performer_id=performer_obj.id,
-
-            )
-            song_instance.save()
-            song_instance.records.set(records)
+            with transaction.atomic():
+                song_instance = Songs(
+                    title=params.title,
+                    year=params.year,
+                    performer_id=params.performer,
+                )
+                song_instance.save()
+                song_instance.records.add(*records)
 
             return CreateSong(ok=ok, errors=errors, song=song_instance)
         else:
@@ -318,46 +484,124 @@ class UpdateSong(graphene.Mutation):
         ok = False
         errors = []
 
-        song_instance = Songs.objects.get(pk=id)
-        if song_instance:
-            ok = False
-            errors = []
-            records = []
-            if params.performer is None:
-                errors.append(f'Исполнитель должен быть указан')
-            elif not Performer.objects.filter(id=params.performer).exists():
-                errors.append(f'Исполнитель с id {params.performer} не существует')
-            if params.records is not None:
-                for record_params in params.records:
-                    if not Records.objects.filter(id=record_params.id).exists():
-                        errors.append(f'Альбом с id {record_params.id} не существует')
-            if Songs.objects.filter(title=params.title, performer=params.performer).exclude(id=id).exists():
-                errors.append(f'Песня {params.title} уже есть у исполнителя с id {params.performer}')
-        else:
-            song_exist = False
-            if song_exist is False:
-                errors.append(f'Песни с id {id} не существует')
-                return UpdateSong(errors=errors, ok=ok, song=None)
+        song_instance = Songs.objects.filter(pk=id).first()
+        if song_instance is None:
+            errors.append(f'Песни с id {id} не существует')
+            return UpdateSong(errors=errors, ok=ok, song=None)
+        if params.performer is None:
+            errors.append(f'Исполнитель должен быть указан')
+        elif not Performer.objects.filter(id=params.performer).exists():
+            errors.append(f'Исполнитель с id {params.performer} не существует')
+        records = bulk.existing_ids(Records, map(bulk.to_id, bulk.record_ids(params)))
+        for record_params in params.records or []:
+            if bulk.to_id(record_params.id) not in records:
+                errors.append(f'Альбом с id {record_params.id} не существует')
+        if Songs.objects.filter(title=params.title, performer=params.performer).exclude(id=id).exists():
+            errors.append(f'Песня {params.title} уже есть у исполнителя с id {params.performer}')
         if not errors:
-            performer_obj = Performer.objects.filter(pk=params.performer).get()
-            if params.records is not None:
-
-                for record_params in params.records:
-                    record = Records.objects.get(pk=record_params.id)
-                    records.append(record)
             ok = True
-            song_instance.title = params.title
-            song_instance.year = params.year
-            song_instance.performer_id = performer_obj.id
-
-            song_instance.save()
-            song_instance.records.set(records)
+            with transaction.atomic():
+                song_instance.title = params.title
+                song_instance.year = params.year
+                song_instance.performer_id = params.performer
+                song_instance.save()
+                song_instance.records.set(records)
 
             return UpdateSong(ok=ok, errors=errors, song=song_instance)
         else:
             return UpdateSong(errors=errors, ok=ok, song=None)
 
 
+class BulkCreatePerformers(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(PerformerParams), required=True)
+
+    ok = graphene.Boolean()
+    performers = graphene.List(PerformerType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            performers, errors = bulk.create_performers(params)
+        return BulkCreatePerformers(ok=not errors, errors=errors, performers=performers or None)
+
+
+class BulkCreateRecords(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(RecordParams), required=True)
+
+    ok = graphene.Boolean()
+    records = graphene.List(RecordType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            records, errors = bulk.create_records(params)
+        return BulkCreateRecords(ok=not errors, errors=errors, records=records or None)
+
+
+class BulkCreateSongs(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(SongParams), required=True)
+
+    ok = graphene.Boolean()
+    songs = graphene.List(SongType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            songs, errors = bulk.create_songs(params)
+        return BulkCreateSongs(ok=not errors, errors=errors, songs=songs or None)
+
+
+class BulkUpdatePerformers(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(PerformerParams), required=True)
+
+    ok = graphene.Boolean()
+    performers = graphene.List(PerformerType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            performers, errors = bulk.update_performers(params)
+        return BulkUpdatePerformers(ok=not errors, errors=errors, performers=performers or None)
+
+
+class BulkUpdateRecords(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(RecordParams), required=True)
+
+    ok = graphene.Boolean()
+    records = graphene.List(RecordType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            records, errors = bulk.update_records(params)
+        return BulkUpdateRecords(ok=not errors, errors=errors, records=records or None)
+
+
+class BulkUpdateSongs(graphene.Mutation):
+    class Arguments:
+        params = graphene.List(graphene.NonNull(SongParams), required=True)
+
+    ok = graphene.Boolean()
+    songs = graphene.List(SongType)
+    errors = graphene.List(graphene.String, required=True)
+
+    @staticmethod
+    def mutate(root, info, params):
+        with transaction.atomic():
+            songs, errors = bulk.update_songs(params)
+        return BulkUpdateSongs(ok=not errors, errors=errors, songs=songs or None)
+
+
 class Mutation(graphene.ObjectType):
     create_performer = CreatePerformer.Field()
     update_performer = UpdatePerformer.Field()
@@ -365,6 +609,29 @@ class Mutation(graphene.ObjectType):
     update_record = UpdateRecord.Field()
     create_song = CreateSong.Field()
     update_song = UpdateSong.Field()
+    bulk_create_performers = BulkCreatePerformers.Field()
+    bulk_create_records = BulkCreateRecords.Field()
+    bulk_create_songs = BulkCreateSongs.Field()
+    bulk_update_performers = BulkUpdatePerformers.Field()
+    bulk_update_records = BulkUpdateRecords.Field()
+    bulk_update_songs = BulkUpdateSongs.Field()
+
+
+class Subscription(ObjectType):
+    """События каталога по WebSocket; аргументы отбирают объекты, о которых сообщать"""
+    song_created = graphene.Field(SongType, performer=graphene.Int())
+    song_updated = graphene.Field(SongType, id=graphene.Int(), performer=graphene.Int())
+    record_updated = graphene.Field(RecordType, id=graphene.Int(), performer=graphene.Int())
+    performer_updated = graphene.Field(PerformerType, id=graphene.Int())
+
+    def resolve_song_created(self, info, **filters):
+        return subscriptions.subscribe(info, 'songCreated', filters)
+
+    def resolve_song_updated(self, info, **filters):
+        return subscriptions.subscribe(info, 'songUpdated', filters)
 
+    def resolve_record_updated(self, info, **filters):
+        return subscriptions.subscribe(info, 'recordUpdated', filters)
 
-schema = graphene.Schema(query=Query, mutation=Mutation)
+    def resolve_performer_updated(self, info, **filters):
+        return subscriptions.subscribe(info, 'performerUpdated', filters)
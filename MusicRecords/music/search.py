@@ -0,0 +1,185 @@
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.db import connection
+from django.db.models import Case, F, Func, Q, Value, When
+
+from music.models import Performer, Records, Songs
+
+# The searched column of every model; Postgres indexes exactly these
+# expressions (see migration 0003_search).
+SEARCH_FIELDS = {Performer: 'name', Records: 'title', Songs: 'title'}
+
+# Text search configuration without stemming: titles and names are in
+# several languages, and prefix matching matters more than word forms.
+TEXT_SEARCH_CONFIG = 'simple'
+
+# Same default as pg_trgm.similarity_threshold.
+SIMILARITY_THRESHOLD = 0.3
+
+# Ranks of a matched word: equal, a prefix of a longer word, or only
+# similar. Similarity is scaled down because pg_trgm rates e.g. "s1999"
+# and "s19999" as identical, and a typo must not outrank an exact match.
+EXACT_RANK = 1.0
+PREFIX_RANK = 0.75
+FUZZY_WEIGHT = 0.5
+
+_WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return _WORD.findall((text or '').lower())
+
+
+def trigrams(word):
+    # pg_trgm pads every word with two spaces in front and one behind.
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def search(query, models, limit):
+    """Объекты моделей, подходящие под запрос, по убыванию ранга: [(ранг, объект)]"""
+    if not tokenize(query) or limit <= 0:
+        return []
+    if connection.vendor == 'postgresql':
+        found = [pair for model in models for pair in _postgres_search(model, query, limit)]
+    else:
+        found = [pair for model in models for pair in index_for(model).search(query, limit)]
+    found.sort(key=lambda pair: (-pair[0], type(pair[1]).__name__, pair[1].pk))
+    return found[:limit]
+
+
+def _postgres_search(model, query, limit):
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramSimilarity
+    from django.db.models.functions import Greatest
+
+    field = SEARCH_FIELDS[model]
+    # Spelled like the expression index, so the planner can use it.
+    document = Func(F(field), template=f"to_tsvector('{TEXT_SEARCH_CONFIG}', %(expressions)s)",
+                    output_field=SearchVectorField())
+    # Every word may be the beginning of a longer one: "bohem rhap" finds
+    # "Bohemian Rhapsody". Tokens are \w+ only, so the raw syntax is safe.
+    tsquery = SearchQuery(' & '.join(f'{token}:*' for token in tokenize(query)),
+                          search_type='raw', config=TEXT_SEARCH_CONFIG)
+    matched = Case(
+        When(**{f'{field}__iexact': query}, then=Value(EXACT_RANK)),
+        When(Q(document=tsquery), then=Value(PREFIX_RANK)),
+        default=Value(0.0),
+    )
+    queryset = (
+        model.objects.alias(document=document, similarity=TrigramSimilarity(field, query))
+        .filter(Q(document=tsquery) | Q(TrigramSimilar(F(field), query)))
+        .annotate(rank=Greatest(matched, F('similarity') * FUZZY_WEIGHT))
+        .order_by('-rank', '-similarity', 'pk')[:limit]
+    )
+    return [(row.rank, row) for row in queryset]
+
+
+class InvertedIndex:
+    """Инвертированный индекс одного поля модели в памяти процесса
+
+    Замена индексам Postgres для SQLite: строится при первом поиске и
+    поддерживается сигналами сохранения и удаления.
+    """
+
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.built = False
+        self.documents = {}
+        self.postings = {}
+        self.vocabulary = []
+        self.trigram_postings = {}
+        self.trigram_sizes = {}
+        self._lock = threading.RLock()
+
+    def build(self):
+        with self._lock:
+            if self.built:
+                return
+            for id, text in self.model.objects.values_list('id', self.field).iterator():
+                self._add(id, text)
+            self.built = True
+
+    def update(self, id, text):
+        with self._lock:
+            # An index that is not built yet reads the table when it is.
+            if self.built:
+                self._remove(id)
+                self._add(id, text)
+
+    def remove(self, id):
+        with self._lock:
+            if self.built:
+                self._remove(id)
+
+    def _add(self, id, text):
+        tokens = set(tokenize(text))
+        self.documents[id] = tokens
+        for token in tokens:
+            if token not in self.postings:
+                self.postings[token] = set()
+                insort(self.vocabulary, token)
+                self.trigram_sizes[token] = len(trigrams(token))
+                for trigram in trigrams(token):
+                    self.trigram_postings.setdefault(trigram, set()).add(token)
+            self.postings[token].add(id)
+
+    def _remove(self, id):
+        for token in self.documents.pop(id, ()):
+            ids = self.postings[token]
+            ids.discard(id)
+            if ids:
+                continue
+            del self.postings[token]
+            del self.vocabulary[bisect_left(self.vocabulary, token)]
+            del self.trigram_sizes[token]
+            for trigram in trigrams(token):
+                self.trigram_postings[trigram].discard(token)
+
+    def matches(self, word):
+        """Слова индекса, подходящие под слово запроса, с их рангом"""
+        word_trigrams = trigrams(word)
+        shared = Counter()
+        for trigram in word_trigrams:
+            shared.update(self.trigram_postings.get(trigram, ()))
+        found = {}
+        for token, count in shared.items():
+            similarity = count / (len(word_trigrams) + self.trigram_sizes[token] - count)
+            if similarity >= SIMILARITY_THRESHOLD:
+                found[token] = similarity * FUZZY_WEIGHT
+        position = bisect_left(self.vocabulary, word)
+        while position < len(self.vocabulary) and self.vocabulary[position].startswith(word):
+            token = self.vocabulary[position]
+            found[token] = max(found.get(token, 0), PREFIX_RANK)
+            position += 1
+        if word in self.postings:
+            found[word] = EXACT_RANK
+        return found
+
+    def search(self, query, limit):
+        self.build()
+        words = tokenize(query)
+        ranks = {}
+        with self._lock:
+            for word in words:
+                best = {}
+                for token, score in self.matches(word).items():
+                    for id in self.postings[token]:
+                        if score > best.get(id, 0):
+                            best[id] = score
+                for id, score in best.items():
+                    ranks[id] = ranks.get(id, 0) + score
+        top = sorted(ranks.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+        objects = self.model.objects.in_bulk([id for id, _ in top])
+        return [(rank / len(words), objects[id]) for id, rank in top if id in objects]
+
+
+_indexes = {model: InvertedIndex(model, field) for model, field in SEARCH_FIELDS.items()}
+
+
+def index_for(model):
+    return _indexes[model]
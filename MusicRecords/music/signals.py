@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from music import cache, search
+from music.models import Performer, Records, Songs
+
+# Sent by bulk operations that bypass post_save/m2m_changed (bulk_create,
+# bulk_update) with ``sender`` set to the model class, or to the
+# Songs.records through model, ``objects`` to the rows touched and
+# ``created`` telling inserted rows from updated ones. Updates also pass
+# ``previous``, {id: {field: old value}} for the fields summaries depend
+# on, and removed through rows are sent with ``deleted=True``.
+bulk_changed = Signal()
+
+
+def invalidate(*models):
+    # Bump after commit, so no reader can cache pre-commit data under the new
+    # generation.
+    for model in models:
+        transaction.on_commit(lambda label=model._meta.label: cache.bump_generation(label))
+
+
+@receiver(post_save, sender=Performer)
+@receiver(post_save, sender=Records)
+@receiver(post_save, sender=Songs)
+@receiver(post_delete, sender=Performer)
+@receiver(post_delete, sender=Records)
+@receiver(post_delete, sender=Songs)
+def invalidate_model(sender, **kwargs):
+    invalidate(sender)
+
+
+@receiver(m2m_changed, sender=Songs.records.through)
+def invalidate_song_records(sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate(Songs, Records)
+
+
+@receiver(bulk_changed)
+def invalidate_bulk(sender, **kwargs):
+    if sender is Songs.records.through:
+        invalidate(Songs, Records)
+    else:
+        invalidate(sender)
+
+
+def _reindex(model, objects, deleted=False):
+    index = search.index_for(model)
+    field = search.SEARCH_FIELDS[model]
+    rows = [(obj.pk, getattr(obj, field)) for obj in objects]
+
+    def apply():
+        for id, text in rows:
+            if deleted:
+                index.remove(id)
+            else:
+                index.update(id, text)
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_save, sender=Performer)
+@receiver(post_save, sender=Records)
+@receiver(post_save, sender=Songs)
+def reindex_saved(sender, instance, **kwargs):
+    _reindex(sender, [instance])
+
+
+@receiver(post_delete, sender=Performer)
+@receiver(post_delete, sender=Records)
+@receiver(post_delete, sender=Songs)
+def reindex_deleted(sender, instance, **kwargs):
+    _reindex(sender, [instance], deleted=True)
+
+
+@receiver(bulk_changed)
+def reindex_bulk(sender, objects=(), **kwargs):
+    if sender in search.SEARCH_FIELDS:
+        _reindex(sender, objects)
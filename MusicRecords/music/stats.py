@@ -0,0 +1,415 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, Max, Min
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from music.bulk import CHUNK_SIZE, chunked
+from music.models import GenreStats, Performer, PerformerStats, Records, RecordStats, Songs, YearStats
+from music.signals import bulk_changed, invalidate
+
+logger = logging.getLogger(__name__)
+
+SongRecords = Songs.records.through
+
+# Locked and written in this order, keys sorted within a model, so two
+# transactions touching the same rows can never wait on each other in a
+# cycle.
+STATS_MODELS = (PerformerStats, RecordStats, GenreStats, YearStats)
+KEYS = {PerformerStats: 'performer_id', RecordStats: 'record_id', GenreStats: 'genre', YearStats: 'year'}
+# Rows of these exist for every owner, not only once counted.
+OWNERS = {PerformerStats: Performer, RecordStats: Records}
+
+
+def genre_key(genre):
+    return genre or ''
+
+
+def performer_years(performer_id):
+    years = [
+        model.objects.filter(performer_id=performer_id).aggregate(first=Min('year'), last=Max('year'))
+        for model in (Songs, Records)
+    ]
+    firsts = [item['first'] for item in years if item['first'] is not None]
+    lasts = [item['last'] for item in years if item['last'] is not None]
+    return {'first_year': min(firsts, default=None), 'last_year': max(lasts, default=None)}
+
+
+class _PendingStats:
+    """Изменения сводок одной транзакции; применяются одним шагом после её фиксации
+
+    Счётчики копятся в памяти, а строки сводок блокируются и пишутся один
+    раз на транзакцию, в коротком отдельном блоке: горячие строки жанров и
+    годов не держатся заблокированными, пока идёт вся транзакция записи.
+    """
+
+    def __init__(self):
+        self.deltas = {model: defaultdict(Counter) for model in STATS_MODELS}
+        self.owned = {model: set() for model in OWNERS}
+        # performer id -> [first added year, last added year] / removed years
+        self.added_years = {}
+        self.removed_years = defaultdict(set)
+        self.genres = {}
+
+    def bump(self, model, key, **deltas):
+        self.deltas[model][key].update(deltas)
+
+    def own(self, model, key):
+        # The owner was created by this transaction, so its row is new.
+        self.owned[model].add(key)
+
+    def disown(self, model, key):
+        self.owned[model].discard(key)
+
+    def performer_genres(self, performer_ids):
+        """Жанры исполнителей с учётом изменений этой транзакции"""
+        missing = sorted({id for id in performer_ids if id not in self.genres})
+        for chunk in chunked(missing):
+            found = dict(Performer.objects.filter(pk__in=chunk).values_list('id', 'genre'))
+            for id in chunk:
+                self.genres[id] = genre_key(found.get(id))
+        return {id: self.genres[id] for id in performer_ids}
+
+    def add_years(self, performer_id, first, last):
+        if first is None:
+            return
+        known = self.added_years.get(performer_id)
+        self.added_years[performer_id] = [first, last] if known is None else [min(known[0], first),
+                                                                               max(known[1], last)]
+
+    def count_row(self, count_field, performer_id, year, delta):
+        genre = self.performer_genres([performer_id])[performer_id]
+        self.bump(PerformerStats, performer_id, **{count_field: delta})
+        self.bump(GenreStats, genre, **{count_field: delta})
+        if year is not None:
+            self.bump(YearStats, year, **{count_field: delta})
+            if delta > 0:
+                self.add_years(performer_id, year, year)
+            else:
+                self.removed_years[performer_id].add(year)
+
+    def move_genre(self, performer_id, old, new):
+        if genre_key(old) == genre_key(new):
+            return False
+        # Everything the performer has moves to the new genre: what is
+        # committed plus what this transaction has counted so far.
+        stats = PerformerStats.objects.filter(performer_id=performer_id).values('record_count', 'song_count').first()
+        pending = self.deltas[PerformerStats].get(performer_id, {})
+        counts = {'performer_count': 1}
+        for name in ('record_count', 'song_count'):
+            counts[name] = (stats[name] if stats else 0) + pending.get(name, 0)
+        self.bump(GenreStats, genre_key(old), **{name: -value for name, value in counts.items()})
+        self.bump(GenreStats, genre_key(new), **counts)
+        self.genres[performer_id] = genre_key(new)
+        return True
+
+    def __call__(self):
+        _local.pending = None
+        try:
+            with transaction.atomic():
+                applied = [self._apply(model) for model in STATS_MODELS]
+                if any(applied):
+                    invalidate(*STATS_MODELS)
+        except Exception:
+            # The write itself has committed; failing its request now would
+            # only make the client retry it.
+            logger.exception('Не удалось обновить сводки, пересчитайте их командой rebuild_stats')
+
+    def _apply(self, model):
+        field = KEYS[model]
+        deltas = {key: {name: delta for name, delta in counter.items() if delta}
+                  for key, counter in self.deltas[model].items()}
+        owned = sorted(self.owned.get(model, ()))
+        if owned:
+            model.objects.bulk_create([model(**{field: key}) for key in owned], batch_size=CHUNK_SIZE,
+                                      ignore_conflicts=True)
+        keys = {key for key, changes in deltas.items() if changes}
+        if model is PerformerStats:
+            keys |= set(self.added_years) | set(self.removed_years)
+        if not keys:
+            return bool(owned)
+        rows = self._lock(model, field, sorted(keys))
+        # A row is created on first increment only: decrements also arrive
+        # while a cascade deletes the row itself.
+        missing = [key for key in sorted(keys)
+                   if key not in rows and any(delta > 0 for delta in deltas.get(key, {}).values())]
+        if missing and model in OWNERS:
+            owners = set()
+            for chunk in chunked(missing):
+                owners.update(OWNERS[model].objects.filter(pk__in=chunk).values_list('pk', flat=True))
+            missing = [key for key in missing if key in owners]
+        if missing:
+            model.objects.bulk_create([model(**{field: key}) for key in missing], batch_size=CHUNK_SIZE,
+                                      ignore_conflicts=True)
+            rows.update(self._lock(model, field, missing))
+
+        changed, fields = [], set()
+        for key in sorted(rows):
+            row, row_fields = rows[key], set()
+            for name, delta in deltas.get(key, {}).items():
+                setattr(row, name, getattr(row, name) + delta)
+                row_fields.add(name)
+            if model is PerformerStats:
+                row_fields |= self._apply_years(row)
+            if row_fields:
+                changed.append(row)
+                fields |= row_fields
+        if changed:
+            model.objects.bulk_update(changed, sorted(fields), batch_size=CHUNK_SIZE)
+        return bool(owned or changed or missing)
+
+    @staticmethod
+    def _lock(model, field, keys):
+        rows = {}
+        for chunk in chunked(keys):
+            locked = model.objects.select_for_update().filter(**{f'{field}__in': chunk}).order_by(field)
+            rows.update((getattr(row, field), row) for row in locked)
+        return rows
+
+    def _apply_years(self, row):
+        performer_id = row.performer_id
+        before = (row.first_year, row.last_year)
+        # Only a removed year on the boundary of the range can narrow it, and
+        # then the performer's remaining rows have to be looked at.
+        if before[0] is not None and self.removed_years.get(performer_id, set()) & set(before):
+            years = performer_years(performer_id)
+            row.first_year, row.last_year = years['first_year'], years['last_year']
+        elif performer_id in self.added_years:
+            first, last = self.added_years[performer_id]
+            row.first_year = first if row.first_year is None else min(row.first_year, first)
+            row.last_year = last if row.last_year is None else max(row.last_year, last)
+        return {'first_year', 'last_year'} if (row.first_year, row.last_year) != before else set()
+
+
+_local = threading.local()
+
+
+@contextmanager
+def _pending_stats():
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        pending = _PendingStats()
+        yield pending
+        pending()
+        return
+    pending = getattr(_local, 'pending', None)
+    # A rollback drops the callback, and the counted changes with it.
+    if pending is None or not any(item[1] is pending for item in connection.run_on_commit):
+        pending = _PendingStats()
+        _local.pending = pending
+        transaction.on_commit(pending)
+    yield pending
+
+
+def _remember_old(sender, instance, fields):
+    instance._stats_old = None
+    if instance.pk is not None:
+        instance._stats_old = sender.objects.filter(pk=instance.pk).values(*fields).first()
+
+
+@receiver(pre_save, sender=Songs)
+@receiver(pre_save, sender=Records)
+def remember_catalog_row(sender, instance, **kwargs):
+    _remember_old(sender, instance, ('performer_id', 'year'))
+
+
+@receiver(post_save, sender=Songs)
+@receiver(post_save, sender=Records)
+def count_saved_row(sender, instance, created, **kwargs):
+    count_field = 'song_count' if sender is Songs else 'record_count'
+    old = getattr(instance, '_stats_old', None)
+    if old is not None and (old['performer_id'], old['year']) == (instance.performer_id, instance.year):
+        return
+    with _pending_stats() as pending:
+        if created and sender is Records:
+            pending.own(RecordStats, instance.pk)
+        if old is not None:
+            pending.count_row(count_field, old['performer_id'], old['year'], -1)
+        pending.count_row(count_field, instance.performer_id, instance.year, 1)
+
+
+@receiver(pre_delete, sender=Songs)
+def remember_song_records(sender, instance, **kwargs):
+    # The through rows go away without signals of their own.
+    instance._stats_records = list(
+        SongRecords.objects.filter(songs_id=instance.pk).values_list('records_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Songs)
+@receiver(post_delete, sender=Records)
+def count_deleted_row(sender, instance, **kwargs):
+    count_field = 'song_count' if sender is Songs else 'record_count'
+    with _pending_stats() as pending:
+        if sender is Records:
+            pending.disown(RecordStats, instance.pk)
+        pending.count_row(count_field, instance.performer_id, instance.year, -1)
+        for record_id in getattr(instance, '_stats_records', ()):
+            pending.bump(RecordStats, record_id, track_count=-1)
+
+
+@receiver(pre_save, sender=Performer)
+def remember_performer(sender, instance, **kwargs):
+    _remember_old(sender, instance, ('genre',))
+
+
+@receiver(post_save, sender=Performer)
+def count_saved_performer(sender, instance, created, **kwargs):
+    old = getattr(instance, '_stats_old', None)
+    if not created and (old is None or genre_key(old['genre']) == genre_key(instance.genre)):
+        return
+    with _pending_stats() as pending:
+        if created:
+            pending.own(PerformerStats, instance.pk)
+            pending.bump(GenreStats, genre_key(instance.genre), performer_count=1)
+            pending.genres[instance.pk] = genre_key(instance.genre)
+        else:
+            pending.move_genre(instance.pk, old['genre'], instance.genre)
+
+
+@receiver(post_delete, sender=Performer)
+def count_deleted_performer(sender, instance, **kwargs):
+    # Songs and records of the performer were deleted, and counted, before.
+    with _pending_stats() as pending:
+        pending.disown(PerformerStats, instance.pk)
+        pending.bump(GenreStats, genre_key(instance.genre), performer_count=-1)
+
+
+def _count_links(pending, pairs, delta):
+    for record_id, count in Counter(record_id for _, record_id in pairs).items():
+        pending.bump(RecordStats, record_id, track_count=count * delta)
+
+
+@receiver(m2m_changed, sender=SongRecords)
+def count_song_records(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._stats_links = [
+                (song_id, instance.pk)
+                for song_id in SongRecords.objects.filter(records_id=instance.pk).values_list('songs_id', flat=True)
+            ]
+        else:
+            instance._stats_links = [
+                (instance.pk, record_id)
+                for record_id in SongRecords.objects.filter(songs_id=instance.pk).values_list('records_id', flat=True)
+            ]
+    elif action == 'post_clear':
+        with _pending_stats() as pending:
+            _count_links(pending, getattr(instance, '_stats_links', ()), -1)
+    elif action in ('post_add', 'post_remove') and pk_set:
+        pairs = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set]
+        with _pending_stats() as pending:
+            _count_links(pending, pairs, 1 if action == 'post_add' else -1)
+
+
+@receiver(bulk_changed)
+def count_bulk_updated(sender, objects=(), created=True, previous=None, deleted=False, **kwargs):
+    if sender is SongRecords and deleted:
+        with _pending_stats() as pending:
+            _count_links(pending, [(link.songs_id, link.records_id) for link in objects], -1)
+    if created or deleted or not previous or sender not in (Performer, Songs, Records):
+        return
+    with _pending_stats() as pending:
+        if sender is Performer:
+            for obj in objects:
+                pending.move_genre(obj.pk, previous[obj.pk]['genre'], obj.genre)
+            return
+        count_field = 'song_count' if sender is Songs else 'record_count'
+        moved = [obj for obj in objects
+                 if (previous[obj.pk]['performer_id'], previous[obj.pk]['year']) != (obj.performer_id, obj.year)]
+        pending.performer_genres({previous[obj.pk]['performer_id'] for obj in moved}
+                                 | {obj.performer_id for obj in moved})
+        for obj in moved:
+            old = previous[obj.pk]
+            pending.count_row(count_field, old['performer_id'], old['year'], -1)
+            pending.count_row(count_field, obj.performer_id, obj.year, 1)
+
+
+@receiver(bulk_changed)
+def count_bulk_created(sender, objects=(), created=True, **kwargs):
+    if not created or not objects or sender not in (SongRecords, Performer, Songs, Records):
+        return
+    with _pending_stats() as pending:
+        if sender is SongRecords:
+            _count_links(pending, [(link.songs_id, link.records_id) for link in objects], 1)
+        elif sender is Performer:
+            for obj in objects:
+                pending.own(PerformerStats, obj.pk)
+                pending.genres[obj.pk] = genre_key(obj.genre)
+            for genre, count in Counter(genre_key(obj.genre) for obj in objects).items():
+                pending.bump(GenreStats, genre, performer_count=count)
+        else:
+            count_field = 'song_count' if sender is Songs else 'record_count'
+            genres = pending.performer_genres({obj.performer_id for obj in objects})
+            for obj in objects:
+                if sender is Records:
+                    pending.own(RecordStats, obj.pk)
+                pending.add_years(obj.performer_id, obj.year, obj.year)
+            for performer_id, count in Counter(obj.performer_id for obj in objects).items():
+                pending.bump(PerformerStats, performer_id, **{count_field: count})
+            for genre, count in Counter(genres[obj.performer_id] for obj in objects).items():
+                pending.bump(GenreStats, genre, **{count_field: count})
+            for year, count in Counter(obj.year for obj in objects if obj.year is not None).items():
+                pending.bump(YearStats, year, **{count_field: count})
+
+
+def rebuild(apps=global_apps, batch_size=1000):
+    """Пересчитывает все сводные таблицы по каталогу"""
+    model = lambda name: apps.get_model('music', name)  # noqa: E731
+    performer, records, songs = model('Performer'), model('Records'), model('Songs')
+    song_records = songs.records.through
+
+    with transaction.atomic():
+        for name in ('PerformerStats', 'RecordStats', 'GenreStats', 'YearStats'):
+            model(name).objects.all().delete()
+
+        per_performer = defaultdict(dict)
+        for source, count_field in ((songs, 'song_count'), (records, 'record_count')):
+            rows = source.objects.order_by().values('performer_id').annotate(
+                count=Count('id'), first=Min('year'), last=Max('year'))
+            for row in rows.iterator():
+                stats = per_performer[row['performer_id']]
+                stats[count_field] = row['count']
+                if row['first'] is not None:
+                    stats['first_year'] = min(row['first'], stats.get('first_year', row['first']))
+                    stats['last_year'] = max(row['last'], stats.get('last_year', row['last']))
+        model('PerformerStats').objects.bulk_create(
+            (model('PerformerStats')(performer_id=id, **per_performer.get(id, {}))
+             for id in performer.objects.values_list('id', flat=True).iterator()),
+            batch_size=batch_size,
+        )
+
+        tracks = dict(song_records.objects.order_by().values('records_id').annotate(count=Count('id'))
+                      .values_list('records_id', 'count').iterator())
+        model('RecordStats').objects.bulk_create(
+            (model('RecordStats')(record_id=id, track_count=tracks.get(id, 0))
+             for id in records.objects.values_list('id', flat=True).iterator()),
+            batch_size=batch_size,
+        )
+
+        genres = defaultdict(dict)
+        for source, count_field, genre in ((performer, 'performer_count', 'genre'),
+                                           (records, 'record_count', 'performer__genre'),
+                                           (songs, 'song_count', 'performer__genre')):
+            for value, count in source.objects.order_by().values(genre).annotate(count=Count('id')).values_list(
+                    genre, 'count'):
+                key = genre_key(value)
+                genres[key][count_field] = genres[key].get(count_field, 0) + count
+        model('GenreStats').objects.bulk_create(
+            [model('GenreStats')(genre=genre, **counts) for genre, counts in genres.items()], batch_size=batch_size,
+        )
+
+        years = defaultdict(dict)
+        for source, count_field in ((songs, 'song_count'), (records, 'record_count')):
+            rows = source.objects.order_by().filter(year__isnull=False).values('year').annotate(count=Count('id'))
+            for row in rows:
+                years[row['year']][count_field] = row['count']
+        model('YearStats').objects.bulk_create(
+            [model('YearStats')(year=year, **counts) for year, counts in years.items()], batch_size=batch_size,
+        )
+        invalidate(*STATS_MODELS)
@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+
+from django.conf import settings
+from django.dispatch import receiver
+from graphql import GraphQLError
+from graphql.error import format_error
+from graphql.execution import ExecutionResult
+from promise import Promise, is_thenable
+from rx import Observable
+from rx.subjects import Subject
+
+from music import changes
+from music.async_execution import database_sync_to_async
+from music.backend import document_backend
+from music.broker import Subscriber, get_broker
+from music.models import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+# subscriptions-transport-ws, the protocol of GraphiQL and Apollo's
+# WebSocketLink.
+PROTOCOL = 'graphql-ws'
+KEEPALIVE = getattr(settings, 'MUSIC_SUBSCRIPTION_KEEPALIVE', 30)
+MAX_OPERATIONS = getattr(settings, 'MUSIC_SUBSCRIPTION_MAX_OPERATIONS', 100)
+
+# (entity, action) of a change log entry -> subscription event.
+EVENTS = {
+    ('song', ChangeLog.CREATE): 'songCreated',
+    ('song', ChangeLog.UPDATE): 'songUpdated',
+    ('record', ChangeLog.UPDATE): 'recordUpdated',
+    ('performer', ChangeLog.UPDATE): 'performerUpdated',
+}
+
+
+@receiver(changes.committed)
+def publish_changes(sender, entries=(), **kwargs):
+    # Every write path - mutations, bulk operations, admin, link changes -
+    # ends up in the change log, so events come from there. The write has
+    # committed by now; a broken backend must not turn it into an error.
+    messages = [(EVENTS[(entry.entity, entry.action)], entry.object_id)
+                for entry in entries if (entry.entity, entry.action) in EVENTS]
+    if not messages:
+        return
+    try:
+        get_broker().publish(messages)
+    except Exception:
+        logger.exception('Не удалось опубликовать события %s', messages)
+
+
+class OperationContext:
+    """Контекст одной операции subscription: резолверы корневых полей подписываются через него"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.subscribers = []
+        self.subject = Subject()
+
+    def subscribe(self, event, filters):
+        subscriber = Subscriber(event, filters, self.connection.loop, self.connection.wake)
+        self.subscribers.append(subscriber)
+        get_broker().subscribe(subscriber)
+        return self.subject
+
+    def close(self):
+        for subscriber in self.subscribers:
+            get_broker().unsubscribe(subscriber)
+        self.subscribers = []
+
+
+def subscribe(info, event, filters):
+    """Observable объектов события ``event``, подходящих под ``filters``"""
+    if not isinstance(info.context, OperationContext):
+        raise GraphQLError('Подписки доступны только по WebSocket')
+    return info.context.subscribe(event, filters)
+
+
+class Operation:
+    def __init__(self, context, observable):
+        self.context = context
+        self.results = []
+        self.subscription = observable.subscribe(on_next=self.results.append)
+
+    def take(self):
+        """Накопленные объекты подписчиков операции и число отброшенных"""
+        objects, dropped = [], 0
+        for subscriber in self.context.subscribers:
+            taken, lost = subscriber.take()
+            objects.extend(taken)
+            dropped += lost
+        return objects, dropped
+
+    def emit(self, objects, dropped):
+        # In a worker thread: the selection set of every object runs here and
+        # may query the database through the DataLoaders.
+        payloads = []
+        if dropped:
+            payloads.append({'data': None, 'errors': [
+                {'message': f'Пропущено объектов: {dropped}, клиент не успевает читать события'},
+            ]})
+        for obj in objects:
+            # Fresh loaders for every object: their cache must not serve an
+            # earlier state.
+            self.context.music_loaders = None
+            self.context.subject.on_next(obj)
+        results, self.results[:] = list(self.results), []
+        payloads.extend(_payload(result) for result in results)
+        return payloads
+
+    def close(self):
+        self.subscription.dispose()
+        self.context.close()
+
+
+def _payload(result):
+    data, errors = {}, list(result.errors or [])
+    for name, value in (result.data or {}).items():
+        if is_thenable(value):
+            try:
+                value = Promise.resolve(value).get()
+            except Exception as error:
+                errors.append(error)
+                value = None
+        data[name] = value
+    payload = {'data': data}
+    if errors:
+        payload['errors'] = [format_error(error) for error in errors]
+    return payload
+
+
+class Connection:
+    """Одно WebSocket-соединение по протоколу graphql-ws
+
+    На соединение приходится одна задача, которая спит, пока подписчикам
+    соединения нечего отправлять; операции сами задач и потоков не держат.
+    Пока клиент медленно читает, новые события копятся в ограниченных
+    буферах подписчиков.
+    """
+
+    def __init__(self, scope, receive, send):
+        self.scope = scope
+        self.receive = receive
+        self._send = send
+        self.loop = None
+        self.operations = {}
+        self.ready = asyncio.Event()
+
+    def wake(self):
+        self.ready.set()
+
+    async def send(self, type, id=None, payload=None):
+        message = {'type': type}
+        if id is not None:
+            message['id'] = id
+        if payload is not None:
+            message['payload'] = payload
+        await self._send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        if (await self.receive())['type'] != 'websocket.connect':
+            return
+        if PROTOCOL not in self.scope.get('subprotocols', []):
+            await self._send({'type': 'websocket.close', 'code': 4406})
+            return
+        await self._send({'type': 'websocket.accept', 'subprotocol': PROTOCOL})
+        pump = asyncio.create_task(self.pump())
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if not await self.handle(message.get('text') or message.get('bytes') or ''):
+                    await self._send({'type': 'websocket.close', 'code': 1000})
+                    break
+        finally:
+            pump.cancel()
+            operations, self.operations = list(self.operations.values()), {}
+            for operation in operations:
+                operation.close()
+
+    async def handle(self, text):
+        try:
+            message = json.loads(text)
+            type, id, payload = message.get('type'), message.get('id'), message.get('payload') or {}
+        except (ValueError, AttributeError):
+            await self.send('error', payload={'message': 'Сообщение должно быть JSON-объектом'})
+            return True
+        if type == 'connection_init':
+            await self.send('connection_ack')
+            await self.send('ka')
+        elif type == 'start':
+            await self.start(id, payload)
+        elif type == 'stop':
+            operation = self.operations.pop(id, None)
+            if operation is not None:
+                operation.close()
+            await self.send('complete', id)
+        elif type == 'connection_terminate':
+            return False
+        else:
+            await self.send('error', id, {'message': f'Неизвестный тип сообщения {type}'})
+        return True
+
+    async def start(self, id, payload):
+        previous = self.operations.pop(id, None)
+        if previous is not None:
+            previous.close()
+        if len(self.operations) >= MAX_OPERATIONS:
+            await self.send('error', id, {'message': f'Не больше {MAX_OPERATIONS} подписок на соединение'})
+            return
+        context = OperationContext(self)
+        result = await database_sync_to_async(self.execute)(context, payload)
+        if isinstance(result, Observable):
+            self.operations[id] = Operation(context, result)
+            # Events may have arrived while the operation was being set up.
+            self.wake()
+            return
+        # A subscription that failed to start.
+        context.close()
+        if result.invalid:
+            await self.send('error', id, {'errors': [format_error(error) for error in result.errors]})
+            return
+        await self.send('data', id, _payload(result))
+        await self.send('complete', id)
+
+    def execute(self, context, payload):
+        from MusicRecords.schema import schema
+
+        try:
+            document = document_backend.document_from_string(schema, payload.get('query') or '')
+            operation_type = document.get_operation_type(payload.get('operationName'))
+        except Exception as error:
+            return ExecutionResult(errors=[error], invalid=True)
+        # Queries and mutations go over HTTP: the view pins writes to the
+        # primary, sets the read-your-writes cookie and is behind CSRF, and
+        # the handshake here checks none of that.
+        if operation_type != 'subscription':
+            return ExecutionResult(errors=[GraphQLError('По WebSocket доступны только подписки')], invalid=True)
+        return document.execute(
+            context_value=context,
+            variable_values=payload.get('variables'),
+            operation_name=payload.get('operationName'),
+            allow_subscriptions=True,
+        )
+
+    async def pump(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.ready.wait(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                await self.send('ka')
+                continue
+            self.ready.clear()
+            # Buffers are emptied here, on the loop that fills them.
+            batch = [(id, operation, *operation.take()) for id, operation in list(self.operations.items())]
+            for id, operation, objects, dropped in batch:
+                if objects or dropped:
+                    for payload in await database_sync_to_async(operation.emit)(objects, dropped):
+                        await self.send('data', id, payload)
+
+
+async def websocket_application(scope, receive, send):
+    """ASGI-приложение для WebSocket-подписок"""
+    await Connection(scope, receive, send).run()
@@ -1,3 +1,651 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from music import bulk, cache, changes, complexity, dedupe, entities, routers, stats, tracing
+from music.models import ChangeLog, GenreStats, Performer, PerformerStats, Records, RecordStats, Songs, YearStats
+from music.pagination import encode_cursor
+
+STATS_TABLES = {
+    PerformerStats: ('performer_id', 'song_count', 'record_count', 'first_year', 'last_year'),
+    RecordStats: ('record_id', 'track_count'),
+    GenreStats: ('genre', 'performer_count', 'record_count', 'song_count'),
+    YearStats: ('year', 'record_count', 'song_count'),
+}
+
+
+def reset_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+    entities.entity_cache.clear()
+
+
+def seed(performers=3, records=4, songs=12):
+    """Небольшой каталог: у каждого исполнителя альбомы, у каждой песни альбом"""
+    performer_rows = [Performer.objects.create(name=f'Performer {i}', genre='rock' if i % 2 else 'jazz')
+                      for i in range(performers)]
+    record_rows = [Records.objects.create(title=f'Record {i}', year=1970 + i % 3,
+                                          performer=performer_rows[i % performers]) for i in range(records)]
+    song_rows = []
+    for i in range(songs):
+        song = Songs.objects.create(title=f'Song {i:02}', year=1970 + i % 4, performer=performer_rows[i % performers])
+        song.records.add(record_rows[i % records])
+        song_rows.append(song)
+    return performer_rows, record_rows, song_rows
+
+
+class CommittingTestCase(TransactionTestCase):
+    """Тесты, которым нужны фиксации транзакций"""
+    # Outside a transaction reads go to the replicas configured in settings,
+    # which read the test database (TEST MIRROR).
+    databases = '__all__'
+
+
+class GraphQLTestMixin:
+    client_class = Client
+
+    def setUp(self):
+        super().setUp()
+        reset_caches()
+        # Validation reads table sizes once per ROW_ESTIMATES_TTL; reading
+        # them here keeps those statements out of the counted ones.
+        complexity._row_estimates['expires'] = 0
+        complexity.row_estimates()
+
+    def post(self, query, variables=None, client=None):
+        response = (client or self.client).post('/graphql/', {'query': query, 'variables': variables or {}},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertNotIn('errors', data)
+        return data['data']
+
+    def stats_rows(self):
+        # Genre and year rows left at zero by the signals are absent after a
+        # rebuild; catalogStats skips both alike.
+        return {model: sorted(row for row in model.objects.values_list(*fields)
+                              if model not in (GenreStats, YearStats) or any(row[1:]))
+                for model, fields in STATS_TABLES.items()}
+
+    def assertStatsRebuilt(self):
+        # The counters kept by the signals match a full recount.
+        kept = self.stats_rows()
+        stats.rebuild()
+        rebuilt = self.stats_rows()
+        for model in STATS_TABLES:
+            self.assertEqual(kept[model], rebuilt[model], model.__name__)
+
+
+class QueryCountTests(GraphQLTestMixin, TestCase):
+    """Вложенные запросы: число SQL-запросов не зависит от числа строк"""
+
+    SONGS = '{ songs(first: %d) { edges { node { title performer { name } records { title performer { name } } } } } }'
+    PERFORMERS = ('{ performers(first: %d) { edges { node { name recordsSet { title songsSet { title } } '
+                  'songsSet { title records { title } } } } } }')
+
+    def setUp(self):
+        super().setUp()
+        seed(performers=6, records=12, songs=40)
+
+    def count(self, query):
+        with CaptureQueriesContext(connection) as captured:
+            self.post(query)
+        return len(captured)
+
+    def test_songs_page_does_not_grow_with_page_size(self):
+        small = self.count(self.SONGS % 5)
+        self.assertEqual(self.count(self.SONGS % 40), small)
+        with self.assertNumQueries(small):
+            self.post(self.SONGS % 20)
+
+    def test_performers_page_does_not_grow_with_page_size(self):
+        small = self.count(self.PERFORMERS % 2)
+        self.assertEqual(self.count(self.PERFORMERS % 6), small)
+
+    def test_single_objects(self):
+        song = Songs.objects.first()
+        with self.assertNumQueries(4):
+            self.post('query($id: Int) { song(id: $id) { title performer { name } records { title } } }',
+                      {'id': song.id})
+
+    def test_update_does_not_scan_the_table(self):
+        performer = Performer.objects.first()
+        record = Records.objects.filter(performer=performer).first()
+        update_performer = ('mutation($id: Int!, $name: String) '
+                            '{ updatePerformer(id: $id, params: {name: $name, genre: "rock"}) { ok errors } }')
+        update_record = ('mutation($id: Int!, $title: String, $performer: Int) '
+                         '{ updateRecord(id: $id, params: {title: $title, performer: $performer, year: 2000}) '
+                         '{ ok errors } }')
+
+        def counts(i):
+            return (self.count_mutation(update_performer, {'id': performer.id, 'name': performer.name}),
+                    self.count_mutation(update_record, {'id': record.id, 'title': f'Edit {i}',
+                                                        'performer': performer.id}))
+
+        # The first round moves the rows to another genre and year; later
+        # ones only rename.
+        counts(0)
+        before = counts(1)
+        Performer.objects.bulk_create(Performer(name=f'Filler {i}') for i in range(500))
+        Records.objects.bulk_create(Records(title=f'Filler {i}', performer=performer) for i in range(500))
+        self.assertEqual(counts(2), before)
+
+    def count_mutation(self, query, variables):
+        with CaptureQueriesContext(connection) as captured:
+            data = self.post(query, variables)
+        payload = next(iter(data.values()))
+        self.assertTrue(payload['ok'], payload['errors'])
+        return len(captured)
+
+
+class QueryPlanTests(TestCase):
+    def test_resolvers_use_indexes(self):
+        call_command('check_query_plans', stdout=io.StringIO())
+
+
+class QueryCostTests(GraphQLTestMixin, TestCase):
+    def test_estimates_never_count_rows(self):
+        complexity._row_estimates['expires'] = 0
+        with CaptureQueriesContext(connection) as captured:
+            rows = complexity.row_estimates()
+        self.assertFalse([item['sql'] for item in captured if 'COUNT(' in item['sql'].upper()])
+        if connection.vendor != 'postgresql':
+            self.assertEqual(rows[Songs._meta.db_table], complexity.DEFAULT_ROW_ESTIMATES[Songs._meta.db_table])
+
+    def test_expensive_query_is_rejected_before_execution(self):
+        query = ('{ performers(first: 100) { edges { node { songsSet { records { songsSet { title } } } } } } }')
+        with self.assertNumQueries(0):
+            response = self.client.post('/graphql/', {'query': query}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('стоимости', response.json()['errors'][0]['message'])
+
+
+class PaginationTests(GraphQLTestMixin, TestCase):
+    PAGE = ('query($first: Int, $after: String) { songs(first: $first, after: $after) '
+            '{ edges { cursor node { id title } } pageInfo { hasNextPage hasPreviousPage startCursor endCursor } } }')
+
+    def setUp(self):
+        super().setUp()
+        performer = Performer.objects.create(name='Performer', genre='rock')
+        # Equal titles are ordered by id, so no row is skipped or repeated
+        # on a page boundary between them.
+        for title in ['B', 'A', 'B', 'C', 'B', 'A', 'D']:
+            Songs.objects.create(title=title, performer=performer)
+
+    def page(self, first, after=None):
+        return self.post(self.PAGE, {'first': first, 'after': after})['songs']
+
+    def test_walk_returns_every_row_once_in_order(self):
+        expected = list(Songs.objects.order_by('title', 'id').values_list('id', flat=True))
+        seen, after, pages = [], None, 0
+        while True:
+            page = self.page(2, after)
+            seen.extend(int(edge['node']['id']) for edge in page['edges'])
+            self.assertEqual(page['pageInfo']['hasPreviousPage'], after is not None)
+            pages += 1
+            if not page['pageInfo']['hasNextPage']:
+                break
+            after = page['pageInfo']['endCursor']
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 4)
+
+    def test_exact_last_page_has_no_next_page(self):
+        page = self.page(7)
+        self.assertEqual(len(page['edges']), 7)
+        self.assertFalse(page['pageInfo']['hasNextPage'])
+
+    def test_cursor_after_last_row_gives_empty_page(self):
+        last = self.page(7)['pageInfo']['endCursor']
+        page = self.page(3, last)
+        self.assertEqual(page['edges'], [])
+        self.assertFalse(page['pageInfo']['hasNextPage'])
+        self.assertIsNone(page['pageInfo']['startCursor'])
+        self.assertIsNone(page['pageInfo']['endCursor'])
+
+    def test_first_zero(self):
+        page = self.page(0)
+        self.assertEqual(page['edges'], [])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+    def test_page_size_is_capped(self):
+        with mock.patch('graphene_django.settings.graphene_settings.RELAY_CONNECTION_MAX_LIMIT', 3):
+            page = self.page(100)
+        self.assertEqual(len(page['edges']), 3)
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+
+    def test_invalid_arguments(self):
+        for variables in ({'first': -1}, {'first': 2, 'after': 'not a cursor'}):
+            with self.assertLogs('graphql.execution.utils', 'ERROR'):
+                response = self.client.post('/graphql/', {'query': self.PAGE, 'variables': variables},
+                                            content_type='application/json')
+            self.assertIn('errors', response.json())
+
+
+class StatsTests(GraphQLTestMixin, CommittingTestCase):
+    """Сводные таблицы, которые ведут сигналы, совпадают с полным пересчётом"""
+
+    def test_single_row_writes(self):
+        performers, records, songs = seed()
+        song = songs[0]
+        song.year, song.performer = 1999, performers[1]
+        song.save()
+        song.records.set([records[1], records[2]])
+        records[0].year = None
+        records[0].save()
+        performers[0].genre = 'pop'
+        performers[0].save()
+        songs[1].delete()
+        records[3].delete()
+        performers[2].delete()
+        self.assertStatsRebuilt()
+
+    def test_mutations(self):
+        performers, records, songs = seed()
+        self.post('mutation($id: Int!, $performer: Int, $record: ID) { updateSong(id: $id, params: '
+                  '{title: "Moved", performer: $performer, year: 2001, records: [{id: $record}]}) { ok } }',
+                  {'id': songs[0].id, 'performer': performers[1].id, 'record': records[1].id})
+        self.post('mutation($id: Int!) { updatePerformer(id: $id, params: {name: "Renamed", genre: "pop"}) { ok } }',
+                  {'id': performers[0].id})
+        self.assertStatsRebuilt()
+
+    def test_bulk_operations(self):
+        performers, records, songs = seed()
+        created, errors = bulk.create_songs([{'title': f'Bulk {i}', 'performer': performers[i % 3].id,
+                                              'year': 1980 + i, 'records': [{'id': records[0].id}]}
+                                             for i in range(5)])
+        self.assertEqual(errors, [])
+        changed, errors = bulk.update_songs([{'id': song.id, 'title': song.title, 'performer': performers[0].id,
+                                              'year': 1990, 'records': [{'id': records[2].id}]}
+                                             for song in created[:3]])
+        self.assertEqual(errors, [])
+        changed, errors = bulk.update_performers([{'id': performers[1].id, 'name': 'Bulk renamed',
+                                                   'genre': 'blues'}])
+        self.assertEqual(errors, [])
+        self.assertStatsRebuilt()
+
+
+    def test_one_transaction(self):
+        performers, records, songs = seed()
+        with transaction.atomic():
+            song = Songs.objects.create(title='New', year=1985, performer=performers[0])
+            song.records.add(records[0], records[1])
+            # The genre changes after the song was counted under the old one.
+            performers[0].genre = 'pop'
+            performers[0].save()
+            passing = Performer.objects.create(name='Passing', genre='jazz')
+            Songs.objects.create(title='Passing song', year=1990, performer=passing)
+            passing.delete()
+            record = Records.objects.create(title='Passing record', performer=performers[1])
+            record.delete()
+            songs[2].year = 1960
+            songs[2].save()
+            # Summary rows are written once the transaction commits, so
+            # concurrent writers do not queue on them meanwhile.
+            self.assertFalse(YearStats.objects.filter(year=1985).exists())
+        self.assertTrue(YearStats.objects.filter(year=1985, song_count=1).exists())
+        self.assertStatsRebuilt()
+
+    def test_rollback_drops_the_changes(self):
+        performers, records, songs = seed()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Songs.objects.create(title='Rolled back', year=1999, performer=performers[0])
+            raise RuntimeError
+        Songs.objects.create(title='Kept', year=1998, performer=performers[0])
+        self.assertStatsRebuilt()
+
+    def test_year_range_is_recounted_only_when_its_boundary_moves(self):
+        performers, records, songs = seed()
+        performer = performers[0]
+        inner = Songs.objects.create(title='Inner', year=1971, performer=performer)
+        Songs.objects.create(title='Last', year=1990, performer=performer)
+        with CaptureQueriesContext(connection) as captured:
+            inner.year = 1972
+            inner.save()
+        self.assertFalse([item['sql'] for item in captured if 'MIN(' in item['sql']])
+        with CaptureQueriesContext(connection) as captured:
+            Songs.objects.filter(year=1990, performer=performer).get().delete()
+        self.assertTrue([item['sql'] for item in captured if 'MIN(' in item['sql']])
+        self.assertEqual(PerformerStats.objects.get(performer=performer).last_year,
+                         stats.performer_years(performer.id)['last_year'])
+        self.assertStatsRebuilt()
+
+
+class DedupeTests(GraphQLTestMixin, CommittingTestCase):
+    def setUp(self):
+        super().setUp()
+        self.performer = Performer.objects.create(name='The Band', genre='rock')
+
+    def groups(self, model, threshold=None):
+        rows = list(model.objects.filter(performer=self.performer).values_list('id', 'title'))
+        return dedupe.find_groups((self.performer.id, rows), threshold)
+
+    def test_normalize(self):
+        self.assertEqual(dedupe.normalize('Abbey Road (Remastered 2009)'), 'abbey road')
+        self.assertEqual(dedupe.normalize('Café  Blue - Deluxe Edition'), 'cafe blue')
+        self.assertEqual(dedupe.normalize('Live at Leeds (Live)'), 'live at leeds live')
+
+    def test_merge_records(self):
+        keep = Records.objects.create(title='Abbey Road', performer=self.performer)
+        duplicate = Records.objects.create(title='Abbey Road (Remastered)', year=1969, performer=self.performer)
+        other = Records.objects.create(title='Let It Be', year=1970, performer=self.performer)
+        shared = Songs.objects.create(title='Something', performer=self.performer)
+        shared.records.set([keep, duplicate])
+        moved = Songs.objects.create(title='Come Together', performer=self.performer)
+        moved.records.set([duplicate, other])
+        version = moved.version
+
+        groups = self.groups(Records)
+        self.assertEqual(groups, [(keep.id, [duplicate.id])])
+        self.assertEqual(bulk.merge_records(groups), 1)
+
+        self.assertFalse(Records.objects.filter(pk=duplicate.pk).exists())
+        keep.refresh_from_db()
+        self.assertEqual(keep.year, 1969)
+        self.assertEqual(list(shared.records.values_list('id', flat=True)), [keep.id])
+        self.assertEqual(sorted(moved.records.values_list('id', flat=True)), sorted([keep.id, other.id]))
+        moved.refresh_from_db()
+        self.assertGreater(moved.version, version)
+        self.assertStatsRebuilt()
+
+    def test_merge_songs(self):
+        first = Records.objects.create(title='First', performer=self.performer)
+        second = Records.objects.create(title='Second', performer=self.performer)
+        keep = Songs.objects.create(title='Yesterday', performer=self.performer)
+        keep.records.set([first])
+        duplicate = Songs.objects.create(title='yesterday  (Mono)', year=1965, performer=self.performer)
+        duplicate.records.set([first, second])
+
+        groups = self.groups(Songs)
+        self.assertEqual(groups, [(keep.id, [duplicate.id])])
+        self.assertEqual(bulk.merge_songs(groups), 1)
+
+        keep.refresh_from_db()
+        self.assertEqual(keep.year, 1965)
+        self.assertEqual(sorted(keep.records.values_list('id', flat=True)), sorted([first.id, second.id]))
+        self.assertEqual(Songs.objects.filter(performer=self.performer).count(), 1)
+        self.assertStatsRebuilt()
+
+    def test_similarity_keeps_numbered_titles_apart(self):
+        for title in ('Symphony No. 5', 'Symphony No. 6', 'Symphny No. 5'):
+            Records.objects.create(title=title, performer=self.performer)
+        groups = self.groups(Records, threshold=0.5)
+        self.assertEqual(len(groups), 1)
+        keep, duplicates = groups[0]
+        titles = set(Records.objects.filter(id__in=[keep] + duplicates).values_list('title', flat=True))
+        self.assertEqual(titles, {'Symphony No. 5', 'Symphny No. 5'})
+
+
+class CacheInvalidationTests(GraphQLTestMixin, CommittingTestCase):
+    """Кеш результатов и кеш объектов после мутаций; записи здесь фиксируются"""
+
+    QUERY = ('query($id: Int) { performer(id: $id) { name genre recordsSet { title } } '
+             'songs(first: 10) { edges { node { title records { title } } } } }')
+
+    def setUp(self):
+        super().setUp()
+        self.performers, self.records, self.songs = seed()
+
+    def test_second_query_is_a_cache_hit(self):
+        variables = {'id': self.performers[0].id}
+        first = self.post(self.QUERY, variables)
+        hits = cache.stats['hits']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.post(self.QUERY, variables), first)
+        self.assertEqual(cache.stats['hits'], hits + 1)
+
+    def test_replica_reads_are_cached(self):
+        # The primary stands in for a replica when none is configured, the
+        # way TEST MIRROR points one at the test database.
+        with mock.patch.object(routers, 'REPLICAS', routers.REPLICAS or [DEFAULT_DB_ALIAS]):
+            self.assertFalse(routers.reads_from_primary())
+            variables = {'id': self.performers[0].id}
+            first = self.post(self.QUERY, variables)
+            hits = cache.stats['hits']
+            self.assertEqual(self.post(self.QUERY, variables), first)
+            self.assertEqual(cache.stats['hits'], hits + 1)
+
+            song = self.songs[0]
+            entities.get(Songs, song.id)
+            stats = dict(entities.entity_cache.stats)
+            entities.get(Songs, song.id)
+            self.assertEqual(entities.entity_cache.stats['hits'], stats['hits'] + 1)
+            # A client that has just written reads from the primary and
+            # does not take rows a replica may have served from before it.
+            with routers.primary():
+                entities.get(Songs, song.id)
+            self.assertEqual(entities.entity_cache.stats['misses'], stats['misses'] + 1)
+
+    def test_mutations_invalidate(self):
+        performer, record, song = self.performers[0], self.records[0], self.songs[0]
+        variables = {'id': performer.id}
+        self.post(self.QUERY, variables)
+
+        self.post('mutation($id: Int!) { updatePerformer(id: $id, params: {name: "Renamed", genre: "pop"}) { ok } }',
+                  variables)
+        data = self.post(self.QUERY, variables)
+        self.assertEqual((data['performer']['name'], data['performer']['genre']), ('Renamed', 'pop'))
+
+        self.post('mutation($id: Int!, $performer: Int) { updateRecord(id: $id, params: '
+                  '{title: "Retitled", performer: $performer, year: 1970}) { ok } }',
+                  {'id': record.id, 'performer': record.performer_id})
+        data = self.post(self.QUERY, variables)
+        self.assertIn({'title': 'Retitled'}, data['performer']['recordsSet'])
+        song_records = {edge['node']['title']: edge['node']['records'] for edge in data['songs']['edges']}
+        self.assertEqual(song_records[song.title], [{'title': 'Retitled'}])
+
+        self.post('mutation($id: Int!, $performer: Int) { updateSong(id: $id, params: '
+                  '{title: "Song 00", performer: $performer, records: []}) { ok } }',
+                  {'id': song.id, 'performer': song.performer_id})
+        data = self.post(self.QUERY, variables)
+        song_records = {edge['node']['title']: edge['node']['records'] for edge in data['songs']['edges']}
+        self.assertEqual(song_records[song.title], [])
+
+    def test_entity_cache_follows_writes(self):
+        song = self.songs[0]
+        self.assertEqual(entities.get(Songs, song.id).title, song.title)
+        Songs.objects.filter(pk=song.pk).update(title='Behind the cache')
+        # A write outside the models' signals is not seen...
+        self.assertEqual(entities.get(Songs, song.id).title, song.title)
+        song.title = 'Saved'
+        song.save()
+        # ...one through them is, once it commits.
+        self.assertEqual(entities.get(Songs, song.id).title, 'Saved')
+        self.assertEqual(entities.related_ids(Songs, 'records', [song.id])[song.id], (self.records[0].id,))
+        song.records.add(self.records[1])
+        self.assertEqual(set(entities.related_ids(Songs, 'records', [song.id])[song.id]),
+                         {self.records[0].id, self.records[1].id})
+
+
+class ChangeFeedTests(GraphQLTestMixin, CommittingTestCase):
+    FEED = ('query($since: String, $first: Int) { changes(since: $since, first: $first) '
+            '{ edges { node { entity objectId action version } } pageInfo { endCursor hasNextPage } } }')
+
+    def pull(self, since=None, first=100):
+        reset_caches()
+        return self.post(self.FEED, {'since': since, 'first': first})['changes']
+
+    def entries(self, page):
+        return [(edge['node']['entity'], int(edge['node']['objectId']), edge['node']['action'].lower())
+                for edge in page['edges']]
+
+    def test_entries_follow_commit_order(self):
+        performer = Performer.objects.create(name='Performer', genre='rock')
+        with transaction.atomic():
+            song = Songs.objects.create(title='Song', performer=performer)
+            song.title = 'Song, edited'
+            song.save()
+        record = Records.objects.create(title='Record', performer=performer)
+        song.records.add(record)
+        song_id = song.id
+        song.delete()
+
+        self.assertEqual(self.entries(self.pull()), [
+            ('performer', performer.id, 'create'),
+            # Created and edited in one transaction: one entry, still a create.
+            ('song', song_id, 'create'),
+            ('record', record.id, 'create'),
+            ('song', song_id, 'update'),
+            ('song', song_id, 'delete'),
+        ])
+
+    def test_cursor_resumes_after_last_entry(self):
+        performer = Performer.objects.create(name='Performer', genre='rock')
+        first = self.pull()
+        self.assertEqual(len(first['edges']), 1)
+        Songs.objects.create(title='Song', performer=performer)
+        Records.objects.create(title='Record', performer=performer)
+        page = self.pull(first['pageInfo']['endCursor'], first=1)
+        self.assertEqual(self.entries(page), [('song', Songs.objects.get().id, 'create')])
+        self.assertTrue(page['pageInfo']['hasNextPage'])
+        page = self.pull(page['pageInfo']['endCursor'])
+        self.assertEqual(self.entries(page), [('record', Records.objects.get().id, 'create')])
+        self.assertEqual(self.pull(page['pageInfo']['endCursor'])['edges'], [])
+
+    def test_one_version_bump_per_transaction(self):
+        performer = Performer.objects.create(name='Performer', genre='rock')
+        first, second = (Records.objects.create(title=title, performer=performer) for title in ('First', 'Second'))
+        song = Songs.objects.create(title='Song', performer=performer)
+        song.records.add(first)
+        # Saving the song and replacing its records touches it three times.
+        self.post('mutation($id: Int!, $performer: Int, $record: ID) { updateSong(id: $id, params: '
+                  '{title: "Edited", performer: $performer, records: [{id: $record}]}) { ok } }',
+                  {'id': song.id, 'performer': performer.id, 'record': second.id})
+        song.refresh_from_db()
+        self.assertEqual(song.version, 3)
+        entry = ChangeLog.objects.filter(entity='song').last()
+        self.assertEqual((entry.action, entry.version), (ChangeLog.UPDATE, 3))
+
+    def test_entries_commit_with_the_data(self):
+        with transaction.atomic():
+            performer = Performer.objects.create(name='Performer', genre='rock')
+            self.assertEqual(ChangeLog.objects.get().object_id, performer.id)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Performer.objects.create(name='Other', genre='rock')
+            Performer.objects.create(name='Performer', genre='rock')
+        self.assertEqual(ChangeLog.objects.count(), 1)
+
+    def test_running_transactions_are_held_back(self):
+        # On PostgreSQL entries go in the order of their transactions, and
+        # only those below the oldest running one are served.
+        late = ChangeLog.objects.create(entity='song', object_id=1, action=ChangeLog.CREATE, version=1,
+                                        transaction_id=7)
+        early = ChangeLog.objects.create(entity='song', object_id=2, action=ChangeLog.CREATE, version=1,
+                                         transaction_id=5)
+        with mock.patch.object(changes, '_horizon', return_value=6):
+            self.assertEqual(self.entries(self.pull()), [('song', early.object_id, 'create')])
+        with mock.patch.object(changes, '_horizon', return_value=8):
+            page = self.pull()
+        self.assertEqual([entry[1] for entry in self.entries(page)], [early.object_id, late.object_id])
+
+
+class ExportTests(CommittingTestCase):
+    """Выгрузка каталога: полная и инкрементальная по журналу изменений"""
+
+    def export(self, kind, since=None, format='ndjson'):
+        params = {'format': format} if since is None else {'format': format, 'since': since}
+        response = Client().get(f'/export/{kind}/', params)
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return rows, response['X-Export-Cursor']
+
+    def test_full_export(self):
+        performers, records, songs = seed()
+        rows, _ = self.export('songs')
+        self.assertEqual([row['id'] for row in rows], [song.id for song in songs])
+        self.assertEqual(rows[0]['records'][0]['id'], records[0].id)
+        self.assertEqual(rows[0]['performer']['name'], performers[0].name)
+
+    def test_since_returns_changed_rows(self):
+        performers, records, songs = seed()
+        _, since = self.export('records')
+        # Older ids change and newer ones disappear: an id watermark would
+        # get both wrong.
+        records[0].title = 'Renamed'
+        records[0].save()
+        records[-1].delete()
+        record = Records.objects.create(title='New', performer=performers[0])
+
+        rows, cursor = self.export('records', since)
+        self.assertEqual([(row['id'], row['title']) for row in rows], [(records[0].id, 'Renamed'), (record.id, 'New')])
+        self.assertEqual(self.export('records', cursor)[0], [])
+        # The songs of the deleted record lost it.
+        rows, _ = self.export('songs', since)
+        self.assertEqual({row['id'] for row in rows}, {song.id for song in songs[3::4]})
+
+    def test_csv_and_invalid_cursor(self):
+        seed()
+        response = Client().get('/export/performers/', {'format': 'csv'})
+        self.assertEqual(b''.join(response.streaming_content).decode().splitlines()[0], 'id,name,genre')
+        for since in ('12', 'bm90IGpzb24=', encode_cursor(['a', 1]), encode_cursor([1, 2, 3])):
+            self.assertEqual(Client().get('/export/performers/', {'since': since}).status_code, 400)
+
+
+class RouterTests(CommittingTestCase):
+    """Выбор базы: чтение - с реплики, запись и чтение после записи - из основной"""
+
+    def setUp(self):
+        patcher = mock.patch.object(routers, 'REPLICAS', ['replica_1', 'replica_2'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = routers.ReplicaRouter()
+
+    def test_reads_go_to_a_replica(self):
+        self.assertIn(self.router.db_for_read(Songs), routers.REPLICAS)
+        self.assertEqual(self.router.db_for_write(Songs), DEFAULT_DB_ALIAS)
+
+    def test_primary_block(self):
+        with routers.primary():
+            self.assertEqual(self.router.db_for_read(Songs), DEFAULT_DB_ALIAS)
+        self.assertIn(self.router.db_for_read(Songs), routers.REPLICAS)
+
+    def test_reads_in_a_transaction_stay_on_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Songs), DEFAULT_DB_ALIAS)
+
+    def test_without_replicas_everything_is_primary(self):
+        with mock.patch.object(routers, 'REPLICAS', []):
+            self.assertEqual(self.router.db_for_read(Songs), DEFAULT_DB_ALIAS)
+
+    def middleware(self, view, cookies=None):
+        request = RequestFactory().get('/graphql/')
+        request.COOKIES.update(cookies or {})
+        return routers.ReadYourWritesMiddleware(view)(request)
+
+    def test_one_replica_per_request(self):
+        def view(request):
+            return HttpResponse(json.dumps([router.db_for_read(Songs) for _ in range(20)]))
+
+        for _ in range(5):
+            self.assertEqual(len(set(json.loads(self.middleware(view).content))), 1)
+
+    def test_read_your_writes(self):
+        def write(request):
+            router.db_for_write(Songs)
+            return HttpResponse(router.db_for_read(Songs))
+
+        response = self.middleware(write)
+        self.assertIn(routers.PRIMARY_COOKIE, response.cookies)
+        cookies = {routers.PRIMARY_COOKIE: response.cookies[routers.PRIMARY_COOKIE].value}
+
+        def read(request):
+            return HttpResponse(router.db_for_read(Songs))
+
+        self.assertEqual(self.middleware(read, cookies).content.decode(), DEFAULT_DB_ALIAS)
+        self.assertNotIn(routers.PRIMARY_COOKIE, self.middleware(read, cookies).cookies)
+        self.assertIn(self.middleware(read).content.decode(), routers.REPLICAS)
+        expired = {routers.PRIMARY_COOKIE: '0'}
+        self.assertIn(self.middleware(read, expired).content.decode(), routers.REPLICAS)
+
+    def test_trace_counts_every_database(self):
+        with tracing.trace_request() as trace:
+            for alias in settings.DATABASES:
+                Songs.objects.using(alias).exists()
+        self.assertEqual(trace.sql_count, len(settings.DATABASES))
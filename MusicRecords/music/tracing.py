@@ -0,0 +1,149 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from graphql.type.definition import GraphQLObjectType, get_named_type
+from promise import Promise, is_thenable
+
+from music import metrics
+
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'MUSIC_N_PLUS_ONE_THRESHOLD', 10)
+
+current_trace = ContextVar('music_trace', default=None)
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def sql_shape(sql):
+    """SQL без различий в длине списков IN (...)"""
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class RequestTrace:
+    """Время резолверов и SQL-запросы одного GraphQL-запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.resolvers = {}
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.shapes = Counter()
+        self._lock = threading.Lock()
+
+    def add_resolver(self, name, elapsed):
+        with self._lock:
+            count, total = self.resolvers.get(name, (0, 0.0))
+            self.resolvers[name] = (count + 1, total + elapsed)
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.sql_count += 1
+                self.sql_seconds += elapsed
+                self.shapes[sql_shape(sql)] += 1
+
+    def repeated_shapes(self):
+        return {shape: count for shape, count in self.shapes.items() if count > N_PLUS_ONE_THRESHOLD}
+
+    def finish(self, operation_type):
+        metrics.requests.inc(operation_type=operation_type or 'unknown')
+        metrics.request_seconds.observe(time.perf_counter() - self.started)
+        metrics.sql_queries.observe(self.sql_count)
+        metrics.sql_seconds.observe(self.sql_seconds)
+        for name, (count, total) in self.resolvers.items():
+            metrics.resolve_seconds.observe(total / count, field=name)
+        if self.repeated_shapes():
+            metrics.n_plus_one.inc()
+
+    def as_dict(self):
+        return {
+            'duration': time.perf_counter() - self.started,
+            'sql': {
+                'count': self.sql_count,
+                'duration': self.sql_seconds,
+                'repeated': [{'sql': shape, 'count': count} for shape, count in self.repeated_shapes().items()],
+            },
+            'resolvers': [
+                {'field': name, 'count': count, 'duration': total}
+                for name, (count, total) in sorted(self.resolvers.items())
+            ],
+        }
+
+
+@contextmanager
+def _wrap_connections(trace):
+    # Reads go to the replicas and writes to the primary, so every alias of
+    # the thread is hooked.
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(trace))
+        yield
+
+
+@contextmanager
+def trace_request():
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    try:
+        with _wrap_connections(trace):
+            yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def trace_thread():
+    """Подключает текущую трассировку к соединениям рабочего потока"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    with _wrap_connections(trace):
+        yield
+
+
+class TracingMiddleware:
+    """Graphene middleware: время корневых полей и полей-связей
+
+    Скалярные поля не измеряются - это чтение атрибутов, а замер каждого
+    из них стоил бы больше самого чтения.
+    """
+
+    def resolve(self, next, root, info, **args):
+        trace = current_trace.get()
+        root_types = (info.schema.get_query_type(), info.schema.get_mutation_type())
+        if trace is None or (info.parent_type not in root_types
+                             and not isinstance(get_named_type(info.return_type), GraphQLObjectType)):
+            return next(root, info, **args)
+        name = f'{info.parent_type.name}.{info.field_name}'
+        started = time.perf_counter()
+
+        def finish(value=None):
+            trace.add_resolver(name, time.perf_counter() - started)
+            return value
+
+        def fail(error):
+            finish()
+            raise error
+
+        try:
+            result = next(root, info, **args)
+        except Exception:
+            finish()
+            raise
+        # A field behind a DataLoader returns a pending promise; its time is
+        # the batch load, so it is taken once the promise settles.
+        if is_thenable(result) and not (isinstance(result, Promise) and not result.is_pending):
+            return Promise.resolve(result).then(finish, fail)
+        finish()
+        return result
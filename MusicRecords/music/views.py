@@ -1,3 +1,263 @@
-from django.shortcuts import render
+import asyncio
+import json
+from contextlib import nullcontext
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import (Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+                         HttpResponseNotAllowed, StreamingHttpResponse)
+from django.views.decorators.http import require_GET
+from graphene_django.views import GraphQLView, HttpError
+from graphql.execution import ExecutionResult
+from graphql.execution.executors.asyncio import AsyncioExecutor
+from promise import Promise
+
+from music import bulk, cache, export, introspection, metrics, persisted, routers, tracing
+from music.async_execution import AsyncRootFieldMiddleware
+from music.backend import document_backend
+
+CACHEABLE_FLAG = 'graphql_cacheable'
+TRACE_ATTRIBUTE = 'music_trace'
+# Per-request timings in the response "extensions"; such responses describe
+# one execution, so the result cache is bypassed while this is on.
+TRACING_EXTENSIONS = getattr(settings, 'MUSIC_TRACING_EXTENSIONS', False)
+METRICS_ALLOWED_ADDRESSES = getattr(settings, 'MUSIC_METRICS_ALLOWED_ADDRESSES', ('127.0.0.1', '::1'))
+
+
+def result_timeout():
+    # A response read from a lagging replica may predate the generations in
+    # its key, so it is kept only briefly.
+    return routers.cache_timeout(cache.get_cache().default_timeout)
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus, только для локальных адресов"""
+    if request.META.get('REMOTE_ADDR') not in METRICS_ALLOWED_ADDRESSES:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def export_view(request, kind):
+    """Потоковая выгрузка каталога: ?format=ndjson|csv&since=<курсор>
+
+    Строки читаются курсором и пишутся по мере готовности, так что память
+    не зависит от размера каталога. Заголовок X-Export-Cursor - since для
+    следующей выгрузки: она отдаст только изменённые с тех пор объекты.
+    Отдавать из WSGI-воркера: под ASGI Django 4.1 читает синхронный поток
+    прямо в цикле событий.
+    """
+    if kind not in export.EXPORTS:
+        raise Http404
+    format = request.GET.get('format', 'ndjson')
+    if format not in export.FORMATS:
+        return HttpResponseBadRequest(f'Неизвестный формат {format}')
+    since = request.GET.get('since')
+    if since is not None and export.parse_cursor(since) is None:
+        return HttpResponseBadRequest(f'Некорректный since {since}')
+    cursor = export.cursor()
+    lines = export.lines(kind, format, since=since)
+    # One write per batch of rows rather than per row.
+    response = StreamingHttpResponse((''.join(part) for part in bulk.chunked(lines, 500)),
+                                     content_type=export.FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{format}"'
+    response['X-Export-Cursor'] = cursor
+    return response
+
+
+class CachedGraphQLView(GraphQLView):
+    """GraphQLView с кешем результатов query-операций и persisted queries"""
+
+    def __init__(self, backend=None, **kwargs):
+        super().__init__(backend=backend or document_backend, **kwargs)
+
+    def get_graphql_params(self, request, data):
+        query, variables, operation_name, id = super().get_graphql_params(request, data)
+        extensions = request.GET.get('extensions') or data.get('extensions') or {}
+        if isinstance(extensions, str):
+            try:
+                extensions = json.loads(extensions)
+            except ValueError:
+                raise HttpError(HttpResponseBadRequest('Extensions are invalid JSON.'))
+        persisted_query = extensions.get('persistedQuery') if isinstance(extensions, dict) else None
+        if not persisted_query:
+            return query, variables, operation_name, id
+
+        # Automatic persisted queries: the client sends only the sha256 of a
+        # document and falls back to sending the text once it is unknown.
+        sha256_hash = persisted_query.get('sha256Hash')
+        if query:
+            if persisted.query_hash(query) != sha256_hash:
+                raise HttpError(HttpResponseBadRequest('provided sha does not match query'))
+            persisted.register(query)
+        else:
+            query = persisted.lookup(sha256_hash)
+            if query is None:
+                raise HttpError(HttpResponse(status=200), 'PersistedQueryNotFound')
+        return query, variables, operation_name, id
+
+    def get_response(self, request, data, show_graphiql=False):
+        key = None
+        if not show_graphiql and not request.GET.get('pretty') and not TRACING_EXTENSIONS:
+            key = self.get_cache_key(request, data)
+        # A client that has just written must see its write, so it skips the
+        # cached response.
+        if key is not None and not routers.is_pinned():
+            cached = cache.get_result(key)
+            if cached is not None:
+                return cached
+
+        with tracing.trace_request() as trace:
+            setattr(request, TRACE_ATTRIBUTE, trace)
+            response = super().get_response(request, data, show_graphiql)
+        trace.finish(getattr(trace, 'operation_type', None))
+        if key is not None and getattr(request, CACHEABLE_FLAG, False):
+            cache.set_result(key, response, result_timeout())
+        return response
+
+    def get_cache_key(self, request, data):
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        # The introspection file answers faster than the result cache.
+        if not query or introspection.lookup(query, operation_name) is not None:
+            return None
+        try:
+            document = self.get_backend(request).document_from_string(self.schema, query)
+        except Exception:
+            return None
+        return cache.make_key(self.schema, document, variables, operation_name)
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        # Schema downloads by clients and GraphiQL are answered from the file
+        # written by build_schema_cache, without validating or executing.
+        cached = None if show_graphiql else introspection.lookup(query, operation_name)
+        operation_type = 'query' if cached is not None else self.get_operation_type(request, query, operation_name)
+        trace = getattr(request, TRACE_ATTRIBUTE, None)
+        if trace is not None:
+            trace.operation_type = operation_type
+        if cached is not None:
+            return ExecutionResult(data=cached)
+        # A mutation reads its checks and its result from the primary.
+        with routers.primary() if operation_type == 'mutation' else nullcontext():
+            result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        setattr(request, CACHEABLE_FLAG, bool(result) and not result.errors and not result.invalid)
+        return result
+
+    def get_operation_type(self, request, query, operation_name):
+        if not query:
+            return None
+        try:
+            # The backend keeps parsed documents, so this is a cache lookup.
+            document = self.get_backend(request).document_from_string(self.schema, query)
+            return document.get_operation_type(operation_name)
+        except Exception:
+            # Reported by the execution itself.
+            return None
+
+    def json_encode(self, request, d, pretty=False):
+        trace = getattr(request, TRACE_ATTRIBUTE, None)
+        if TRACING_EXTENSIONS and trace is not None and isinstance(d, dict):
+            d = dict(d, extensions={'tracing': trace.as_dict()})
+        return super().json_encode(request, d, pretty)
+
+
+class AsyncGraphQLView(CachedGraphQLView):
+    """Асинхронный GraphQL-эндпоинт для ASGI
+
+    Корневые поля выполняются параллельно в пуле потоков, DataLoader'ы ходят
+    в базу вне цикла событий. GraphiQL и batch-запросы не поддерживаются.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await self.dispatch(request, *args, **kwargs)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ('get', 'post'):
+                raise HttpError(
+                    HttpResponseNotAllowed(['GET', 'POST'], 'GraphQL only supports GET and POST requests.')
+                )
+            data = self.parse_body(request)
+            result, status_code = await self.get_async_response(request, data)
+            return HttpResponse(status=status_code, content=result, content_type='application/json')
+        except HttpError as e:
+            response = e.response
+            response['Content-Type'] = 'application/json'
+            response.content = self.json_encode(request, {'errors': [self.format_error(e)]})
+            return response
+
+    async def get_async_response(self, request, data):
+        key = None
+        if not request.GET.get('pretty') and not TRACING_EXTENSIONS:
+            key = await sync_to_async(self.get_cache_key)(request, data)
+        if key is not None and not routers.is_pinned():
+            cached = await sync_to_async(cache.get_result)(key)
+            if cached is not None:
+                return cached
+
+        query, variables, operation_name, id = await sync_to_async(self.get_graphql_params)(request, data)
+        # Resolvers run in worker threads that pick the trace up from the
+        # context and hook it into their own connections.
+        trace = tracing.RequestTrace()
+        setattr(request, TRACE_ATTRIBUTE, trace)
+        token = tracing.current_trace.set(trace)
+        try:
+            execution_result = await self.execute_async(request, query, variables, operation_name)
+        finally:
+            tracing.current_trace.reset(token)
+        trace.finish(getattr(trace, 'operation_type', None))
+
+        response = {}
+        if execution_result.errors:
+            response['errors'] = [self.format_error(e) for e in execution_result.errors]
+        status_code = 400 if execution_result.invalid else 200
+        if not execution_result.invalid:
+            response['data'] = execution_result.data
+        result = (self.json_encode(request, response), status_code)
+
+        if key is not None and not execution_result.errors and not execution_result.invalid:
+            await sync_to_async(cache.set_result)(key, result, result_timeout())
+        return result
+
+    async def execute_async(self, request, query, variables, operation_name):
+        if not query:
+            raise HttpError(HttpResponseBadRequest('Must provide query string.'))
+        cached = introspection.lookup(query, operation_name)
+        if cached is not None:
+            getattr(request, TRACE_ATTRIBUTE).operation_type = 'query'
+            return ExecutionResult(data=cached)
+        try:
+            # Validation may read table statistics, so it stays off the loop.
+            document = await sync_to_async(self.get_backend(request).document_from_string)(self.schema, query)
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)
+
+        operation_type = document.get_operation_type(operation_name)
+        getattr(request, TRACE_ATTRIBUTE).operation_type = operation_type
+        if request.method.lower() == 'get' and operation_type and operation_type != 'query':
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ['POST'], f'Can only perform a {operation_type} operation from a POST request.'
+                )
+            )
+
+        middleware = list(self.get_middleware(request) or []) + [AsyncRootFieldMiddleware()]
+        try:
+            # Worker threads started from here inherit the primary pin.
+            with routers.primary() if operation_type == 'mutation' else nullcontext():
+                result = document.execute(
+                    root_value=self.get_root_value(request),
+                    variable_values=variables,
+                    operation_name=operation_name,
+                    context_value=self.get_context(request),
+                    middleware=middleware,
+                    executor=AsyncioExecutor(loop=asyncio.get_running_loop()),
+                    return_promise=True,
+                )
+                if isinstance(result, Promise):
+                    result = await result
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e], invalid=True)